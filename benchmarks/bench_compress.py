@@ -0,0 +1,122 @@
+"""Сравнение многопроцессного сжатия архива мира с конвейером backup.sh (tar | gzip -8).
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_compress --size 512 --workers 4
+"""
+import os
+import sys
+import time
+import struct
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from pathlib import Path
+
+from server_menu.backup import ArchiveBackupJob
+from server_menu.utils import format_size
+from server_menu.compress import CODECS, DEFAULT_WORKERS
+
+SECTOR_SIZE = 4096
+TAR_LIST_FLAGS = {"gzip": "-tzf", "bz2": "-tjf", "xz": "-tJf"}
+
+
+def make_region(path, rng, chunks=1024):
+    """Region-файл в формате Anvil: чанки мира хранятся уже сжатыми, поэтому в основном это шум"""
+    locations, timestamps, body, sector = [], [], bytearray(), 2
+    for _ in range(chunks):
+        size = rng.randint(1500, 12000)
+        payload = rng.randbytes(size * 3 // 4) + b"minecraft:stone\x00" * (size // 64)
+        data = struct.pack(">iB", len(payload) + 1, 2) + payload
+        count = (len(data) + SECTOR_SIZE - 1) // SECTOR_SIZE
+        locations.append(sector << 8 | count)
+        timestamps.append(rng.randint(1_600_000_000, 1_700_000_000))
+        body += data.ljust(count * SECTOR_SIZE, b"\x00")
+        sector += count
+    with open(path, "wb") as f:
+        f.write(struct.pack(">1024I", *locations) + struct.pack(">1024I", *timestamps) + body)
+    return os.path.getsize(path)
+
+
+def make_world(world_dir, size_mb, seed=42):
+    """Синтетический мир: region-файлы трёх измерений, статистика игроков и level.dat"""
+    rng = random.Random(seed)
+    total, index = 0, 0
+    dimensions = ["region", "DIM-1/region", "DIM1/region"]
+    for dimension in dimensions:
+        (world_dir / dimension).mkdir(parents=True, exist_ok=True)
+    while total < size_mb * 1024 * 1024:
+        dimension = dimensions[index % len(dimensions)]
+        total += make_region(world_dir / dimension / f"r.{index}.0.mca", rng)
+        index += 1
+    (world_dir / "stats").mkdir(exist_ok=True)
+    for player in range(20):
+        stats = ",".join(f'"minecraft:block_{i}":{rng.randint(0, 99999)}' for i in range(2000))
+        (world_dir / "stats" / f"player-{player}.json").write_text("{" + stats + "}")
+    (world_dir / "level.dat").write_bytes(rng.randbytes(4096))
+    return sum(p.stat().st_size for p in world_dir.rglob("*") if p.is_file())
+
+
+def run_shell_pipeline(world_dir, out_path):
+    """Текущий конвейер backup.sh без pv"""
+    started = time.perf_counter()
+    subprocess.run(f'tar -cf - -C "{world_dir}" . | gzip -8 > "{out_path}"', shell=True, check=True)
+    return time.perf_counter() - started
+
+
+async def run_job(job):
+    job.start()
+    await job.wait()
+    if job.status != job.DONE:
+        raise RuntimeError(f"Копирование не удалось: {job.status} {job.error}")
+
+
+def run_parallel(world_dir, backup_dir, codec, level, workers):
+    job = ArchiveBackupJob(world_dir, backup_dir, keep=100, codec=codec, level=level, workers=workers)
+    started = time.perf_counter()
+    asyncio.run(run_job(job))
+    return time.perf_counter() - started, job.path
+
+
+def verify(codec, path):
+    """Архив должен читаться обычным tar"""
+    result = subprocess.run(["tar", TAR_LIST_FLAGS[codec], path], capture_output=True)
+    return result.returncode == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=256, help="Размер синтетического мира, МБ")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Процессов сжатия")
+    parser.add_argument("--codecs", default="gzip,bz2,xz", help="Кодеки через запятую")
+    parser.add_argument("--level", type=int, default=None, help="Уровень сжатия (по умолчанию свой у кодека)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench_compress_") as tmp:
+        tmp = Path(tmp)
+        world_dir, backup_dir = tmp / "world", tmp / "backup"
+        backup_dir.mkdir()
+        print(f"Создание синтетического мира ~{args.size} МБ...")
+        world_size = make_world(world_dir, args.size)
+        print(f"Мир: {format_size(world_size)}, процессов сжатия: {args.workers}, ядер: {os.cpu_count()}\n")
+
+        rows = []
+        baseline = backup_dir / "baseline.tar.gz"
+        elapsed = run_shell_pipeline(world_dir, baseline)
+        rows.append(("tar | gzip -8", elapsed, baseline.stat().st_size, verify("gzip", baseline)))
+        for codec in args.codecs.split(","):
+            if codec not in CODECS:
+                print(f"Пропущен неизвестный кодек {codec}", file=sys.stderr)
+                continue
+            elapsed, path = run_parallel(world_dir, backup_dir, codec, args.level, args.workers)
+            rows.append((f"parallel {codec}", elapsed, path.stat().st_size, verify(codec, path)))
+
+        print(f"{'Способ':<16}{'Время, с':>10}{'МБ/с':>10}{'Архив':>12}{'Сжатие':>9}{'tar -t':>8}")
+        for title, elapsed, size, ok in rows:
+            print(f"{title:<16}{elapsed:>10.2f}{world_size / elapsed / 1024 / 1024:>10.1f}"
+                  f"{format_size(size):>12}{size / world_size:>9.1%}{'ok' if ok else 'FAIL':>8}")
+
+
+if __name__ == "__main__":
+    main()
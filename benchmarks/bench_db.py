@@ -0,0 +1,90 @@
+"""Задержка запросов Database: новое соединение на каждый вызов против долгоживущего соединения с WAL.
+
+Запуск из корня репозитория (рабочая users.db не используется):
+    python -m benchmarks.bench_db --users 2000 --calls 5000
+"""
+import os
+import time
+import sqlite3
+import argparse
+import tempfile
+from pathlib import Path
+
+# Config читает .env при импорте - для замера достаточно заглушек путей
+os.environ.setdefault("SERVER_DIR", tempfile.gettempdir())
+os.environ.setdefault("SCRIPTS_DIR", tempfile.gettempdir())
+os.environ.setdefault("ADMIN_IDS", "0")
+
+from mineservtelebot import Config, ConnectionManager, Database  # noqa: E402
+
+COLUMNS = ['tg_id', 'tg_username', 'ingame_nick', 'ip', 'approved']
+
+
+class PerCallDatabase:
+    """Прежняя схема: sqlite3.connect на каждый вызов"""
+
+    @staticmethod
+    def get_user(tg_id):
+        with sqlite3.connect(Config.DB_PATH) as con:
+            row = con.execute("SELECT tg_id, tg_username, ingame_nick, ip, approved FROM users WHERE tg_id=?",
+                              (tg_id,)).fetchone()
+            return dict(zip(COLUMNS, row)) if row else None
+
+    @staticmethod
+    def user_exists(tg_id):
+        with sqlite3.connect(Config.DB_PATH) as con:
+            return con.execute("SELECT 1 FROM users WHERE tg_id=?", (tg_id,)).fetchone() is not None
+
+    @staticmethod
+    def update_user(tg_id, **fields):
+        set_clause = ", ".join(f"{k}=?" for k in fields)
+        with sqlite3.connect(Config.DB_PATH) as con:
+            con.execute(f"UPDATE users SET {set_clause} WHERE tg_id=?", list(fields.values()) + [tg_id])
+
+    @staticmethod
+    def list_users(approved=None):
+        with sqlite3.connect(Config.DB_PATH) as con:
+            return con.execute("SELECT tg_id, tg_username, ingame_nick, ip, approved FROM users WHERE approved=? "
+                               "ORDER BY tg_username", (1 if approved else 0,)).fetchall()
+
+
+def measure(func, calls):
+    """Средняя задержка вызова, мкс"""
+    started = time.perf_counter()
+    for i in range(calls):
+        func(i)
+    return (time.perf_counter() - started) / calls * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=2000, help="Пользователей в тестовой базе")
+    parser.add_argument("--calls", type=int, default=5000, help="Вызовов на каждый замер")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="bench_db_") as tmp:
+        Config.DB_PATH = str(Path(tmp) / "users.db")
+        Database.connections = ConnectionManager(Config.DB_PATH)
+        Database.init()
+        with Database.connection() as con:
+            con.executemany("INSERT INTO users (tg_id, tg_username, ingame_nick, ip, approved) VALUES (?, ?, ?, ?, ?)",
+                            [(i, f"user{i:05d}", f"nick{i:05d}", f"10.0.{i // 256 % 256}.{i % 256}", i % 2)
+                             for i in range(args.users)])
+        n = args.users
+        cases = [
+            ("get_user", lambda db: lambda i: db.get_user(i % n), args.calls),
+            ("user_exists", lambda db: lambda i: db.user_exists(i % n), args.calls),
+            ("update_user", lambda db: lambda i: db.update_user(i % n, ip=f"10.1.0.{i % 256}"), args.calls // 5),
+            ("list_users", lambda db: lambda i: db.list_users(approved=True), max(1, args.calls // 50)),
+        ]
+        print(f"Пользователей: {args.users}\n")
+        print(f"{'Запрос':<14}{'connect на вызов, мкс':>24}{'постоянное соединение, мкс':>30}{'ускорение':>12}")
+        for title, make, calls in cases:
+            before = measure(make(PerCallDatabase), calls)
+            after = measure(make(Database), calls)
+            print(f"{title:<14}{before:>24.1f}{after:>30.1f}{before / after:>11.1f}x")
+        Database.connections.close_all()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Время запуска бота: импорт mineservtelebot и создание MinecraftBot в отдельных процессах.
+
+Каждый замер - новый процесс интерпретатора (как перезапуск бота после обновления). Кроме времени
+показывается, сколько раз создан каждый компонент и во что обошлись бы модули, импорт которых отложен
+до первого использования.
+
+Запуск из корня репозитория (рабочие users.db и temp/bot.pid не используются, сеть не нужна):
+    python -m benchmarks.bench_startup --runs 5
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+from pathlib import Path
+from collections import Counter
+
+# Модули, которые не нужны до первого использования соответствующей функции
+DEFERRED = ("psutil", "server_menu.backup")
+
+
+def child(tmp):
+    """Один запуск: замеры в текущем процессе, результат - JSON в stdout"""
+    started = time.perf_counter()
+    import mineservtelebot as m
+    imported = time.perf_counter()
+
+    m.TEMP_DIR = Path(tmp)
+    m.Config.DB_PATH = str(Path(tmp) / "users.db")
+    m.Database.connections = m.ConnectionManager(m.Config.DB_PATH)
+    counts = Counter()
+    for cls in (m.ServerService, m.MinecraftServer, m.Service, m.Server, m.Admin, m.Registration, m.User):
+        def init(self, *args, _original=cls.__init__, _name=f"{cls.__module__}.{cls.__qualname__}", **kwargs):
+            counts[_name] += 1
+            _original(self, *args, **kwargs)
+        cls.__init__ = init
+    original_db_init = m.Database.init
+
+    def db_init():
+        counts["Database.init"] += 1
+        original_db_init()
+    m.Database.init = db_init
+
+    before_build = time.perf_counter()
+    m.MinecraftBot()
+    built = time.perf_counter()
+
+    loaded = [name for name in DEFERRED if name in sys.modules]
+    deferred_started = time.perf_counter()
+    for name in DEFERRED:
+        __import__(name)
+    deferred = time.perf_counter() - deferred_started
+    m.Database.connections.close_all()
+    print(json.dumps({
+        "import": imported - started,
+        "build": built - before_build,
+        "deferred": deferred,
+        "loaded": loaded,
+        "counts": counts,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="Запусков (каждый - новый процесс)")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child(args.child)
+        return
+
+    root = Path(__file__).resolve().parent.parent
+    results = []
+    with tempfile.TemporaryDirectory(prefix="bench_startup_") as tmp:
+        env = dict(os.environ, SERVER_DIR=tmp, SCRIPTS_DIR=tmp, SCREEN_NAME="bench", ADMIN_IDS="0",
+                   BOT_TOKEN="0:bench", FIREWALL_BACKEND="ufw", RCON_PASSWORD="")
+        for run in range(args.runs):
+            for name in ("users.db", "users.db-wal", "users.db-shm"):
+                Path(tmp, name).unlink(missing_ok=True)
+            output = subprocess.run([sys.executable, "-m", "benchmarks.bench_startup", "--child", tmp], cwd=root,
+                                    env=env, capture_output=True, text=True, check=True).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+
+    def median_ms(key):
+        return statistics.median(result[key] for result in results) * 1000
+
+    total = median_ms("import") + median_ms("build")
+    print(f"Запусков: {args.runs} (медиана)\n")
+    print(f"{'Импорт mineservtelebot':<40}{median_ms('import'):>10.1f} мс")
+    print(f"{'Создание MinecraftBot':<40}{median_ms('build'):>10.1f} мс")
+    print(f"{'Итого до запуска polling':<40}{total:>10.1f} мс")
+    print(f"{'Отложено до первого использования':<40}{median_ms('deferred'):>10.1f} мс ({', '.join(DEFERRED)})")
+    loaded = sorted({name for result in results for name in result["loaded"]})
+    if loaded:
+        print(f"Загружены при запуске, хотя отложены: {', '.join(loaded)}")
+    print("\nСоздано экземпляров за запуск:")
+    for name, count in sorted(results[-1]["counts"].items()):
+        print(f"  {name:<44}{count:>3}")
+
+
+if __name__ == "__main__":
+    main()
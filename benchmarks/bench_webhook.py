@@ -0,0 +1,201 @@
+"""Задержка от появления обновления до вызова обработчика: long polling против webhook.
+
+Вместо api.telegram.org поднимается локальный заменитель Bot API: в режиме polling он отдаёт обновления
+на удерживаемые запросы getUpdates, в режиме webhook сам отправляет их POST-запросом на локальный порт
+бота с заголовком секрета (как Telegram через обратный прокси). --latency - задержка сети в одну сторону:
+добавляется к каждому запросу к заменителю, к его ответу и к каждому POST.
+
+Параметры webhook берутся из MinecraftBot.webhook_options (BOT_MODE и WEBHOOK_* из окружения
+не нужны). Для режима webhook нужен python-telegram-bot[webhooks].
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_webhook --updates 200 --latency 40
+"""
+import os
+import json
+import time
+import random
+import socket
+import logging
+import asyncio
+import argparse
+import statistics
+import tempfile
+from urllib.parse import parse_qs
+
+import httpx
+
+# Config читает .env при импорте - для замера достаточно заглушек путей
+os.environ.setdefault("SERVER_DIR", tempfile.gettempdir())
+os.environ.setdefault("SCRIPTS_DIR", tempfile.gettempdir())
+os.environ.setdefault("ADMIN_IDS", "0")
+
+from telegram import Update  # noqa: E402
+from telegram.ext import ApplicationBuilder, TypeHandler  # noqa: E402
+from mineservtelebot import Config, MinecraftBot  # noqa: E402
+
+logging.getLogger("httpx").setLevel(logging.WARNING)  # Без строки лога на каждый запрос getUpdates
+
+TOKEN = "123456:bench"
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class FakeBotApi:
+    """Минимальный HTTP/1.1 сервер с методами Bot API, которые вызывает PTB при запуске и приёме обновлений"""
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = []  # Имена вызванных методов
+        self.webhook = None  # Параметры последнего setWebhook
+        self.queue = []  # Обновления для getUpdates
+        self._arrived = asyncio.Event()
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    def push(self, update):
+        self.queue.append(update)
+        self._arrived.set()
+
+    async def _serve(self, reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                lines = head.decode("latin-1").split("\r\n")
+                headers = dict(line.split(": ", 1) for line in lines[1:] if ": " in line)
+                length = int(next((v for k, v in headers.items() if k.lower() == "content-length"), 0))
+                body = await reader.readexactly(length) if length else b""
+                method = lines[0].split()[1].rstrip("/").rsplit("/", 1)[-1]
+                params = {key: values[0] for key, values in parse_qs(body.decode()).items()}
+                await asyncio.sleep(self.latency)  # Запрос идёт до Telegram
+                result = await self._call(method, params)
+                await asyncio.sleep(self.latency)
+                payload = json.dumps({"ok": True, "result": result}).encode()
+                writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n"
+                             b"Content-Length: %d\r\n\r\n%s" % (len(payload), payload))
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _call(self, method, params):
+        self.calls.append(method)
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "bench", "username": "bench_bot"}
+        if method == "setWebhook":
+            self.webhook = params
+        if method == "getUpdates":
+            offset = int(params.get("offset", 0))
+            self.queue = [update for update in self.queue if update["update_id"] >= offset]
+            if not self.queue:
+                self._arrived.clear()
+                try:
+                    await asyncio.wait_for(self._arrived.wait(), float(params.get("timeout", 0)))
+                except asyncio.TimeoutError:
+                    pass
+            return [update for update in self.queue if update["update_id"] >= offset]
+        return True
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def make_update(update_id):
+    return {"update_id": update_id, "message": {
+        "message_id": update_id, "date": int(time.time()), "text": "ping",
+        "chat": {"id": 1, "type": "private"}, "from": {"id": 1, "is_bot": False, "first_name": "bench"}}}
+
+
+async def measure(mode, api, api_port, updates, latency):
+    """Задержки доставки (сек) и число запросов к Bot API за время замера"""
+    received = {}
+    done = asyncio.Event()
+
+    async def handler(update, context):
+        received[update.update_id] = time.perf_counter()
+        done.set()
+
+    application = ApplicationBuilder().token(TOKEN).base_url(f"http://127.0.0.1:{api_port}/bot").build()
+    application.add_handler(TypeHandler(Update, handler))
+    await application.initialize()
+    client = httpx.AsyncClient()
+    if mode == "polling":
+        await application.updater.start_polling(poll_interval=0, timeout=10)
+    else:
+        Config.WEBHOOK_URL, Config.WEBHOOK_LISTEN = "https://bench.invalid", "127.0.0.1"
+        Config.WEBHOOK_PORT = free_port()
+        options = MinecraftBot.webhook_options()
+        await application.updater.start_webhook(**options)
+        url = f"http://127.0.0.1:{options['port']}/{options['url_path']}"
+        rejected = await client.post(url, json=make_update(0), headers={SECRET_HEADER: "wrong"})
+        print(f"  Запрос с неверным секретом: HTTP {rejected.status_code}")
+    await application.start()
+
+    calls_before = len(api.calls)
+    sent = {}
+    for update_id in range(1, updates + 1):
+        # Обновления приходят в случайный момент относительно цикла getUpdates
+        await asyncio.sleep(random.uniform(0, 2 * latency))
+        done.clear()
+        update = make_update(update_id)
+        sent[update_id] = time.perf_counter()
+        if mode == "polling":
+            api.push(update)  # Ответ на ожидающий getUpdates идёт до бота с задержкой сети
+        else:
+            await asyncio.sleep(latency)
+            await client.post(url, json=update, headers={SECRET_HEADER: options["secret_token"]})
+        await asyncio.wait_for(done.wait(), 30)
+    requests = len(api.calls) - calls_before
+
+    await client.aclose()
+    await application.updater.stop()
+    await application.stop()
+    await application.shutdown()
+    return [received[i] - sent[i] for i in sent], requests
+
+
+async def run(args):
+    api = FakeBotApi(args.latency / 1000)
+    api_port = await api.start()
+    results = {}
+    # Последний запуск - обратное переключение на polling после webhook
+    for mode in ("polling", "webhook", "polling"):
+        calls_before = len(api.calls)
+        print(f"Режим {mode}:")
+        delays, requests = await measure(mode, api, api_port, args.updates, args.latency / 1000)
+        startup = api.calls[calls_before:calls_before + 3]
+        print(f"  Запуск: {', '.join(startup)}")
+        if mode == "webhook":
+            print(f"  setWebhook: url={api.webhook.get('url')}, секрет передан: {'secret_token' in api.webhook}")
+        results.setdefault(mode, (delays, requests))
+    await api.close()
+
+    print(f"\nОбновлений: {args.updates}, задержка сети в одну сторону: {args.latency} мс\n")
+    print(f"{'Режим':<10}{'медиана, мс':>14}{'p95, мс':>12}{'макс, мс':>12}{'запросов к API':>18}")
+    for mode, (delays, requests) in results.items():
+        delays = sorted(delays)
+        p95 = delays[int(len(delays) * 0.95) - 1]
+        print(f"{mode:<10}{statistics.median(delays) * 1000:>14.1f}{p95 * 1000:>12.1f}{delays[-1] * 1000:>12.1f}"
+              f"{requests:>18}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--updates", type=int, default=200, help="Обновлений в каждом режиме")
+    parser.add_argument("--latency", type=float, default=40, help="Задержка сети в одну сторону, мс")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,32 @@
 import os
 import re
+import time
+import secrets
 import sqlite3
 import logging
+import asyncio
+import threading
+from functools import partial
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 import ipaddress
 from pathlib import Path
 from dotenv import load_dotenv
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup, ReplyKeyboardMarkup
-from telegram.ext import ApplicationBuilder, CommandHandler, CallbackQueryHandler, ContextTypes, ConversationHandler, \
+from telegram.ext import ApplicationBuilder, CommandHandler, ContextTypes, ConversationHandler, \
     MessageHandler, filters, BaseHandler
 from server_menu.service import Service as ServerService
 from server_menu.server import Server as MinecraftServer
-from server_menu.whitelist import add_to_whitelist, remove_from_whitelist, reload_whitelist, add_ufw_rules, \
-    remove_ufw_rules
+from server_menu.events import EventBus, PlayerJoined, PlayerLeft, ServerLagging, ServerStarted, ServerStopping
+from server_menu.logwatch import LogFollower
+from server_menu.metrics import MetricsSampler
+from server_menu.broadcast import BroadcastManager, STATE_PENDING, STATE_DELIVERED, STATE_FAILED
+from server_menu.notify import AdminNotifier, send_many
+from server_menu.firewall import get_firewall
+from server_menu.reconcile import Reconciler, RECONCILE_INTERVAL
+from server_menu.callbacks import CallbackRouter, pack
+from server_menu.whitelist import get_whitelist, remove_from_whitelist, reload_whitelist, remove_ufw_rules
 
 
 # ==================== УТИЛИТЫ ====================
@@ -79,9 +94,22 @@ class Config:
     BOT_TOKEN = os.getenv("BOT_TOKEN")
     ADMIN_IDS = set(map(int, os.getenv("ADMIN_IDS", "").split(",")))
     DB_PATH = os.path.join(os.path.dirname(__file__), "users.db")
+    DB_BUSY_TIMEOUT = int(os.getenv("DB_BUSY_TIMEOUT", "5000"))  # Ожидание блокировки базы (мс)
+    USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "1024"))  # Сколько пользователей держать в памяти
+    ADMIN_PAGE_SIZE = int(os.getenv("ADMIN_PAGE_SIZE", "10"))  # Пользователей на странице списков админа
     SCREEN_NAME = os.getenv("SCREEN_NAME")
     SERVER_DIR = Path(os.getenv("SERVER_DIR"))
     SCRIPTS_DIR = Path(os.getenv("SCRIPTS_DIR"))
+    BACKUP_PROGRESS_INTERVAL = float(os.getenv("BACKUP_PROGRESS_INTERVAL", "5"))  # Частота обновления прогресса (сек)
+    BROADCAST_PROGRESS_INTERVAL = float(os.getenv("BROADCAST_PROGRESS_INTERVAL", "3"))  # Обновление счётчиков рассылки (сек)
+    LAG_NOTIFY_INTERVAL = float(os.getenv("LAG_NOTIFY_INTERVAL", "600"))  # Не чаще одного уведомления о лагах (сек)
+    # Приём обновлений: polling (запросы getUpdates) или webhook (Telegram сам присылает обновления через прокси)
+    BOT_MODE = os.getenv("BOT_MODE", "polling")
+    WEBHOOK_URL = os.getenv("WEBHOOK_URL")  # Внешний адрес прокси, например https://bot.example.com
+    WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")  # Путь webhook за прокси и на локальном порту
+    WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "127.0.0.1")  # Локальный адрес, на который проксируются запросы
+    WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+    WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")  # Пусто - новый случайный секрет при каждом запуске
 
     # Состояния ConversationHandler
     (REG_NICK, REG_IP, REG_CONFIRM, REG_RESTART, EDIT_NICK, EDIT_IP, ADMIN_SENDMSG, ADMIN_USER_SELECT, SERVER_MSG_INPUT,
@@ -106,41 +134,203 @@ class Config:
 
 
 # ==================== БАЗА ДАННЫХ ====================
+class ConnectionManager:
+    """Долгоживущие соединения с SQLite - по одному на поток, с WAL и кэшем подготовленных запросов"""
+
+    PRAGMAS = (
+        "PRAGMA journal_mode=WAL",  # Чтение не блокируется записью
+        "PRAGMA synchronous=NORMAL",  # В режиме WAL надёжно и без fsync на каждую транзакцию
+        "PRAGMA foreign_keys=ON",
+        "PRAGMA temp_store=MEMORY",
+        "PRAGMA cache_size=-8000",  # 8 МБ страничного кэша на соединение
+    )
+
+    def __init__(self, path, busy_timeout=Config.DB_BUSY_TIMEOUT, cached_statements=256):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        self._all = []  # Все открытые соединения - для закрытия при остановке
+        self._lock = threading.Lock()
+
+    def _open(self):
+        con = sqlite3.connect(self.path, timeout=self.busy_timeout / 1000, cached_statements=self.cached_statements)
+        for pragma in self.PRAGMAS:
+            con.execute(pragma)
+        with self._lock:
+            self._all.append(con)
+        return con
+
+    def get(self):
+        """Соединение текущего потока"""
+        con = getattr(self._local, "con", None)
+        if con is None:
+            con = self._local.con = self._open()
+        return con
+
+    @contextmanager
+    def transaction(self):
+        """Соединение в транзакции: commit при выходе, rollback при исключении"""
+        con = self.get()
+        with con:
+            yield con
+
+    def close_all(self):
+        with self._lock:
+            connections, self._all = self._all, []
+        for con in connections:
+            try:
+                con.close()
+            except sqlite3.ProgrammingError:
+                pass  # Соединение другого потока - закроется вместе с процессом
+        self._local = threading.local()
+
+
 class Database:
     """Класс для работы с базой данных пользователей"""
 
+    connections = ConnectionManager(Config.DB_PATH)
+    # (tg_id, tg_username, старый ник, новый ник, approved) - ники, переименованные миграцией при этом запуске
+    renamed_nicks = []
+
+    @staticmethod
+    def connection():
+        """Соединение с базой в транзакции"""
+        return Database.connections.transaction()
+
+    @staticmethod
+    def _migration_create_users(con):
+        con.execute("""CREATE TABLE IF NOT EXISTS users(
+            tg_id INTEGER PRIMARY KEY,
+            tg_username TEXT,
+            ingame_nick TEXT,
+            ip TEXT,
+            approved INTEGER DEFAULT 0
+        )""")
+
+    @staticmethod
+    def _migration_indexes(con):
+        # Уникальный индекс не создать, пока есть повторяющиеся ники - лишние переименовываются
+        # Переименования сообщаются админам и пользователям после запуска бота (MinecraftBot._report_renamed_nicks)
+        duplicates = con.execute("""SELECT tg_id, tg_username, ingame_nick, approved FROM users WHERE ingame_nick IN (
+                                        SELECT ingame_nick FROM users GROUP BY ingame_nick HAVING COUNT(*) > 1)
+                                    ORDER BY ingame_nick, approved DESC, tg_id""").fetchall()
+        seen = set()
+        for tg_id, username, nick, approved in duplicates:
+            if nick not in seen:
+                seen.add(nick)  # Ник остаётся у одобренного (или первого) пользователя
+                continue
+            suffix = 1
+            while True:
+                new_nick = f"{nick[:16 - len(str(suffix)) - 1]}_{suffix}"
+                if con.execute("SELECT 1 FROM users WHERE ingame_nick=?", (new_nick,)).fetchone() is None:
+                    break
+                suffix += 1
+            con.execute("UPDATE users SET ingame_nick=? WHERE tg_id=?", (new_nick, tg_id))
+            Database.renamed_nicks.append((tg_id, username, nick, new_nick, approved))
+            logger.warning(f"Повторяющийся ник {nick} пользователя {username} (ID: {tg_id}, "
+                           f"{'одобрен' if approved else 'не одобрен'}) переименован в {new_nick}")
+        con.execute("CREATE UNIQUE INDEX IF NOT EXISTS users_ingame_nick ON users(ingame_nick)")
+        con.execute("CREATE INDEX IF NOT EXISTS users_approved_username ON users(approved, tg_username)")
+        con.execute("CREATE INDEX IF NOT EXISTS users_username ON users(tg_username)")
+        con.execute("CREATE INDEX IF NOT EXISTS users_ip ON users(ip)")
+
+    @staticmethod
+    def _migration_timestamps(con):
+        # ALTER TABLE не допускает CURRENT_TIMESTAMP по умолчанию - у новых строк время ставит триггер
+        con.execute("ALTER TABLE users ADD COLUMN created_at TEXT")
+        con.execute("ALTER TABLE users ADD COLUMN updated_at TEXT")
+        con.execute("UPDATE users SET created_at=CURRENT_TIMESTAMP, updated_at=CURRENT_TIMESTAMP")
+        con.execute("""CREATE TRIGGER IF NOT EXISTS users_created AFTER INSERT ON users
+                       BEGIN
+                           UPDATE users SET created_at=COALESCE(NEW.created_at, CURRENT_TIMESTAMP),
+                                            updated_at=CURRENT_TIMESTAMP
+                           WHERE tg_id=NEW.tg_id;
+                       END""")
+        con.execute("""CREATE TRIGGER IF NOT EXISTS users_updated AFTER UPDATE OF tg_username, ingame_nick, ip, approved
+                       ON users
+                       BEGIN
+                           UPDATE users SET updated_at=CURRENT_TIMESTAMP WHERE tg_id=NEW.tg_id;
+                       END""")
+
+    @staticmethod
+    def _migration_page_index(con):
+        # Порядок страниц списков: username без учёта регистра (пустой - в начале), затем tg_id
+        con.execute("CREATE INDEX IF NOT EXISTS users_approved_sort ON users(approved, lower(IFNULL(tg_username, '')), tg_id)")
+
+    @staticmethod
+    def _migration_broadcasts(con):
+        # Прогресс рассылок: после перезапуска бота рассылка продолжается с неотправленных получателей
+        con.execute("""CREATE TABLE IF NOT EXISTS broadcasts(
+            id INTEGER PRIMARY KEY,
+            admin_id INTEGER,
+            text TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'running',
+            created_at TEXT DEFAULT CURRENT_TIMESTAMP,
+            finished_at TEXT
+        )""")
+        con.execute("""CREATE TABLE IF NOT EXISTS broadcast_recipients(
+            broadcast_id INTEGER NOT NULL REFERENCES broadcasts(id) ON DELETE CASCADE,
+            tg_id INTEGER NOT NULL,
+            status INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            PRIMARY KEY (broadcast_id, tg_id)
+        ) WITHOUT ROWID""")
+        con.execute("CREATE INDEX IF NOT EXISTS broadcast_recipients_status ON broadcast_recipients(broadcast_id, status)")
+
+    # Миграции по порядку; номер последней применённой хранится в PRAGMA user_version
+    MIGRATIONS = (_migration_create_users, _migration_indexes, _migration_timestamps, _migration_page_index,
+                  _migration_broadcasts)
+
     @staticmethod
     def init():
-        """Инициализация базы данных"""
-        with sqlite3.connect(Config.DB_PATH) as con:
-            con.execute("""CREATE TABLE IF NOT EXISTS users(
-                tg_id INTEGER PRIMARY KEY,
-                tg_username TEXT,
-                ingame_nick TEXT,
-                ip TEXT,
-                approved INTEGER DEFAULT 0
-            )""")
+        """Инициализация базы данных: применение недостающих миграций"""
+        con = Database.connections.get()
+        version = con.execute("PRAGMA user_version").fetchone()[0]
+        for number, migration in enumerate(Database.MIGRATIONS[version:], version + 1):
+            # Каждая миграция - отдельная транзакция вместе с новым номером версии
+            con.execute("BEGIN IMMEDIATE")
+            try:
+                migration.__func__(con)
+                con.execute(f"PRAGMA user_version={number}")
+                con.commit()
+            except Exception:
+                con.rollback()
+                raise
+            logger.info(f"База пользователей обновлена до версии {number}")
 
     @staticmethod
     def user_exists(tg_id):
         """Проверка существования пользователя"""
-        with sqlite3.connect(Config.DB_PATH) as con:
+        with Database.connection() as con:
             return con.execute("SELECT 1 FROM users WHERE tg_id=?", (tg_id,)).fetchone() is not None
 
     @staticmethod
     def get_user(tg_id):
         """Получение данных пользователя"""
-        with sqlite3.connect(Config.DB_PATH) as con:
+        with Database.connection() as con:
             row = con.execute("SELECT tg_id, tg_username, ingame_nick, ip, approved FROM users WHERE tg_id=?",
                               (tg_id,)).fetchone()
             return dict(zip(['tg_id', 'tg_username', 'ingame_nick', 'ip', 'approved'], row)) if row else None
 
+    @staticmethod
+    def get_user_by_nick(ingame_nick):
+        """Получение данных пользователя по внутриигровому нику"""
+        with Database.connection() as con:
+            row = con.execute("SELECT tg_id, tg_username, ingame_nick, ip, approved FROM users WHERE ingame_nick=?",
+                              (ingame_nick.lower(),)).fetchone()
+            return dict(zip(['tg_id', 'tg_username', 'ingame_nick', 'ip', 'approved'], row)) if row else None
+
     @staticmethod
     def add_user(tg_id, tg_username, ingame_nick, ip):
         """Добавление нового пользователя"""
-        with sqlite3.connect(Config.DB_PATH) as con:
+        with Database.connection() as con:
+            # Повторная регистрация обновляет строку на месте: REPLACE удалил бы её (вместе с created_at),
+            # а при занятом нике - и чужую строку
             con.execute(
-                "INSERT OR REPLACE INTO users (tg_id, tg_username, ingame_nick, ip, approved) VALUES (?, ?, ?, ?, 0)",
+                """INSERT INTO users (tg_id, tg_username, ingame_nick, ip, approved) VALUES (?, ?, ?, ?, 0)
+                   ON CONFLICT(tg_id) DO UPDATE SET tg_username=excluded.tg_username,
+                       ingame_nick=excluded.ingame_nick, ip=excluded.ip, approved=0""",
                 (tg_id, tg_username, ingame_nick, ip))
 
     @staticmethod
@@ -150,13 +340,13 @@ class Database:
             return
         set_clause = ", ".join(f"{k}=?" for k in fields)
         values = list(fields.values()) + [tg_id]
-        with sqlite3.connect(Config.DB_PATH) as con:
+        with Database.connection() as con:
             con.execute(f"UPDATE users SET {set_clause} WHERE tg_id=?", values)
 
     @staticmethod
     def delete_user(tg_id):
         """Удаление пользователя"""
-        with sqlite3.connect(Config.DB_PATH) as con:
+        with Database.connection() as con:
             con.execute("DELETE FROM users WHERE tg_id=?", (tg_id,))
 
     @staticmethod
@@ -168,30 +358,442 @@ class Database:
             query += " WHERE approved=?"
             params = (1 if approved else 0,)
         query += " ORDER BY tg_username"
-        with sqlite3.connect(Config.DB_PATH) as con:
+        with Database.connection() as con:
             return con.execute(query, params).fetchall()
 
+    @staticmethod
+    def page_users(approved, cursor=None, backward=False, prefix=None, limit=Config.ADMIN_PAGE_SIZE):
+        """Страница пользователей по ключу (username, tg_id) после/до пользователя cursor.
+
+        Возвращает (строки как в list_users, есть ли предыдущая страница, есть ли следующая).
+        Запрос читает не больше limit + 1 строк индекса независимо от размера таблицы.
+        """
+        sort_key = "lower(IFNULL(tg_username, ''))"
+        where = ["approved=?"]
+        params = [1 if approved else 0]
+        if prefix:
+            # Поиск по началу username - диапазон того же индекса
+            where.append(f"{sort_key} >= ? AND {sort_key} < ?")
+            params += [prefix.lower(), prefix.lower() + "\U0010ffff"]
+        with Database.connection() as con:
+            if cursor is not None:
+                key = con.execute(f"SELECT {sort_key}, tg_id FROM users WHERE tg_id=?", (cursor,)).fetchone()
+                if key is None:
+                    cursor = None  # Пользователь удалён - начинаем с первой страницы
+                else:
+                    # Отдельное условие на username нужно, чтобы SQLite искал по диапазону индекса, а не с начала
+                    op = "<" if backward else ">"
+                    where.append(f"{sort_key} {op}= ? AND ({sort_key}, tg_id) {op} (?, ?)")
+                    params += [key[0], *key]
+            backward = backward and cursor is not None
+            order = "DESC" if backward else "ASC"
+            rows = con.execute(f"SELECT tg_id, tg_username, ingame_nick, ip, approved FROM users "
+                               f"WHERE {' AND '.join(where)} ORDER BY {sort_key} {order}, tg_id {order} LIMIT ?",
+                               params + [limit + 1]).fetchall()
+        more = len(rows) > limit
+        rows = rows[:limit]
+        if backward:
+            return rows[::-1], more, True
+        return rows, cursor is not None, more
+
+    @staticmethod
+    def decide_pending(tg_ids, approve):
+        """Одобрение (approved=1) или отклонение (удаление) заявок одной транзакцией.
+
+        Затрагиваются только ещё не одобренные пользователи; возвращает их строки (tg_id, ingame_nick, ip).
+        """
+        tg_ids = list(tg_ids)
+        if not tg_ids:
+            return []
+        marks = ", ".join("?" * len(tg_ids))
+        with Database.connection() as con:
+            rows = con.execute(f"SELECT tg_id, ingame_nick, ip FROM users WHERE approved=0 AND tg_id IN ({marks})",
+                               tg_ids).fetchall()
+            ids = [row[0] for row in rows]
+            marks = ", ".join("?" * len(ids))
+            if ids and approve:
+                con.execute(f"UPDATE users SET approved=1 WHERE tg_id IN ({marks})", ids)
+            elif ids:
+                con.execute(f"DELETE FROM users WHERE tg_id IN ({marks})", ids)
+            return rows
+
+    @staticmethod
+    def broadcast_create(admin_id, text, keep=20):
+        """Новая рассылка всем одобренным пользователям; старые завершённые удаляются, кроме keep последних"""
+        with Database.connection() as con:
+            con.execute("""DELETE FROM broadcasts WHERE status != 'running'
+                           AND id NOT IN (SELECT id FROM broadcasts ORDER BY id DESC LIMIT ?)""", (keep,))
+            broadcast_id = con.execute("INSERT INTO broadcasts (admin_id, text) VALUES (?, ?)",
+                                       (admin_id, text)).lastrowid
+            con.execute("""INSERT INTO broadcast_recipients (broadcast_id, tg_id)
+                           SELECT ?, tg_id FROM users WHERE approved=1""", (broadcast_id,))
+            return broadcast_id
+
+    @staticmethod
+    def broadcast_counts(broadcast_id):
+        """(всего, доставлено, не доставлено) получателей рассылки"""
+        with Database.connection() as con:
+            counts = dict(con.execute("""SELECT status, COUNT(*) FROM broadcast_recipients WHERE broadcast_id=?
+                                         GROUP BY status""", (broadcast_id,)).fetchall())
+        return sum(counts.values()), counts.get(STATE_DELIVERED, 0), counts.get(STATE_FAILED, 0)
+
+    @staticmethod
+    def broadcast_pending(broadcast_id, limit):
+        """Следующие limit получателей, которым ещё не отправлено сообщение"""
+        with Database.connection() as con:
+            rows = con.execute("SELECT tg_id FROM broadcast_recipients WHERE broadcast_id=? AND status=? LIMIT ?",
+                               (broadcast_id, STATE_PENDING, limit)).fetchall()
+            return [row[0] for row in rows]
+
+    @staticmethod
+    def broadcast_save(broadcast_id, results):
+        """Запись результатов отправки [(tg_id, состояние, ошибка)] одной транзакцией"""
+        with Database.connection() as con:
+            con.executemany("UPDATE broadcast_recipients SET status=?, error=? WHERE broadcast_id=? AND tg_id=?",
+                            [(status, error, broadcast_id, tg_id) for tg_id, status, error in results])
+
+    @staticmethod
+    def broadcast_finish(broadcast_id, status):
+        with Database.connection() as con:
+            con.execute("UPDATE broadcasts SET status=?, finished_at=CURRENT_TIMESTAMP WHERE id=?",
+                        (status, broadcast_id))
+
+    @staticmethod
+    def broadcast_unfinished():
+        """Рассылки, прерванные остановкой бота: [(id, id админа, текст)]"""
+        with Database.connection() as con:
+            return con.execute("SELECT id, admin_id, text FROM broadcasts WHERE status='running' ORDER BY id").fetchall()
+
+    @staticmethod
+    def is_nick_unique(nick: str) -> bool:
+        """Проверка уникальности ника"""
+        with Database.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1 FROM users WHERE ingame_nick = ?", (nick.lower(),))
+            return cursor.fetchone() is None
+
+    @staticmethod
+    def is_ip_unique(ip: str) -> bool:
+        """Проверка уникальности IP"""
+        with Database.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1 FROM users WHERE ip = ?", (ip,))
+            return cursor.fetchone() is None
+
+
+class UserCache:
+    """LRU кэш строк пользователей по tg_id с дополнительным поиском по нику.
+
+    Хранит и отсутствующих пользователей (None), чтобы повторные проверки незарегистрированных
+    тоже не обращались к базе.
+    """
+
+    MISSING = object()  # Пользователя нет в кэше (в отличие от None - нет в базе)
+
+    def __init__(self, max_size=Config.USER_CACHE_SIZE):
+        self.max_size = max_size
+        self.version = 0  # Растёт при каждом изменении - прочитанное до изменения не кэшируется
+        self._rows = OrderedDict()
+        self._by_nick = {}
+
+    def get(self, tg_id):
+        if tg_id not in self._rows:
+            return self.MISSING
+        self._rows.move_to_end(tg_id)
+        row = self._rows[tg_id]
+        return dict(row) if row else None
+
+    def tg_id_by_nick(self, nick):
+        return self._by_nick.get(nick.lower())
+
+    def put(self, tg_id, row):
+        self._unindex(tg_id)
+        self._rows[tg_id] = dict(row) if row else None
+        self._rows.move_to_end(tg_id)
+        if row and row.get("ingame_nick"):
+            self._by_nick[row["ingame_nick"].lower()] = tg_id
+        while len(self._rows) > self.max_size:
+            self._unindex(next(iter(self._rows)))
+            self._rows.popitem(last=False)
+
+    def update(self, tg_id, fields):
+        """Запись изменённых полей в закэшированную строку"""
+        self.version += 1
+        row = self._rows.get(tg_id)
+        if row:
+            self.put(tg_id, {**row, **fields})
+
+    def invalidate(self, tg_id):
+        self.version += 1
+        self._unindex(tg_id)
+        self._rows.pop(tg_id, None)
+
+    def clear(self):
+        self.version += 1
+        self._rows.clear()
+        self._by_nick.clear()
+
+    def _unindex(self, tg_id):
+        row = self._rows.get(tg_id)
+        if row and row.get("ingame_nick") and self._by_nick.get(row["ingame_nick"].lower()) == tg_id:
+            del self._by_nick[row["ingame_nick"].lower()]
+
+
+class AsyncDatabase:
+    """Асинхронный доступ к Database: запросы выполняются по очереди в одном выделенном потоке,
+    поэтому обработчики не блокируют цикл событий, а соединение с базой всегда одно"""
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="database")
+        self.cache = UserCache()
+
+    async def _call(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, partial(func, *args, **kwargs))
+
+    async def user_exists(self, tg_id):
+        return await self.get_user(tg_id) is not None
+
+    async def get_user(self, tg_id):
+        row = self.cache.get(tg_id)
+        if row is not UserCache.MISSING:
+            return row
+        version = self.cache.version
+        row = await self._call(Database.get_user, tg_id)
+        if self.cache.version == version:
+            self.cache.put(tg_id, row)
+        return row
+
+    async def get_user_by_nick(self, ingame_nick):
+        tg_id = self.cache.tg_id_by_nick(ingame_nick)
+        if tg_id is not None:
+            return await self.get_user(tg_id)
+        version = self.cache.version
+        row = await self._call(Database.get_user_by_nick, ingame_nick)
+        if row and self.cache.version == version:
+            self.cache.put(row["tg_id"], row)
+        return row
+
+    async def add_user(self, tg_id, tg_username, ingame_nick, ip):
+        try:
+            await self._call(Database.add_user, tg_id, tg_username, ingame_nick, ip)
+        except Exception:
+            self.cache.invalidate(tg_id)
+            raise
+        self.cache.version += 1
+        self.cache.put(tg_id, {"tg_id": tg_id, "tg_username": tg_username, "ingame_nick": ingame_nick, "ip": ip,
+                               "approved": 0})
+
+    async def update_user(self, tg_id, **fields):
+        try:
+            await self._call(Database.update_user, tg_id, **fields)
+        except Exception:
+            self.cache.invalidate(tg_id)
+            raise
+        self.cache.update(tg_id, fields)
+
+    async def delete_user(self, tg_id):
+        try:
+            await self._call(Database.delete_user, tg_id)
+        except Exception:
+            self.cache.invalidate(tg_id)
+            raise
+        self.cache.version += 1
+        self.cache.put(tg_id, None)
+
+    async def list_users(self, approved=None):
+        return await self._call(Database.list_users, approved)
+
+    async def page_users(self, approved, cursor=None, backward=False, prefix=None, limit=Config.ADMIN_PAGE_SIZE):
+        return await self._call(Database.page_users, approved, cursor, backward, prefix, limit)
+
+    async def is_nick_unique(self, nick):
+        if self.cache.tg_id_by_nick(nick) is not None:
+            return False
+        return await self._call(Database.is_nick_unique, nick)
+
+    async def is_ip_unique(self, ip):
+        return await self._call(Database.is_ip_unique, ip)
+
+    async def decide_pending(self, tg_ids, approve):
+        try:
+            rows = await self._call(Database.decide_pending, tg_ids, approve)
+        except Exception:
+            for tg_id in tg_ids:
+                self.cache.invalidate(tg_id)
+            raise
+        self.cache.version += 1
+        for tg_id, _, _ in rows:
+            if approve:
+                self.cache.update(tg_id, {"approved": 1})
+            else:
+                self.cache.put(tg_id, None)
+        return rows
+
+    async def broadcast_create(self, admin_id, text):
+        return await self._call(Database.broadcast_create, admin_id, text)
+
+    async def broadcast_counts(self, broadcast_id):
+        return await self._call(Database.broadcast_counts, broadcast_id)
+
+    async def broadcast_pending(self, broadcast_id, limit):
+        return await self._call(Database.broadcast_pending, broadcast_id, limit)
+
+    async def broadcast_save(self, broadcast_id, results):
+        return await self._call(Database.broadcast_save, broadcast_id, results)
+
+    async def broadcast_finish(self, broadcast_id, status):
+        return await self._call(Database.broadcast_finish, broadcast_id, status)
+
+    async def broadcast_unfinished(self):
+        return await self._call(Database.broadcast_unfinished)
+
+    def close(self):
+        """Закрытие соединений и остановка потока базы"""
+        self._executor.submit(Database.connections.close_all)
+        self._executor.shutdown(wait=True)
+
+
+db = AsyncDatabase()
+
 
 # ==================== БОТ ====================
 class MinecraftBot:
     """Основной класс бота"""
 
     def __init__(self):
+        """Корень композиции: каждый компонент создаётся один раз и передаётся остальным через self"""
         self.pid_file = TEMP_DIR / 'bot.pid'
         self._write_pid_file()
-        self.application = ApplicationBuilder().token(Config.BOT_TOKEN).build()
+        Database.init()  # Схема и миграции - до создания компонентов, работающих с базой
+        self.application = ApplicationBuilder().token(Config.BOT_TOKEN) \
+            .post_init(self._post_init).post_shutdown(self._post_shutdown).build()
         self.whitelist_manager = WhitelistManager()
-        # Инициализация серверных модулей
+        # События из лога сервера
+        self.events = EventBus()
+        self.log_follower = LogFollower(Config.SERVER_DIR / "logs/latest.log", self.events)
+        # Инициализация серверных модулей (общие для меню, метрик и событий)
         self.server_service = ServerService(self)
         self.minecraft_server = MinecraftServer(self)
+        self.metrics = MetricsSampler(self.server_service)  # Фоновый сбор CPU, RAM, TPS для сервисного меню
+        self.broadcasts = BroadcastManager(db, self._send_broadcast)
+        self.notifier = AdminNotifier(self._send_admin_notification, Config.ADMIN_IDS)
+        # Сверка whitelist и firewall с базой
+        self.reconciler = Reconciler(self._approved_players, notify=self._notify_reconcile)
         # Инициализация компонентов бота
         self.service = Service(self)  # Сервисные функции
         self.server = Server(self)  # Серверные функции
         self.admin = Admin(self)
         self.registration = Registration(self)
         self.user = User(self)
+        self.router = CallbackRouter()  # Действие из callback_data -> обработчик
         self.setup_handlers()
-        Database.init()
+        self.server.subscribe_events(self.events)
+        self.service.subscribe_events(self.events)
+
+    async def _post_init(self, application):
+        """Запуск фоновых задач после старта приложения"""
+        self.log_follower.start()
+        if application.job_queue is None:
+            logger.warning("job_queue недоступна (pip install \"python-telegram-bot[job-queue]\"), "
+                           "метрики будут собираться при открытии меню")
+        else:
+            application.job_queue.run_repeating(self.metrics.job_callback, interval=self.metrics.interval,
+                                                first=1, name="metrics")
+
+        # Первая сверка - вскоре после запуска: наборы ipset не переживают перезагрузку системы
+        if application.job_queue is None:
+            asyncio.ensure_future(self.reconciler.job_callback(None))
+        elif RECONCILE_INTERVAL > 0:
+            application.job_queue.run_repeating(self.reconciler.job_callback, interval=RECONCILE_INTERVAL,
+                                                first=10, name="reconcile")
+        else:
+            application.job_queue.run_once(self.reconciler.job_callback, when=10, name="reconcile")
+        if Database.renamed_nicks:
+            asyncio.ensure_future(self._report_renamed_nicks())
+        for admin_id, job in await self.broadcasts.resume():
+            # Приложение ещё не запущено - задача создаётся напрямую, а не через application.create_task
+            asyncio.ensure_future(self.admin.report_resumed_broadcast(admin_id, job))
+
+    async def _post_shutdown(self, application):
+        """Остановка фоновых задач"""
+        await self.log_follower.stop()
+        await self.broadcasts.stop()  # Прогресс рассылок сохраняется до закрытия базы
+        await self.notifier.close()
+        db.close()
+
+    @staticmethod
+    async def _approved_players():
+        """(ник, IP) одобренных пользователей - нужное состояние whitelist и firewall"""
+        return [(user[2], user[3]) for user in await db.list_users(approved=True)]
+
+    async def _send_admin_notification(self, chat_id, text, buttons):
+        await self.application.bot.send_message(chat_id=chat_id, text=text, parse_mode="HTML",
+                                                reply_markup=InlineKeyboardMarkup(buttons) if buttons else None)
+
+    async def _report_renamed_nicks(self):
+        """Ники, переименованные миграцией: новые ники одобренных - в whitelist, сообщения админам и пользователям.
+
+        Прежний ник остаётся в whitelist - он принадлежит пользователю, у которого не был переименован
+        """
+        renamed, Database.renamed_nicks = Database.renamed_nicks, []
+        added = [new_nick for _, _, _, new_nick, approved in renamed if approved]
+        if added:
+            await WhitelistManager.apply_whitelist(add=added)
+        lines = [f"{username} (ID: {tg_id}): {old_nick} → {new_nick}" for tg_id, username, old_nick, new_nick, _ in renamed]
+        self.notifier.notify("⚠️ При обновлении базы переименованы повторяющиеся ники:\n" + "\n".join(lines),
+                             [[InlineKeyboardButton(f"👤 {new_nick}", callback_data=pack("admin_user", tg_id))]
+                              for tg_id, _, _, new_nick, _ in renamed])
+        texts = {tg_id: f"⚠️ Ник {old_nick} уже занят другим игроком, ваш ник изменён на {new_nick}. "
+                        f"Изменить его можно в меню пользователя /user"
+                 for tg_id, _, old_nick, new_nick, _ in renamed}
+        await send_many(lambda chat_id: self.application.bot.send_message(chat_id=chat_id, text=texts[chat_id]), texts)
+
+    def _notify_reconcile(self, text):
+        """Уведомление админов о записях whitelist и firewall, которых нет в базе"""
+        self.notifier.notify(text, [[InlineKeyboardButton("🧮 Сверка whitelist и firewall",
+                                                          callback_data="admin_reconcile")]])
+
+    async def _send_broadcast(self, chat_id, text):
+        await self.application.bot.send_message(chat_id, f"🔔 Сообщение от администратора:\n{text}")
+
+    @staticmethod
+    def webhook_options():
+        """Параметры run_webhook (и Updater.start_webhook) из конфигурации.
+
+        Запросы без заголовка X-Telegram-Bot-Api-Secret-Token с этим секретом отклоняются с кодом 403
+        """
+        if not Config.WEBHOOK_URL:
+            raise ValueError("WEBHOOK_URL не указан в .env (нужен для BOT_MODE=webhook)")
+        secret = Config.WEBHOOK_SECRET or secrets.token_urlsafe(32)
+        if not re.fullmatch(r"[A-Za-z0-9_-]{1,256}", secret):
+            raise ValueError("WEBHOOK_SECRET: от 1 до 256 символов из A-Z, a-z, 0-9, _ и -")
+        path = Config.WEBHOOK_PATH.strip("/")
+        return {
+            "listen": Config.WEBHOOK_LISTEN,
+            "port": Config.WEBHOOK_PORT,
+            "url_path": path,
+            "webhook_url": f"{Config.WEBHOOK_URL.rstrip('/')}/{path}",
+            "secret_token": secret,
+        }
+
+    def run(self):
+        """Приём обновлений в режиме BOT_MODE до остановки бота.
+
+        Запуск в режиме webhook регистрирует webhook, запуск в режиме polling снимает его - для переключения
+        достаточно сменить BOT_MODE и перезапустить бота. Обновления, пришедшие за время перезапуска,
+        Telegram хранит и доставит после запуска в любом режиме.
+        """
+        if Config.BOT_MODE == "webhook":
+            options = self.webhook_options()
+            logger.info(f"Режим webhook: {options['webhook_url']} -> "
+                        f"http://{options['listen']}:{options['port']}/{options['url_path']}")
+            self.application.run_webhook(**options)
+        elif Config.BOT_MODE == "polling":
+            logger.info("Режим polling")
+            self.application.run_polling()
+        else:
+            raise ValueError(f"Неизвестный BOT_MODE={Config.BOT_MODE} (доступны: polling, webhook)")
 
     def _write_pid_file(self):
         """Запись PID файла для управления процессом"""
@@ -213,47 +815,34 @@ class MinecraftBot:
         self.application.add_error_handler(error_handler)
 
     def setup_handlers(self):
-        """Настройка обработчиков"""
+        """Настройка обработчиков. Кнопки вне диалогов обрабатывает один CallbackQueryHandler роутера"""
+        route = self.router.route
+        route("hello", lambda u, c: reply_to_update(u, Config.TEXTS["hello"]))
+        route("readme", lambda u, c: reply_to_update(u, Config.TEXTS["readme"]))
+        route("start", self.start)
+        route("help", self.help_command)
+        route("unreg", self._handle_unreg_command)
+        route("exit", self.exit)
         handlers = [
             # Базовые команды
             CommandHandler("start", self.start),
             CommandHandler("help", self.help_command),
             CommandHandler("user", self.send_user_menu),
             CommandHandler("unreg", self._handle_unreg_command),
-            CallbackQueryHandler(lambda u, c: reply_to_update(u, Config.TEXTS["hello"]), pattern="^hello$"),
-            CallbackQueryHandler(lambda u, c: reply_to_update(u, Config.TEXTS["readme"]), pattern="^readme$"),
-            CallbackQueryHandler(self.start, pattern="^start$"),
-            CallbackQueryHandler(self.help_command, pattern="^help$"),
-            CallbackQueryHandler(self._handle_unreg_command, pattern="^unreg$"),
-            CallbackQueryHandler(self.exit, pattern="^exit$"),
             # Обработчик регистрации
             self._create_registration_handler(),
             # Пользовательские обработчики
             *self._create_user_handlers(),
-            # Обработчик администрирования
-            *self._create_admin_handlers(),
             # Серверные обработчики
-            CallbackQueryHandler(self.server.server_menu, pattern="^admin_server$"),
-            CallbackQueryHandler(self.server.get_players_count, pattern="^server_players$"),
-            CallbackQueryHandler(self.server.get_weather_menu, pattern="^server_weather$"),
-            CallbackQueryHandler(self.server.set_weather, pattern="^weather_"),
-            CallbackQueryHandler(self.server.reload_whitelist, pattern="^server_reload_whitelist$"),
-            CallbackQueryHandler(self.server.start_ban_menu, pattern="^ban_menu$"),
-            CallbackQueryHandler(self.server.start_ban_player, pattern="^server_ban$"),
-            CallbackQueryHandler(self.server.start_unban_player, pattern="^server_unban$"),
-            CallbackQueryHandler(self.server.ban_player, pattern="^ban_"),
-            CallbackQueryHandler(self.server.unban_player, pattern="^unban_"),
-            self._create_chat_message_handler(),
+            *self._create_server_handlers(),
             # Сервисные обработчики
-            CallbackQueryHandler(self.service.service_menu, pattern="^admin_service$"),
-            CallbackQueryHandler(self.service.backup_world, pattern="^service_backup$"),
-            CallbackQueryHandler(self.service.start_server, pattern="^service_start$"),
-            CallbackQueryHandler(self.service.restart_server, pattern="^service_restart$"),
-            CallbackQueryHandler(self.service.stop_server, pattern="^service_stop$"),
-            CallbackQueryHandler(self.service.execute_command, pattern="^service_exec_cmd$"),
-            CallbackQueryHandler(self.service.logging_on, pattern="^service_logging_on$"),
-            CallbackQueryHandler(self.service.logging_off, pattern="^service_logging_off$"),
-            self.service._create_command_handler(),
+            *self._create_service_handlers(),
+            # Обработчик администрирования (последним - ввод текста рассылки принимает любое сообщение)
+            *self._create_admin_handlers(),
+            # Кнопки вне диалогов - поиск действия в словаре роутера
+            self.router.handler(),
+            # Кнопки старого формата и неизвестные действия
+            self.router.fallback(),
         ]
         self.application.add_handlers(handlers)
 
@@ -261,7 +850,7 @@ class MinecraftBot:
         """Главное меню бота"""
         user_id = update.effective_user.id
         is_admin = user_id in Config.ADMIN_IDS
-        user = Database.get_user(user_id)
+        user = await db.get_user(user_id)
         buttons = [
             [InlineKeyboardButton("🚪 Выйти", callback_data="exit")],
             [InlineKeyboardButton("👋 Приветствие", callback_data="hello")],
@@ -283,7 +872,7 @@ class MinecraftBot:
 
     async def send_user_menu(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Меню пользователя"""
-        user = Database.get_user(update.effective_user.id)
+        user = await db.get_user(update.effective_user.id)
         if not user:
             await reply_to_update(update, Config.TEXTS["not_registered"])
             return
@@ -310,18 +899,19 @@ class MinecraftBot:
 
     def _create_registration_handler(self):
         """Создаем надежный обработчик регистрации"""
-        registration = Registration(self)
+        registration = self.registration
+        entry = self.router.entry
 
         return ConversationHandler(
             entry_points=[
                 CommandHandler("reg", registration.start),
-                CallbackQueryHandler(registration.start, pattern="^reg_new$"),
-                CallbackQueryHandler(registration.start, pattern="^reg_start$")
+                entry("reg_new", registration.start),
+                entry("reg_start", registration.start)
             ],
             states={
                 Config.REG_RESTART: [
-                    CallbackQueryHandler(registration.start, pattern="^reg_new$"),
-                    CallbackQueryHandler(registration.cancel, pattern="^reg_cancel$")
+                    entry("reg_new", registration.start),
+                    entry("reg_cancel", registration.cancel)
                 ],
                 Config.REG_NICK: [
                     MessageHandler(filters.TEXT & ~filters.COMMAND, registration.process_nick)
@@ -330,13 +920,13 @@ class MinecraftBot:
                     MessageHandler(filters.TEXT & ~filters.COMMAND, registration.process_ip)
                 ],
                 Config.REG_CONFIRM: [
-                    CallbackQueryHandler(registration.confirm, pattern="^reg_confirm$"),
-                    CallbackQueryHandler(registration.cancel, pattern="^reg_cancel$")
+                    entry("reg_confirm", registration.confirm),
+                    entry("reg_cancel", registration.cancel)
                 ]
             },
             fallbacks=[
                 CommandHandler("cancel", registration.cancel),
-                CallbackQueryHandler(registration.cancel, pattern="^cancel$"),
+                entry("cancel", registration.cancel),
                 MessageHandler(filters.ALL, registration.cancel)
             ],
             per_message=False,
@@ -345,87 +935,105 @@ class MinecraftBot:
 
     async def _handle_unreg_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик команды /unreg"""
-        user = User(self)
-        await user.unreg_start(update, context)
+        await self.user.unreg_start(update, context)
 
     def _create_user_handlers(self):
         """Обработчики пользователя"""
-        user = User(self)
+        user = self.user
+        route = self.router.route
+        route("user_unreg", user.unreg_start)
+        route("user_unreg_confirm", user.unreg_confirm)
+        route("user_cancel_unreg", user.cancel_unreg)
+        route("user_check", user.check_status)
+        route("user_menu", self.send_user_menu)
         return [
-            CallbackQueryHandler(user.unreg_start, pattern="^user_unreg$"),
-            CallbackQueryHandler(user.unreg_confirm, pattern="^user_unreg_confirm$"),
-            CallbackQueryHandler(user.cancel_unreg, pattern="^user_cancel_unreg$"),
-            CallbackQueryHandler(user.check_status, pattern="^user_check$"),
-            CallbackQueryHandler(self.send_user_menu, pattern="^user_menu$"),
             self._create_edit_nick_handler(),
             self._create_edit_ip_handler()
         ]
 
     def _create_edit_nick_handler(self):
         """Обработчик для изменения ника"""
-        user = User(self)
+        user = self.user
         return ConversationHandler(
-            entry_points=[CallbackQueryHandler(user.edit_nick_start, pattern="^user_edit_nick$")],
+            entry_points=[self.router.entry("user_edit_nick", user.edit_nick_start)],
             states={Config.EDIT_NICK: [MessageHandler(filters.TEXT & ~filters.COMMAND, user.edit_nick_save)]},
             fallbacks=[
                 CommandHandler("cancel", user.cancel_edit),
-                CallbackQueryHandler(user.cancel_edit, pattern="^cancel$")
+                self.router.entry("cancel", user.cancel_edit)
             ],
             per_message=False
         )
 
     def _create_edit_ip_handler(self):
         """Обработчик для изменения IP"""
-        user = User(self)
+        user = self.user
         return ConversationHandler(
-            entry_points=[CallbackQueryHandler(user.edit_ip_start, pattern="^user_edit_ip$")],
+            entry_points=[self.router.entry("user_edit_ip", user.edit_ip_start)],
             states={Config.EDIT_IP: [MessageHandler(filters.TEXT & ~filters.COMMAND, user.edit_ip_save)]},
             fallbacks=[
                 CommandHandler("cancel", user.cancel_edit),
-                CallbackQueryHandler(user.cancel_edit, pattern="^cancel$")
+                self.router.entry("cancel", user.cancel_edit)
             ],
             per_message=False
         )
 
     def _create_admin_handlers(self):
         """Создание обработчиков для админских команд"""
-        admin = Admin(self)
+        admin = self.admin
+        route, entry = self.router.route, self.router.entry
+        lists = tuple(Admin.USER_LISTS)
+        decisions = ("approve", "reject")
+        route("admin_menu", admin.send_admin_menu)
+        route("admin_list_pending", admin.list_pending_requests)
+        route("admin_list_users", admin.list_users)
+        route("admin_page", admin.handle_user_page, lists, ("next", "prev"), int)
+        route("admin_findreset", admin.reset_user_search, lists)
+        route("admin_broadcast", admin.start_broadcast)
+        route("admin_broadcast_cancel", admin.cancel_broadcast, int)
+        route("admin_user", admin.open_user_menu, int)
+        route("admin_delete", admin.handle_delete_user, int)
+        route("admin_access", admin.handle_whitelist_action, ("wl", "ufw"), ("add", "remove"), int)
+        route("admin_reload_wl", admin.reload_whitelist)
+        route("admin_reconcile", admin.reconcile_report)
+        route("admin_reconcile_apply", admin.reconcile_apply, ("add", "prune"))
+        route("admin_back", admin.handle_back)
+        route("admin_users", admin.handle_back)
+        route("admin_decision", admin.handle_approve_reject, decisions, int)
+        route("admin_select", admin.toggle_select_mode, ("on", "off"))
+        route("admin_sel", admin.toggle_selected, int)
+        route("admin_sel_page", admin.toggle_selected)
+        route("admin_bulk", admin.handle_bulk_decision, decisions)
         return [
             CommandHandler("admin", admin.send_admin_menu),
-            CallbackQueryHandler(admin.send_admin_menu, pattern="^admin_menu$"),
-            CallbackQueryHandler(admin.list_pending_requests, pattern="^admin_list_pending$"),
-            CallbackQueryHandler(admin.list_users, pattern="^admin_list_users$"),
-            CallbackQueryHandler(admin.start_broadcast, pattern="^admin_broadcast$"),
-            CallbackQueryHandler(admin.user_management_menu, pattern="^admin_user_"),
-            CallbackQueryHandler(admin.handle_delete_user, pattern=r'^admin_delete_\d+$'),
-            CallbackQueryHandler(admin.start_send_message, pattern=r'^admin_msg_\d+$'),
-            CallbackQueryHandler(admin.handle_whitelist_action, pattern="^(wl|ufw)_"),
-            CallbackQueryHandler(admin.reload_whitelist, pattern="^admin_reload_wl$"),
-            CallbackQueryHandler(admin.handle_back, pattern="^(admin_back|admin_users)$"),
-            CallbackQueryHandler(admin.handle_approve_reject, pattern="^admin_(approve|reject)_"),
             ConversationHandler(
-                entry_points=[CallbackQueryHandler(admin.start_edit_nick, pattern="^admin_edit_")],
+                entry_points=[entry("admin_find", admin.start_user_search, lists)],
+                states={
+                    "admin_search_input": [MessageHandler(filters.TEXT & ~filters.COMMAND, admin.process_user_search)]
+                },
+                fallbacks=[CommandHandler("cancel", admin.cancel_user_search)]
+            ),
+            ConversationHandler(
+                entry_points=[entry("admin_edit", admin.start_edit_nick, int)],
                 states={
                     "edit_nick": [MessageHandler(filters.TEXT & ~filters.COMMAND, admin.edit_user_nick)]
                 },
                 fallbacks=[]
             ),
             ConversationHandler(
-                entry_points=[CallbackQueryHandler(admin.start_edit_ip, pattern="^admin_editip_")],
+                entry_points=[entry("admin_editip", admin.start_edit_ip, int)],
                 states={
                     "edit_ip": [MessageHandler(filters.TEXT & ~filters.COMMAND, admin.edit_user_ip)]
                 },
                 fallbacks=[]
             ),
             ConversationHandler(
-                entry_points=[CallbackQueryHandler(admin.start_send_message, pattern=r'^admin_msg_\d+$')],
+                entry_points=[entry("admin_msg", admin.start_send_message, int)],
                 states={
                     "admin_message_input": [MessageHandler(filters.TEXT & ~filters.COMMAND, admin.process_user_message)]
                 },
                 fallbacks=[
                     CommandHandler("cancel", lambda u, c: reply_to_update(u, "Отправка сообщения отменена")),
-                    CallbackQueryHandler(lambda u, c: reply_to_update(u, "Отправка сообщения отменена"),
-                                         pattern="^cancel$")
+                    entry("cancel", lambda u, c: reply_to_update(u, "Отправка сообщения отменена"))
                 ]
             ),
             MessageHandler(filters.TEXT & ~filters.COMMAND, admin.process_broadcast),
@@ -433,38 +1041,73 @@ class MinecraftBot:
 
     def _create_server_handlers(self):
         """Создание обработчиков для серверных команд"""
+        server = self.server
+        route = self.router.route
+        route("admin_server", server.server_menu)
+        route("server_players", server.get_players_count)
+        route("server_weather", server.get_weather_menu)
+        route("weather", server.set_weather, ("clear", "rain", "thunder"))
+        route("server_time", server.get_time_menu)
+        route("time", server.set_time, ("day", "night", "noon", "midnight"))
+        route("server_pvp", server.get_pvp_menu)
+        route("pvp", server.toggle_pvp, ("enable", "disable"))
+        route("server_difficulty", server.get_difficulty_menu)
+        route("difficulty", server.set_difficulty, ("peaceful", "easy", "normal", "hard"))
+        route("server_reload_whitelist", server.reload_whitelist)
+        route("ban_menu", server.start_ban_menu)
+        route("server_ban", server.start_ban_player)
+        route("server_unban", server.start_unban_player)
+        route("ban", server.ban_player, int)
+        route("unban", server.unban_player, str)
         return [
-            CallbackQueryHandler(self.server.server_menu, pattern="^admin_server$"),
-            CallbackQueryHandler(self.server.get_players_count, pattern="^server_players$"),
-            CallbackQueryHandler(self.server.get_weather_menu, pattern="^server_weather$"),
-            CallbackQueryHandler(self.server.set_weather, pattern="^weather_"),
-            CallbackQueryHandler(self.server.reload_whitelist, pattern="^server_reload_whitelist$"),
-            self._create_chat_message_handler()
+            self._create_chat_message_handler(),
+            self._create_private_message_handler()
         ]
 
     def _create_chat_message_handler(self):
         """Создание обработчика сообщений чата"""
         return ConversationHandler(
-            entry_points=[CallbackQueryHandler(self.server.send_chat_message, pattern="^server_send_chat$")],
+            entry_points=[self.router.entry("server_send_chat", self.server.send_chat_message)],
             states={"server_chat_msg_input": [
                 MessageHandler(filters.TEXT & ~filters.COMMAND, self.server.process_chat_message)]},
             fallbacks=[
                 CommandHandler("cancel", lambda u, c: reply_to_update(u, "Отправка сообщения отменена")),
-                CallbackQueryHandler(lambda u, c: reply_to_update(u, "Отправка сообщения отменена"), pattern="^cancel$")
+                self.router.entry("cancel", lambda u, c: reply_to_update(u, "Отправка сообщения отменена"))
             ],
             per_message=False
         )
 
+    def _create_private_message_handler(self):
+        """Создание обработчика приватных сообщений игроку: выбор игрока онлайн, затем текст"""
+        return ConversationHandler(
+            entry_points=[self.router.entry("server_private_msg", self.server.start_private_message)],
+            states={
+                "privmsg_select_player": [self.router.entry("privmsg", self.server.select_player_for_message, str)],
+                "privmsg_enter_text": [
+                    MessageHandler(filters.TEXT & ~filters.COMMAND, self.server.send_private_message)]
+            },
+            fallbacks=[
+                CommandHandler("cancel", lambda u, c: reply_to_update(u, "Отправка сообщения отменена")),
+                self.router.entry("cancel", lambda u, c: reply_to_update(u, "Отправка сообщения отменена"))
+            ],
+            per_message=False,
+            allow_reentry=True
+        )
+
     def _create_service_handlers(self):
         """Создание обработчиков для сервисных команд"""
-        service = Service(self)
-        return [
-            CallbackQueryHandler(service.service_menu, pattern="^admin_service$"),
-            CallbackQueryHandler(service.backup_world, pattern="^service_backup$"),
-            CallbackQueryHandler(service.start_server, pattern="^service_start$"),
-            CallbackQueryHandler(service.restart_server, pattern="^service_restart$"),
-            CallbackQueryHandler(service.stop_server, pattern="^service_stop$")
-        ]
+        service = self.service
+        route = self.router.route
+        route("admin_service", service.service_menu)
+        route("service_backup", service.backup_world)
+        route("service_backup_status", service.backup_status)
+        route("service_backup_cancel", service.backup_cancel)
+        route("service_start", service.start_server)
+        route("service_restart", service.restart_server)
+        route("service_stop", service.stop_server)
+        route("service_logging_on", service.logging_on)
+        route("service_logging_off", service.logging_off)
+        return [service._create_command_handler()]
 
     async def check_active_sessions(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
         """Проверяет и завершает активные сессии перед началом нового диалога"""
@@ -502,7 +1145,7 @@ class Registration:
             user_id = update.effective_user.id
             self.logger.info(f"Попытка регистрации пользователя {user_id}")
             # Проверяем текущий статус пользователя
-            user = Database.get_user(user_id)
+            user = await db.get_user(user_id)
             if user:
                 if user['approved']:
                     msg = (
@@ -538,7 +1181,7 @@ class Registration:
             nick = update.message.text.strip()
             self.logger.info(f"Пользователь {update.effective_user.id} ввел ник: {nick}")
             # Используем метод валидации
-            is_valid, message = self.validate_nickname(nick)
+            is_valid, message = await self.validate_nickname(nick)
             if not is_valid:
                 await reply_to_update(update, message)
                 return Config.REG_NICK
@@ -562,7 +1205,7 @@ class Registration:
             ip = update.message.text.strip()
             self.logger.info(f"Пользователь {update.effective_user.id} ввел IP: {ip}")
             # Используем метод валидации IP
-            is_valid, message = self.validate_ip(ip)
+            is_valid, message = await self.validate_ip(ip)
             if not is_valid:
                 await reply_to_update(update, message)
                 return Config.REG_IP
@@ -593,17 +1236,22 @@ class Registration:
             user_id = data['reg_user_id']
             self.logger.info(f"Подтверждение регистрации пользователя {user_id}")
             # Проверка существующей регистрации
-            if Database.get_user(user_id):
+            if await db.get_user(user_id):
                 self.logger.warning(f"Попытка повторной регистрации пользователя {user_id}")
                 await reply_to_update(update, "⚠️ Вы уже зарегистрированы!")
                 return ConversationHandler.END
             # Сохраняем пользователя
-            Database.add_user(
-                user_id,
-                data['reg_username'],
-                data['reg_nick'],
-                data['reg_ip']
-            )
+            try:
+                await db.add_user(
+                    user_id,
+                    data['reg_username'],
+                    data['reg_nick'],
+                    data['reg_ip']
+                )
+            except sqlite3.IntegrityError:
+                # Ник успели занять между проверкой и сохранением
+                await reply_to_update(update, "⚠️ Этот ник уже занят. Начните регистрацию заново: /reg")
+                return ConversationHandler.END
             self.logger.info(
                 f"Пользователь {user_id} добавлен в базу данных (ник: {data['reg_nick']}, IP: {data['reg_ip']})")
             # Формируем сообщение для админов
@@ -616,7 +1264,7 @@ class Registration:
             )
             # Уведомляем админов
             self.logger.info(f"Отправка уведомления админам о новой заявке от пользователя {user_id}")
-            await self.bot.admin.notify_admins(admin_msg, user_id)
+            self.bot.admin.notify_admins(admin_msg, user_id, data['reg_nick'])
             # Ответ пользователю
             await reply_to_update(update,
                                   "✅ Заявка на регистрацию отправлена!\n"
@@ -640,7 +1288,7 @@ class Registration:
             return ConversationHandler.END
 
     @staticmethod
-    def validate_nickname(nick: str) -> tuple[bool, str]:
+    async def validate_nickname(nick: str) -> tuple[bool, str]:
         """Валидация ника пользователя"""
         nick = nick.strip().lower()
         if not nick:
@@ -649,17 +1297,17 @@ class Registration:
             return False, "Ник должен быть от 3 до 16 символов. Попробуйте еще раз:"
         if not re.match(r'^[a-z0-9_]+$', nick):
             return False, "Ник может содержать только латинские буквы, цифры и подчеркивания. Попробуйте еще раз:"
-        if not Registration.is_nick_unique(nick):
+        if not await db.is_nick_unique(nick):
             return False, "Этот ник уже занят. Пожалуйста, выберите другой:"
         return True, nick
 
     @staticmethod
-    def validate_ip(ip: str) -> tuple[bool, str]:
+    async def validate_ip(ip: str) -> tuple[bool, str]:
         """Валидация IP-адреса (IPv4 и IPv6) с проверкой на спец. адреса"""
         ip = ip.strip()
         if not ip:
             return False, "IP-адрес не может быть пустым. Пожалуйста, введите ваш IP:"
-        if not Registration.is_ip_unique(ip):
+        if not await db.is_ip_unique(ip):
             return False, "Этот IP уже используется. Введите другой."
         try:
             ip_obj = ipaddress.ip_address(ip)
@@ -675,22 +1323,6 @@ class Registration:
                 return False, "Неверный формат IPv6. Пример: 2001:0db8:85a3::8a2e:0370:7334"
         return True, ip
 
-    @staticmethod
-    def is_nick_unique(nick: str) -> bool:
-        """Проверка уникальности ника"""
-        with sqlite3.connect(Config.DB_PATH) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT 1 FROM users WHERE ingame_nick = ?", (nick.lower(),))
-            return cursor.fetchone() is None
-
-    @staticmethod
-    def is_ip_unique(ip: str) -> bool:
-        """Проверка уникальности IP"""
-        with sqlite3.connect(Config.DB_PATH) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT 1 FROM users WHERE ip = ?", (ip,))
-            return cursor.fetchone() is None
-
 
 # ==================== ПОЛЬЗОВАТЕЛЬ ====================
 class User:
@@ -713,7 +1345,7 @@ class User:
     async def edit_nick_save(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Сохранение нового ника с очисткой старых данных и приведением к нижнему регистру"""
         user_id = update.effective_user.id
-        user_data = Database.get_user(user_id)
+        user_data = await db.get_user(user_id)
         if not user_data:
             await reply_to_update(update, "⚠️ Пользователь не найден")
             return ConversationHandler.END
@@ -728,26 +1360,27 @@ class User:
             return Config.EDIT_NICK
 
         # Валидация нового ника (уже в нижнем регистре)
-        is_valid, message = Registration.validate_nickname(new_nick)
+        is_valid, message = await Registration.validate_nickname(new_nick)
         if not is_valid:
             await reply_to_update(update, message)
             return Config.EDIT_NICK
 
-        # Очищаем старые данные
-        WhitelistManager.remove_from_whitelist(old_nick)
-
         # Обновляем данные (сохраняем в нижнем регистре)
-        Database.update_user(user_id, ingame_nick=new_nick)
+        try:
+            await db.update_user(user_id, ingame_nick=new_nick)
+        except sqlite3.IntegrityError:
+            await reply_to_update(update, "Этот ник уже занят. Пожалуйста, выберите другой:")
+            return Config.EDIT_NICK
 
-        # Если пользователь одобрен - добавляем новые данные
+        # Если пользователь одобрен - заменяем ник в whitelist одной записью и перезагрузкой
         if user_data['approved']:
-            # WhitelistManager.add_to_whitelist(new_nick)
+            await WhitelistManager.apply_whitelist(add=[new_nick], remove=[old_nick])
 
             # Уведомляем админов (показываем оригинальный ввод)
             admin_msg = (f"ℹ️ Пользователь {user_data['tg_username']} (ID: {user_id}) изменил ник:\n"
                          f"Старый: {old_nick}\n"
                          f"Новый: {raw_nick} (сохранён как: {new_nick})")
-            await self.bot.admin._notify_admins_simple(context, admin_msg)
+            self.bot.admin._notify_admins_simple(context, admin_msg)
 
         await reply_to_update(
             update,
@@ -771,7 +1404,7 @@ class User:
     async def edit_ip_save(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Сохранение нового IP с очисткой старых правил"""
         user_id = update.effective_user.id
-        user_data = Database.get_user(user_id)
+        user_data = await db.get_user(user_id)
         if not user_data:
             await reply_to_update(update, "⚠️ Пользователь не найден")
             return ConversationHandler.END
@@ -780,25 +1413,22 @@ class User:
         new_ip = update.message.text.strip()
 
         # Валидация нового IP
-        is_valid, message = Registration.validate_ip(new_ip)
+        is_valid, message = await Registration.validate_ip(new_ip)
         if not is_valid:
             await reply_to_update(update, message)
             return Config.EDIT_IP
 
-        # Очищаем старые правила
-        WhitelistManager.manage_ufw_rules(old_ip, 'remove')
-
         # Обновляем данные
-        Database.update_user(user_id, ip=new_ip)
+        await db.update_user(user_id, ip=new_ip)
 
-        # Если пользователь одобрен - добавляем новые правила
+        # Если пользователь одобрен - заменяем IP в firewall
         if user_data['approved']:
-            # WhitelistManager.manage_ufw_rules(new_ip, 'add')
+            await WhitelistManager.apply_firewall(add=[new_ip], remove=[old_ip])
 
             # Уведомляем админов
             admin_msg = (f"ℹ️ Пользователь {user_data['tg_username']} (ID: {user_id}) изменил IP:\n"
                          f"Старый: {old_ip}\nНовый: {new_ip}")
-            await self.bot.admin._notify_admins_simple(context, admin_msg)
+            self.bot.admin._notify_admins_simple(context, admin_msg)
 
         await reply_to_update(update, f"✅ IP успешно изменён на: {new_ip}")
         return ConversationHandler.END
@@ -810,7 +1440,7 @@ class User:
 
     async def unreg_start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Начало удаления регистрации"""
-        user = Database.get_user(update.effective_user.id)
+        user = await db.get_user(update.effective_user.id)
         if not user:
             await reply_to_update(update, "Вы не зарегистрированы!")
             return
@@ -834,7 +1464,7 @@ class User:
         query = update.callback_query
         await query.answer()
         user_id = update.effective_user.id
-        user_data = Database.get_user(user_id)
+        user_data = await db.get_user(user_id)
         if not user_data:
             self.logger.warning(f"Попытка удаления несуществующего пользователя {user_id}")
             await reply_to_update(update, "⚠️ Ваш аккаунт не найден!")
@@ -843,20 +1473,12 @@ class User:
         nick = user_data['ingame_nick']
         ip = user_data['ip']
         self.logger.info(f"Удаление регистрации пользователя {user_id} ({nick})")
-        Database.delete_user(user_id)
-        WhitelistManager.remove_from_whitelist(nick)
-        WhitelistManager.manage_ufw_rules(ip, 'remove')
+        await db.delete_user(user_id)
+        await WhitelistManager.full_cleanup(nick, ip)
         # Уведомление админов
         admin_message = f"❌ Пользователь {nick} удалил свою регистрацию"
         self.logger.info(f"Отправка уведомления админам об удалении пользователя {nick}")
-        try:
-            for admin_id in Config.ADMIN_IDS:
-                await context.bot.send_message(
-                    chat_id=admin_id,
-                    text=admin_message
-                )
-        except Exception as e:
-            self.logger.error(f"Ошибка уведомления админов: {e}")
+        self.bot.admin._notify_admins_simple(context, admin_message)
 
         await reply_to_update(update,
                               "✅ Ваша регистрация полностью удалена.\n"
@@ -866,7 +1488,7 @@ class User:
         """Проверка статуса регистрации"""
         query = update.callback_query
         await query.answer()
-        user = Database.get_user(update.effective_user.id)
+        user = await db.get_user(update.effective_user.id)
         if not user:
             text = "Вы не зарегистрированы. Используйте /reg для регистрации."
         elif user['approved']:
@@ -880,8 +1502,8 @@ class User:
 class Admin:
     def __init__(self, bot):
         self.bot = bot
-        self.server = Server(bot)
-        self.service = Service(bot)
+        self.server = bot.server
+        self.service = bot.service
         self.logger = logging.getLogger(__name__)
 
     async def _validate_admin(self, update: Update) -> bool:
@@ -907,40 +1529,48 @@ class Admin:
             [InlineKeyboardButton("⚙️ Серверные функции", callback_data="admin_server")],
             [InlineKeyboardButton("🔧 Сервисные функции", callback_data="admin_service")],
             [InlineKeyboardButton("📢 Рассылка", callback_data="admin_broadcast")],
+            [InlineKeyboardButton("🧮 Сверка whitelist и firewall", callback_data="admin_reconcile")],
             [InlineKeyboardButton("❌ Выход в основное меню", callback_data="start")]
         ]
         await reply_to_update(update, "🔐 Админ-панель:", create_keyboard(buttons))
 
-    async def notify_admins(self, message: str, user_id: int):
-        """Уведомление админов с кнопками одобрения/отклонения"""
-        buttons = [
-            [InlineKeyboardButton("✅ Одобрить", callback_data=f"admin_approve_{user_id}")],
-            [InlineKeyboardButton("❌ Отклонить", callback_data=f"admin_reject_{user_id}")]
-        ]
-        reply_markup = InlineKeyboardMarkup(buttons)
+    async def reconcile_report(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Пробная сверка: какие изменения нужны, чтобы whitelist и firewall совпали с базой"""
+        if not await self._validate_admin(update):
+            return
+        await update.callback_query.answer()
+        plan = await self.bot.reconciler.plan(prune=False)
+        buttons = []
+        if not plan.empty:
+            buttons.append([InlineKeyboardButton("➕ Добавить недостающих",
+                                                 callback_data=pack("admin_reconcile_apply", "add"))])
+        if plan.extras:
+            buttons.append([InlineKeyboardButton("🧹 Применить и удалить лишних",
+                                                 callback_data=pack("admin_reconcile_apply", "prune"))])
+        buttons.append([InlineKeyboardButton("🔙 Назад", callback_data="admin_back")])
+        await reply_to_update(update, plan.format(), create_keyboard(buttons))
 
-        for admin_id in Config.ADMIN_IDS:
-            try:
-                await self.bot.application.bot.send_message(
-                    chat_id=admin_id,
-                    text=message,
-                    reply_markup=reply_markup,
-                    parse_mode="HTML"
-                )
-            except Exception as e:
-                logger.error(f"Ошибка уведомления админа {admin_id}: {e}")
+    async def reconcile_apply(self, update: Update, context: ContextTypes.DEFAULT_TYPE, mode: str):
+        """Сверка с применением (расхождения вычисляются заново на момент нажатия).
 
-    async def _notify_admins_simple(self, context: ContextTypes.DEFAULT_TYPE, message: str):
+        Лишние записи удаляются только по кнопке prune
+        """
+        if not await self._validate_admin(update):
+            return
+        await update.callback_query.answer()
+        plan = await self.bot.reconciler.apply(prune=mode == "prune")
+        await reply_to_update(update, plan.format(applied=True),
+                              create_keyboard([InlineKeyboardButton("🔙 Назад", callback_data="admin_back")]))
+
+    def notify_admins(self, message: str, user_id: int, nick: str):
+        """Уведомление админов с кнопками одобрения/отклонения (заявки подряд приходят одной сводкой)"""
+        buttons = [[InlineKeyboardButton(f"✅ Одобрить {nick}", callback_data=pack("admin_decision", "approve", user_id)),
+                    InlineKeyboardButton(f"❌ Отклонить {nick}", callback_data=pack("admin_decision", "reject", user_id))]]
+        self.bot.notifier.notify(message, buttons)
+
+    def _notify_admins_simple(self, context: ContextTypes.DEFAULT_TYPE, message: str):
         """Уведомление админов без кнопок"""
-        for admin_id in Config.ADMIN_IDS:
-            try:
-                await context.bot.send_message(
-                    chat_id=admin_id,
-                    text=message,
-                    parse_mode="HTML"
-                )
-            except Exception as e:
-                logger.error(f"Ошибка уведомления админа {admin_id}: {e}")
+        self.bot.notifier.notify(message)
 
     async def list_pending_requests(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Список заявок на регистрацию"""
@@ -948,73 +1578,23 @@ class Admin:
             return
         query = update.callback_query
         await query.answer()
-        pending_users = Database.list_users(approved=False)
-        if not pending_users:
-            await reply_to_update(update, "❌ Нет заявок на одобрение")
-            return
-        buttons = []
-        for user in pending_users:
-            buttons.append(
-                [InlineKeyboardButton(f"👤 {user[2]} (ID: {user[0]})", callback_data=f"admin_user_{user[0]}")])
-        buttons.append([InlineKeyboardButton("🔙 Назад", callback_data="admin_back")])
-        buttons.append([InlineKeyboardButton("🏠 В основное меню", callback_data="start")])
-        await reply_to_update(update, "📝 Заявки на одобрение:", create_keyboard(buttons))
+        context.user_data.get('admin_search', {}).pop("pending", None)
+        context.user_data.pop('admin_selected', None)
+        await self._show_user_page(update, context, "pending")
 
-    async def handle_approve_reject(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Обработка кнопок одобрения/отклонения"""
+    async def handle_approve_reject(self, update: Update, context: ContextTypes.DEFAULT_TYPE, action: str, user_id: int):
+        """Обработка кнопок одобрения/отклонения (admin_decision:<approve|reject>:<tg_id>)"""
         query = update.callback_query
         await query.answer()
 
         try:
-            # Разбираем callback_data формата "admin_approve_123" или "admin_reject_123"
-            if not query.data or '_' not in query.data:
-                logger.error(f"Неверный формат callback_data: {query.data}")
+            rows, problems = await self._decide_pending(context, [user_id], action == "approve")
+            if not rows:
+                await self._close_request(query, user_id, "⚠️ Заявка не найдена или уже обработана")
                 return
-
-            action, user_id = query.data.split('_')[1], query.data.split('_')[2]
-            user_id = int(user_id)
-
-            user_data = Database.get_user(user_id)
-            if not user_data:
-                await query.edit_message_text("⚠️ Пользователь не найден")
-                return
-
-            if action == "approve":
-                # Процесс одобрения
-                Database.update_user(user_id, approved=1)
-                WhitelistManager.add_to_whitelist(user_data['ingame_nick'])
-                WhitelistManager.manage_ufw_rules(user_data['ip'], 'add')
-
-                await query.edit_message_text(f"✅ Пользователь {user_data['ingame_nick']} одобрен")
-
-                # Уведомляем пользователя
-                try:
-                    await context.bot.send_message(
-                        chat_id=user_id,
-                        text="🎉 Ваша заявка одобрена! Теперь вы можете играть на сервере."
-                    )
-                except Exception as e:
-                    logger.error(f"Не удалось уведомить пользователя: {e}")
-
-            elif action == "reject":
-                # Процесс отклонения
-                nick = user_data['ingame_nick']
-                ip = user_data['ip']
-
-                Database.delete_user(user_id)
-                WhitelistManager.remove_from_whitelist(nick)
-                WhitelistManager.manage_ufw_rules(ip, 'remove')
-
-                await query.edit_message_text(f"❌ Заявка {nick} отклонена")
-
-                # Уведомляем пользователя
-                try:
-                    await context.bot.send_message(
-                        chat_id=user_id,
-                        text="⚠️ Ваша заявка на регистрацию была отклонена администратором."
-                    )
-                except Exception as e:
-                    logger.error(f"Не удалось уведомить пользователя: {e}")
+            nick = rows[0][1]
+            text = f"✅ Пользователь {nick} одобрен" if action == "approve" else f"❌ Заявка {nick} отклонена"
+            await self._close_request(query, user_id, "\n".join([text, *problems]))
 
         except Exception as e:
             logger.error(f"Ошибка обработки заявки: {e}", exc_info=True)
@@ -1023,24 +1603,195 @@ class Admin:
             except:
                 pass
 
+    @staticmethod
+    async def _close_request(query, user_id, text):
+        """Итог по заявке: в сводке из нескольких заявок убираются только её кнопки, иначе заменяется сообщение"""
+        own = {pack("admin_decision", action, user_id) for action in ("approve", "reject")}
+        markup = query.message.reply_markup if query.message else None
+        rows = [row for row in markup.inline_keyboard if not own & {button.callback_data for button in row}] \
+            if markup else []
+        if not rows:
+            await query.edit_message_text(text)
+            return
+        await query.edit_message_reply_markup(InlineKeyboardMarkup(rows))
+        await query.message.reply_text(text)
+
+    async def _decide_pending(self, context, user_ids, approve):
+        """Одобрение или отклонение заявок пачкой: одна транзакция в базе, одно изменение whitelist и firewall,
+        одновременные уведомления пользователей. Возвращает (обработанные строки, тексты ошибок)"""
+        rows = await db.decide_pending(user_ids, approve)
+        if not rows:
+            return [], []
+        nicks = [nick for _, nick, _ in rows]
+        ips = [ip for _, _, ip in rows if ip]
+        if approve:
+            results = [await WhitelistManager.apply_whitelist(add=nicks),
+                       await WhitelistManager.apply_firewall(add=ips)]
+            text = "🎉 Ваша заявка одобрена! Теперь вы можете играть на сервере."
+        else:
+            results = [await WhitelistManager.apply_whitelist(remove=nicks),
+                       await WhitelistManager.apply_firewall(remove=ips)]
+            text = "⚠️ Ваша заявка на регистрацию была отклонена администратором."
+        await send_many(lambda chat_id: context.bot.send_message(chat_id=chat_id, text=text), [row[0] for row in rows])
+        return rows, [f"⚠️ {message}" for success, message in results if not success]
+
+    async def toggle_select_mode(self, update: Update, context: ContextTypes.DEFAULT_TYPE, mode: str):
+        """Включение/выключение выбора нескольких заявок в списке"""
+        if not await self._validate_admin(update):
+            return
+        query = update.callback_query
+        await query.answer()
+        if mode == "on":
+            context.user_data['admin_selected'] = set()
+        else:
+            context.user_data.pop('admin_selected', None)
+        await self._show_current_page(update, context, "pending")
+
+    async def toggle_selected(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int = None):
+        """Отметка заявки (admin_sel:<tg_id>) или всех заявок страницы (admin_sel_page)"""
+        if not await self._validate_admin(update):
+            return
+        query = update.callback_query
+        await query.answer()
+        selected = context.user_data.setdefault('admin_selected', set())
+        if user_id is None:
+            page_ids = set(context.user_data.get('admin_page_ids', ()))
+            # Все отмечены - снимаем отметки страницы, иначе отмечаем всю страницу
+            if page_ids <= selected:
+                selected -= page_ids
+            else:
+                selected |= page_ids
+        else:
+            selected ^= {user_id}
+        await self._show_current_page(update, context, "pending")
+
+    async def handle_bulk_decision(self, update: Update, context: ContextTypes.DEFAULT_TYPE, action: str):
+        """Одобрение или отклонение всех отмеченных заявок"""
+        if not await self._validate_admin(update):
+            return
+        query = update.callback_query
+        selected = context.user_data.get('admin_selected')
+        if not selected:
+            await query.answer("Не отмечено ни одной заявки", show_alert=True)
+            return
+        await query.answer()
+        approve = action == "approve"
+        rows, problems = await self._decide_pending(context, sorted(selected), approve)
+        context.user_data.pop('admin_selected', None)
+        nicks = ", ".join(nick for _, nick, _ in rows)
+        text = (f"✅ Одобрено заявок: {len(rows)}" if approve else f"❌ Отклонено заявок: {len(rows)}") + \
+            (f"\n{nicks}" if nicks else "")
+        if len(rows) < len(selected):
+            text += f"\nУже обработаны ранее: {len(selected) - len(rows)}"
+        buttons = [[InlineKeyboardButton("📝 К заявкам", callback_data="admin_list_pending")],
+                   [InlineKeyboardButton("🔙 Назад", callback_data="admin_back")]]
+        await reply_to_update(update, "\n".join([text, *problems]), create_keyboard(buttons))
+
     async def list_users(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Список всех пользователей"""
         if not await self._validate_admin(update):
             return
         query = update.callback_query
         await query.answer()
-        users = Database.list_users(approved=True)
-        if not users:
-            await reply_to_update(update, "Нет зарегистрированных пользователей")
+        context.user_data.get('admin_search', {}).pop("users", None)
+        await self._show_user_page(update, context, "users")
+
+    # Списки админа: (одобрены ли пользователи, заголовок, текст пустого списка, подпись кнопки пользователя)
+    USER_LISTS = {
+        "users": (True, "Зарегистрированные пользователи", "Нет зарегистрированных пользователей",
+                  lambda user: f"{user[1]} (ID: {user[0]})"),
+        "pending": (False, "📝 Заявки на одобрение", "❌ Нет заявок на одобрение",
+                    lambda user: f"👤 {user[2]} (ID: {user[0]})"),
+    }
+
+    async def _show_user_page(self, update, context, kind, cursor=None, backward=False):
+        """Страница списка пользователей с кнопками листания и поиска по началу username"""
+        approved, title, empty_text, label = self.USER_LISTS[kind]
+        prefix = context.user_data.get('admin_search', {}).get(kind)
+        users, has_prev, has_next = await db.page_users(approved, cursor, backward, prefix)
+        if not users and not prefix:
+            await reply_to_update(update, empty_text)
             return
-        buttons = []
-        for user in users:
-            buttons.append([
-                InlineKeyboardButton(f"{user[1]} (ID: {user[0]})", callback_data=f"admin_user_{user[0]}")])
-        buttons.append([InlineKeyboardButton("◀️ Назад", callback_data="admin_back")])
+        context.user_data.setdefault('admin_page', {})[kind] = (cursor, backward)
+        selected = context.user_data.get('admin_selected') if kind == "pending" else None
+        if selected is None:
+            buttons = [[InlineKeyboardButton(label(user), callback_data=pack("admin_user", user[0]))] for user in users]
+        else:
+            # Режим выбора: нажатие отмечает заявку вместо открытия меню пользователя
+            context.user_data['admin_page_ids'] = [user[0] for user in users]
+            buttons = [[InlineKeyboardButton(f"{'☑️' if user[0] in selected else '⬜'} {user[2]} (ID: {user[0]})",
+                                             callback_data=pack("admin_sel", user[0]))] for user in users]
+        nav = []
+        if has_prev:
+            nav.append(InlineKeyboardButton("⬅️", callback_data=pack("admin_page", kind, "prev", users[0][0])))
+        if has_next:
+            nav.append(InlineKeyboardButton("➡️", callback_data=pack("admin_page", kind, "next", users[-1][0])))
+        if nav:
+            buttons.append(nav)
+        if selected is not None:
+            buttons.append([InlineKeyboardButton("☑️ Вся страница", callback_data="admin_sel_page")])
+            buttons.append([InlineKeyboardButton(f"✅ Одобрить ({len(selected)})", callback_data=pack("admin_bulk", "approve")),
+                            InlineKeyboardButton(f"❌ Отклонить ({len(selected)})", callback_data=pack("admin_bulk", "reject"))])
+            buttons.append([InlineKeyboardButton("✖️ Отменить выбор", callback_data=pack("admin_select", "off"))])
+        elif kind == "pending":
+            buttons.append([InlineKeyboardButton("☑️ Выбрать несколько", callback_data=pack("admin_select", "on"))])
+        if prefix:
+            buttons.append([InlineKeyboardButton("✖️ Сбросить поиск", callback_data=pack("admin_findreset", kind))])
+        else:
+            buttons.append([InlineKeyboardButton("🔍 Поиск по username", callback_data=pack("admin_find", kind))])
+        buttons.append([InlineKeyboardButton("🔙 Назад", callback_data="admin_back")])
         buttons.append([InlineKeyboardButton("🏠 В основное меню", callback_data="start")])
-        kb = create_keyboard(buttons)
-        await reply_to_update(update, "Зарегистрированные пользователи:", kb)
+        text = f"{title}:"
+        if prefix:
+            text = f"{title} (username на «{prefix}»):" if users else f"🔍 Ничего не найдено по «{prefix}»"
+        await reply_to_update(update, text, create_keyboard(buttons))
+
+    async def _show_current_page(self, update, context, kind):
+        """Повторный показ последней открытой страницы списка"""
+        cursor, backward = context.user_data.get('admin_page', {}).get(kind, (None, False))
+        await self._show_user_page(update, context, kind, cursor, backward)
+
+    async def handle_user_page(self, update: Update, context: ContextTypes.DEFAULT_TYPE, kind: str, direction: str,
+                               cursor: int):
+        """Листание списков пользователей: admin_page:<список>:<next|prev>:<tg_id>"""
+        if not await self._validate_admin(update):
+            return
+        query = update.callback_query
+        await query.answer()
+        await self._show_user_page(update, context, kind, cursor, backward=direction == "prev")
+
+    async def start_user_search(self, update: Update, context: ContextTypes.DEFAULT_TYPE, kind: str):
+        """Запрос начала username для поиска в списке"""
+        if not await self._validate_admin(update):
+            return ConversationHandler.END
+        query = update.callback_query
+        await query.answer()
+        context.user_data['admin_search_kind'] = kind
+        await reply_to_update(update, "🔍 Введите начало username (или /cancel для отмены):")
+        return "admin_search_input"
+
+    async def process_user_search(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Показ первой страницы списка, отфильтрованной по началу username"""
+        kind = context.user_data.pop('admin_search_kind', "users")
+        prefix = update.message.text.strip().lstrip('@').lower()
+        if prefix:
+            context.user_data.setdefault('admin_search', {})[kind] = prefix
+        await self._show_user_page(update, context, kind)
+        return ConversationHandler.END
+
+    async def cancel_user_search(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        kind = context.user_data.pop('admin_search_kind', "users")
+        await self._show_user_page(update, context, kind)
+        return ConversationHandler.END
+
+    async def reset_user_search(self, update: Update, context: ContextTypes.DEFAULT_TYPE, kind: str):
+        """Сброс поиска и возврат к первой странице списка"""
+        if not await self._validate_admin(update):
+            return
+        query = update.callback_query
+        await query.answer()
+        context.user_data.get('admin_search', {}).pop(kind, None)
+        await self._show_user_page(update, context, kind)
 
     async def start_broadcast(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Начинаем процесс рассылки"""
@@ -1050,32 +1801,67 @@ class Admin:
         await reply_to_update(update, "✍️ Введите сообщение для рассылки:")
 
     async def process_broadcast(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Обрабатываем сообщение для рассылки"""
+        """Обрабатываем сообщение для рассылки: отправка идёт в фоне, прогресс - в одном сообщении"""
         if not context.user_data.get('is_broadcasting'):
             return
         context.user_data['is_broadcasting'] = False
-        message = update.message.text
-        users = Database.list_users(approved=True)
-        success_count = 0
-        for user in users:
-            try:
-                await context.bot.send_message(user[0], f"🔔 Сообщение от администратора:\n{message}")
-                success_count += 1
-            except Exception as e:
-                logger.error(f"Не удалось отправить сообщение пользователю {user[0]}: {e}")
-        await reply_to_update(update, f"✅ Сообщение отправлено {success_count} из {len(users)} пользователей")
+        success, result = await self.bot.broadcasts.start(update.effective_user.id, update.message.text)
+        if not success:
+            await reply_to_update(update, result)
+            return
+        message = await update.message.reply_text(result.format_progress(),
+                                                  reply_markup=self._broadcast_keyboard(result))
+        context.application.create_task(self._track_broadcast(result, message))
 
-    async def user_management_menu(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_id=None):
-        """Меню управления конкретным пользователем"""
+    async def report_resumed_broadcast(self, admin_id, job):
+        """Сообщение админу о рассылке, продолженной после перезапуска бота"""
+        try:
+            message = await self.bot.application.bot.send_message(admin_id, job.format_progress(),
+                                                                  reply_markup=self._broadcast_keyboard(job))
+        except Exception as e:
+            logger.warning(f"Не удалось сообщить о возобновлении рассылки #{job.id}: {e}")
+            return
+        await self._track_broadcast(job, message)
+
+    @staticmethod
+    def _broadcast_keyboard(job):
+        if not job.running:
+            return None
+        return create_keyboard([InlineKeyboardButton("⛔ Отменить", callback_data=pack("admin_broadcast_cancel", job.id))])
+
+    async def _track_broadcast(self, job, message):
+        """Обновление счётчиков доставки в сообщении до завершения рассылки"""
+        last_text = None
+        while True:
+            finished = await job.wait(timeout=Config.BROADCAST_PROGRESS_INTERVAL)
+            text = job.format_progress()
+            if text != last_text:
+                try:
+                    await message.edit_text(text, reply_markup=self._broadcast_keyboard(job))
+                    last_text = text
+                except Exception as e:
+                    logger.warning(f"Не удалось обновить прогресс рассылки: {e}")
+            if finished:
+                return
+
+    async def cancel_broadcast(self, update: Update, context: ContextTypes.DEFAULT_TYPE, broadcast_id: int):
+        """Отмена рассылки кнопкой из сообщения с прогрессом"""
         if not await self._validate_admin(update):
             return
+        success, message = self.bot.broadcasts.cancel(broadcast_id)
+        await reply_to_update(update, message, show_alert=True)
 
-        if not user_id:
-            query = update.callback_query
-            await query.answer()
-            user_id = int(query.data.split('_')[-1])
+    async def open_user_menu(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int):
+        """Кнопка пользователя в списке"""
+        await update.callback_query.answer()
+        await self.user_management_menu(update, context, user_id)
+
+    async def user_management_menu(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int):
+        """Меню управления конкретным пользователем"""
+        if not await self._validate_admin(update):
+            return
 
-        user = Database.get_user(user_id)
+        user = await db.get_user(user_id)
         if not user:
             await reply_to_update(update, "Пользователь не найден")
             return
@@ -1090,31 +1876,31 @@ class Admin:
 
         # Кнопки для всех пользователей
         buttons.extend([
-            [InlineKeyboardButton("✏️ Изменить ник", callback_data=f"admin_edit_{user_id}")],
-            [InlineKeyboardButton("🌐 Изменить IP", callback_data=f"admin_editip_{user_id}")],
-            [InlineKeyboardButton("🗑 Удалить запись", callback_data=f"admin_delete_{user_id}")],
-            [InlineKeyboardButton("📨 Отправить сообщение", callback_data=f"admin_msg_{user_id}")]
+            [InlineKeyboardButton("✏️ Изменить ник", callback_data=pack("admin_edit", user_id))],
+            [InlineKeyboardButton("🌐 Изменить IP", callback_data=pack("admin_editip", user_id))],
+            [InlineKeyboardButton("🗑 Удалить запись", callback_data=pack("admin_delete", user_id))],
+            [InlineKeyboardButton("📨 Отправить сообщение", callback_data=pack("admin_msg", user_id))]
         ])
 
         # Дополнительные кнопки для одобренных пользователей
         if user['approved']:
             buttons.extend([
-                [InlineKeyboardButton("➕ Добавить в WL", callback_data=f"wl_add_{user_id}"),
-                 InlineKeyboardButton("➖ Удалить из WL", callback_data=f"wl_remove_{user_id}")],
-                [InlineKeyboardButton("➕ Добавить UFW", callback_data=f"ufw_add_{user_id}"),
-                 InlineKeyboardButton("➖ Удалить UFW", callback_data=f"ufw_remove_{user_id}")]
+                [InlineKeyboardButton("➕ Добавить в WL", callback_data=pack("admin_access", "wl", "add", user_id)),
+                 InlineKeyboardButton("➖ Удалить из WL", callback_data=pack("admin_access", "wl", "remove", user_id))],
+                [InlineKeyboardButton("➕ Добавить UFW", callback_data=pack("admin_access", "ufw", "add", user_id)),
+                 InlineKeyboardButton("➖ Удалить UFW", callback_data=pack("admin_access", "ufw", "remove", user_id))]
             ])
         else:
             buttons.extend([
-                [InlineKeyboardButton("✅ Одобрить", callback_data=f"admin_approve_{user_id}")],
-                [InlineKeyboardButton("❌ Отклонить", callback_data=f"admin_reject_{user_id}")]
+                [InlineKeyboardButton("✅ Одобрить", callback_data=pack("admin_decision", "approve", user_id))],
+                [InlineKeyboardButton("❌ Отклонить", callback_data=pack("admin_decision", "reject", user_id))]
             ])
 
         buttons.append([InlineKeyboardButton("◀️ Назад", callback_data="admin_list_users")])
         kb = create_keyboard(buttons)
         await reply_to_update(update, text, kb)
 
-    async def handle_delete_user(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    async def handle_delete_user(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int):
         """Обработка удаления пользователя"""
         if not await self._validate_admin(update):
             return
@@ -1122,22 +1908,20 @@ class Admin:
         query = update.callback_query
         await query.answer()
 
-        user_id = int(query.data.split('_')[-1])
-        user_data = Database.get_user(user_id)
+        user_data = await db.get_user(user_id)
 
         if not user_data:
             await reply_to_update(update, "⚠️ Пользователь не найден")
             return
 
         # Полное удаление пользователя
-        Database.delete_user(user_id)
-        WhitelistManager.remove_from_whitelist(user_data['ingame_nick'])
-        WhitelistManager.manage_ufw_rules(user_data['ip'], 'remove')
+        await db.delete_user(user_id)
+        await WhitelistManager.full_cleanup(user_data['ingame_nick'], user_data['ip'])
 
         await reply_to_update(update, f"✅ Пользователь {user_data['ingame_nick']} полностью удалён")
         await self.list_users(update, context)
 
-    async def start_send_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    async def start_send_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int):
         """Начало процесса отправки сообщения пользователю"""
         if not await self._validate_admin(update):
             return
@@ -1145,8 +1929,7 @@ class Admin:
         query = update.callback_query
         await query.answer()
 
-        user_id = int(query.data.split('_')[-1])
-        user_data = Database.get_user(user_id)
+        user_data = await db.get_user(user_id)
 
         if not user_data:
             await reply_to_update(update, "⚠️ Пользователь не найден")
@@ -1179,39 +1962,37 @@ class Admin:
 
         return ConversationHandler.END
 
-    async def handle_whitelist_action(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Обработка действий с whitelist"""
+    async def handle_whitelist_action(self, update: Update, context: ContextTypes.DEFAULT_TYPE, target: str,
+                                      action: str, user_id: int):
+        """Обработка действий с whitelist и firewall (admin_access:<wl|ufw>:<add|remove>:<tg_id>)"""
         if not await self._validate_admin(update):
             return
         query = update.callback_query
         await query.answer()
-        action, user_id = query.data.split('_')[0], int(query.data.split('_')[-1])
-        user = Database.get_user(user_id)
+        user = await db.get_user(user_id)
         if not user:
             await reply_to_update(update, "Пользователь не найден")
             return
         nickname = user['ingame_nick']
         ip = user['ip']
-        if action == 'wl':
+        if target == 'wl':
             # Обработка whitelist действий
-            sub_action = query.data.split('_')[1]
-            if sub_action == 'add':
-                success, message = WhitelistManager.add_to_whitelist(nickname)
-            elif sub_action == 'remove':
-                success, message = WhitelistManager.remove_from_whitelist(nickname)
+            if action == 'add':
+                success, message = await WhitelistManager.add_to_whitelist(nickname)
+            else:
+                success, message = await WhitelistManager.remove_from_whitelist(nickname)
             await reply_to_update(update, message)
             await self.user_management_menu(update, context, user_id)
-        elif action == 'ufw':
+        else:
             # Обработка UFW действий
             if not ip:
                 await reply_to_update(update, "IP адрес не указан для этого пользователя")
                 return
-            sub_action = query.data.split('_')[1]
-            success, message = WhitelistManager.manage_ufw_rules(ip, sub_action)
+            success, message = await WhitelistManager.manage_ufw_rules(ip, action)
             await reply_to_update(update, message)
             await self.user_management_menu(update, context, user_id)
 
-    async def start_edit_nick(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    async def start_edit_nick(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int):
         """Начало процесса редактирования ника пользователя"""
         if not await self._validate_admin(update):
             return
@@ -1219,8 +2000,7 @@ class Admin:
         query = update.callback_query
         await query.answer()
 
-        user_id = int(query.data.split('_')[-1])
-        user_data = Database.get_user(user_id)
+        user_data = await db.get_user(user_id)
 
         if not user_data:
             await reply_to_update(update, "⚠️ Пользователь не найден")
@@ -1245,7 +2025,7 @@ class Admin:
             await reply_to_update(update, "⚠️ Ошибка: не найден ID пользователя")
             return ConversationHandler.END
 
-        user_data = Database.get_user(user_id)
+        user_data = await db.get_user(user_id)
         if not user_data:
             await reply_to_update(update, "⚠️ Пользователь не найден")
             return ConversationHandler.END
@@ -1255,7 +2035,7 @@ class Admin:
         old_nick = user_data['ingame_nick']
 
         # Валидация ника (уже в нижнем регистре)
-        is_valid, message = Registration.validate_nickname(new_nick)
+        is_valid, message = await Registration.validate_nickname(new_nick)
         if not is_valid:
             await reply_to_update(update, message)
             return "edit_nick"
@@ -1265,16 +2045,16 @@ class Admin:
             await reply_to_update(update, "⚠️ Новый ник не отличается от текущего")
             return "edit_nick"
 
-        # Очищаем старые данные
-        if user_data['approved']:
-            WhitelistManager.remove_from_whitelist(old_nick)
-
         # Обновляем данные (сохраняем в нижнем регистре)
-        Database.update_user(user_id, ingame_nick=new_nick)
+        try:
+            await db.update_user(user_id, ingame_nick=new_nick)
+        except sqlite3.IntegrityError:
+            await reply_to_update(update, "Этот ник уже занят. Пожалуйста, выберите другой:")
+            return "edit_nick"
 
-        # Если пользователь одобрен - добавляем новые данные
+        # Если пользователь одобрен - заменяем ник в whitelist одной записью и перезагрузкой
         if user_data['approved']:
-            # WhitelistManager.add_to_whitelist(new_nick)
+            await WhitelistManager.apply_whitelist(add=[new_nick], remove=[old_nick])
 
             # Уведомляем самого пользователя
             try:
@@ -1296,7 +2076,7 @@ class Admin:
         )
         return ConversationHandler.END
 
-    async def start_edit_ip(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    async def start_edit_ip(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int):
         """Начало процесса редактирования IP пользователя"""
         if not await self._validate_admin(update):
             return
@@ -1304,8 +2084,7 @@ class Admin:
         query = update.callback_query
         await query.answer()
 
-        user_id = int(query.data.split('_')[-1])
-        user_data = Database.get_user(user_id)
+        user_data = await db.get_user(user_id)
 
         if not user_data:
             await reply_to_update(update, "⚠️ Пользователь не найден")
@@ -1329,7 +2108,7 @@ class Admin:
             await reply_to_update(update, "⚠️ Ошибка: не найден ID пользователя")
             return ConversationHandler.END
 
-        user_data = Database.get_user(user_id)
+        user_data = await db.get_user(user_id)
         if not user_data:
             await reply_to_update(update, "⚠️ Пользователь не найден")
             return ConversationHandler.END
@@ -1338,21 +2117,17 @@ class Admin:
         old_ip = user_data['ip']
 
         # Валидация IP
-        is_valid, message = Registration.validate_ip(new_ip)
+        is_valid, message = await Registration.validate_ip(new_ip)
         if not is_valid:
             await reply_to_update(update, message)
             return "edit_ip"
 
-        # Очищаем старые правила
-        if user_data['approved']:
-            WhitelistManager.manage_ufw_rules(old_ip, 'remove')
-
         # Обновляем данные
-        Database.update_user(user_id, ip=new_ip)
+        await db.update_user(user_id, ip=new_ip)
 
-        # Если пользователь одобрен - добавляем новые правила
+        # Если пользователь одобрен - заменяем IP в firewall
         if user_data['approved']:
-            # WhitelistManager.manage_ufw_rules(new_ip, 'add')
+            await WhitelistManager.apply_firewall(add=[new_ip], remove=[old_ip])
 
             # Уведомляем самого пользователя
             try:
@@ -1380,19 +2155,18 @@ class Admin:
             return
         query = update.callback_query
         await query.answer()
-        success, message = WhitelistManager.reload_whitelist()
+        success, message = await WhitelistManager.reload_whitelist()
         await reply_to_update(update, message)
 
     async def delete_user(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int):
         """Полное удаление пользователя администратором"""
-        user_data = Database.get_user(user_id)
+        user_data = await db.get_user(user_id)
         if not user_data:
             await reply_to_update(update, "⚠️ Пользователь не найден!")
             return
         # Полная очистка
-        WhitelistManager.remove_from_whitelist(user_data['ingame_nick'])
-        WhitelistManager.manage_ufw_rules(user_data['ip'], 'remove')
-        Database.delete_user(user_id)
+        await db.delete_user(user_id)
+        await WhitelistManager.full_cleanup(user_data['ingame_nick'], user_data['ip'])
         await reply_to_update(update, f"✅ Пользователь {user_data['ingame_nick']} полностью удалён")
         await self.list_users(update, context)
 
@@ -1411,9 +2185,16 @@ class Server:
     def __init__(self, bot):
         """Класс для управления сервером Minecraft"""
         self.bot = bot
-        self.server_module = MinecraftServer(bot)
+        self.server_module = bot.minecraft_server
         self.players_list = []  # Список игроков онлайн
 
+    def subscribe_events(self, bus):
+        """Обновление списка игроков по событиям из лога"""
+        bus.subscribe((PlayerJoined, PlayerLeft, ServerStarted, ServerStopping), self._on_players_changed)
+
+    async def _on_players_changed(self, event):
+        self.players_list = [] if isinstance(event, ServerStopping) else self.bot.log_follower.online
+
     async def server_menu(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Главное меню серверных функций"""
         menu_text = "🎮 Управление сервером Minecraft\nВыберите действие:"
@@ -1435,10 +2216,10 @@ class Server:
     # ===== ОСНОВНЫЕ МЕТОДЫ =====
     async def get_players_count(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Получение списка игроков онлайн"""
-        success, response = self.server_module.get_online_players()
+        success, response = await self.server_module.get_online_players()
         if success:
-            self.players_list = response.split(', ') if ', ' in response else [response]
-            await reply_to_update(update, f"Игроки онлайн: {response}")
+            self.players_list = response
+            await reply_to_update(update, f"Игроки онлайн ({len(response)}): {', '.join(response) or 'никого нет'}")
         else:
             await reply_to_update(update, f"Ошибка: {response}")
 
@@ -1454,7 +2235,7 @@ class Server:
             await reply_to_update(update, "Сообщение не может быть пустым!")
             return "server_chat_msg_input"
 
-        success, response = self.server_module.send_chat_message(message)
+        success, response = await self.server_module.send_chat_message(message)
         await reply_to_update(update, response if success else f"Ошибка: {response}")
         return ConversationHandler.END
 
@@ -1462,18 +2243,16 @@ class Server:
     async def get_weather_menu(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Меню управления погодой"""
         buttons = [
-            [InlineKeyboardButton("☀️ Ясно", callback_data="weather_clear")],
-            [InlineKeyboardButton("🌧 Дождь", callback_data="weather_rain")],
-            [InlineKeyboardButton("⛈ Гроза", callback_data="weather_thunder")],
+            [InlineKeyboardButton("☀️ Ясно", callback_data=pack("weather", "clear"))],
+            [InlineKeyboardButton("🌧 Дождь", callback_data=pack("weather", "rain"))],
+            [InlineKeyboardButton("⛈ Гроза", callback_data=pack("weather", "thunder"))],
             [InlineKeyboardButton("◀️ Назад", callback_data="admin_server")]
         ]
         await reply_to_update(update, "Выберите тип погоды:", create_keyboard(buttons))
 
-    async def set_weather(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    async def set_weather(self, update: Update, context: ContextTypes.DEFAULT_TYPE, weather_type: str):
         """Установка погоды"""
-        query = update.callback_query
-        weather_type = query.data.split('_')[1]
-        success, message = self.server_module.set_weather(weather_type)
+        success, message = await self.server_module.set_weather(weather_type)
         await reply_to_update(update, message)
         await self.server_menu(update, context)
 
@@ -1481,19 +2260,17 @@ class Server:
     async def get_time_menu(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Меню управления временем"""
         buttons = [
-            [InlineKeyboardButton("🌅 Утро", callback_data="time_day")],
-            [InlineKeyboardButton("🌃 Ночь", callback_data="time_night")],
-            [InlineKeyboardButton("☀️ Полдень", callback_data="time_noon")],
-            [InlineKeyboardButton("🌙 Полночь", callback_data="time_midnight")],
+            [InlineKeyboardButton("🌅 Утро", callback_data=pack("time", "day"))],
+            [InlineKeyboardButton("🌃 Ночь", callback_data=pack("time", "night"))],
+            [InlineKeyboardButton("☀️ Полдень", callback_data=pack("time", "noon"))],
+            [InlineKeyboardButton("🌙 Полночь", callback_data=pack("time", "midnight"))],
             [InlineKeyboardButton("◀️ Назад", callback_data="admin_server")]
         ]
         await reply_to_update(update, "Установить время суток:", create_keyboard(buttons))
 
-    async def set_time(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    async def set_time(self, update: Update, context: ContextTypes.DEFAULT_TYPE, time_type: str):
         """Установка времени"""
-        query = update.callback_query
-        time_type = query.data.split('_')[1]
-        success, message = self.server_module.set_time(time_type)
+        success, message = await self.server_module.set_time(time_type)
         await reply_to_update(update, message)
         await self.server_menu(update, context)
 
@@ -1501,20 +2278,18 @@ class Server:
     async def get_pvp_menu(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Меню управления PVP"""
         buttons = [
-            [InlineKeyboardButton("✅ Включить PVP", callback_data="pvp_enable")],
-            [InlineKeyboardButton("❌ Выключить PVP", callback_data="pvp_disable")],
+            [InlineKeyboardButton("✅ Включить PVP", callback_data=pack("pvp", "enable"))],
+            [InlineKeyboardButton("❌ Выключить PVP", callback_data=pack("pvp", "disable"))],
             [InlineKeyboardButton("◀️ Назад", callback_data="admin_server")]
         ]
         await reply_to_update(update, "Настройки PVP:", create_keyboard(buttons))
 
-    async def toggle_pvp(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    async def toggle_pvp(self, update: Update, context: ContextTypes.DEFAULT_TYPE, action: str):
         """Включение/выключение PVP"""
-        query = update.callback_query
-        action = query.data.split('_')[1]
         if action == "enable":
-            success, message = self.server_module.enable_pvp()
+            success, message = await self.server_module.enable_pvp()
         else:
-            success, message = self.server_module.disable_pvp()
+            success, message = await self.server_module.disable_pvp()
         await reply_to_update(update, message)
         await self.server_menu(update, context)
 
@@ -1522,40 +2297,36 @@ class Server:
     async def get_difficulty_menu(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Меню выбора сложности"""
         buttons = [
-            [InlineKeyboardButton("😊 Мирная", callback_data="difficulty_peaceful")],
-            [InlineKeyboardButton("😃 Легкая", callback_data="difficulty_easy")],
-            [InlineKeyboardButton("😐 Нормальная", callback_data="difficulty_normal")],
-            [InlineKeyboardButton("😈 Сложная", callback_data="difficulty_hard")],
+            [InlineKeyboardButton("😊 Мирная", callback_data=pack("difficulty", "peaceful"))],
+            [InlineKeyboardButton("😃 Легкая", callback_data=pack("difficulty", "easy"))],
+            [InlineKeyboardButton("😐 Нормальная", callback_data=pack("difficulty", "normal"))],
+            [InlineKeyboardButton("😈 Сложная", callback_data=pack("difficulty", "hard"))],
             [InlineKeyboardButton("◀️ Назад", callback_data="admin_server")]
         ]
         await reply_to_update(update, "Выберите сложность:", create_keyboard(buttons))
 
-    async def set_difficulty(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    async def set_difficulty(self, update: Update, context: ContextTypes.DEFAULT_TYPE, difficulty: str):
         """Установка сложности"""
-        query = update.callback_query
-        difficulty = query.data.split('_')[1]
-        success, message = self.server_module.set_difficulty(difficulty)
+        success, message = await self.server_module.set_difficulty(difficulty)
         await reply_to_update(update, message)
         await self.server_menu(update, context)
 
     # ===== МЕНЮ ПРИВАТНЫХ СООБЩЕНИЙ =====
     async def start_private_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Начало процесса отправки приватного сообщения"""
-        success, players = self.server_module.get_online_players()
+        success, players = await self.server_module.get_online_players()
         if not success or not players:
             await reply_to_update(update, "Нет игроков онлайн для отправки сообщения")
             return
-        self.players_list = players.split(', ')
-        buttons = [[InlineKeyboardButton(player, callback_data=f"privmsg_{player}")]
+        self.players_list = players
+        buttons = [[InlineKeyboardButton(player, callback_data=pack("privmsg", player))]
                    for player in self.players_list]
         buttons.append([InlineKeyboardButton("◀️ Назад", callback_data="admin_server")])
         await reply_to_update(update, "Выберите игрока:", create_keyboard(buttons))
         return "privmsg_select_player"
 
-    async def select_player_for_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    async def select_player_for_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE, player: str):
         """Обработка выбора игрока"""
-        query = update.callback_query
-        player = query.data.split('_')[1]
         context.user_data['selected_player'] = player
         await reply_to_update(update, f"Введите сообщение для игрока {player}:")
         return "privmsg_enter_text"
@@ -1564,7 +2335,7 @@ class Server:
         """Отправка приватного сообщения"""
         message = update.message.text
         player = context.user_data['selected_player']
-        success, response = self.server_module.send_private_message(player, message)
+        success, response = await self.server_module.send_private_message(player, message)
         await reply_to_update(update, response if success else f"Ошибка: {response}")
         return ConversationHandler.END
 
@@ -1580,11 +2351,11 @@ class Server:
 
     async def start_ban_player(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Начало процесса блокировки игрока"""
-        registered_users = Database.list_users(approved=True)
+        registered_users = await db.list_users(approved=True)
         if not registered_users:
             await reply_to_update(update, "Нет зарегистрированных игроков")
             return
-        buttons = [[InlineKeyboardButton(f"{user[2]} (ID: {user[0]})", callback_data=f"ban_{user[0]}")]
+        buttons = [[InlineKeyboardButton(f"{user[2]} (ID: {user[0]})", callback_data=pack("ban", user[0]))]
                    for user in registered_users]
         buttons.append([InlineKeyboardButton("◀️ Назад", callback_data="ban_menu")])
         await reply_to_update(update, "Выберите игрока для блокировки:", create_keyboard(buttons))
@@ -1592,42 +2363,38 @@ class Server:
     async def start_unban_player(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Начало процесса разблокировки игрока"""
         # Здесь нужно получить список забаненных игроков с сервера
-        success, banned_players = self.server_module.get_banned_players()
+        success, banned_players = await self.server_module.get_banned_players()
         if not success:
             await reply_to_update(update, f"Ошибка получения списка забаненных: {banned_players}")
             return
         if not banned_players:
             await reply_to_update(update, "Нет забаненных игроков")
             return
-        buttons = [[InlineKeyboardButton(player, callback_data=f"unban_{player}")]
+        buttons = [[InlineKeyboardButton(player, callback_data=pack("unban", player))]
                    for player in banned_players]
         buttons.append([InlineKeyboardButton("◀️ Назад", callback_data="ban_menu")])
         await reply_to_update(update, "Выберите игрока для разблокировки:", create_keyboard(buttons))
 
-    async def ban_player(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    async def ban_player(self, update: Update, context: ContextTypes.DEFAULT_TYPE, user_id: int):
         """Блокировка выбранного игрока"""
-        query = update.callback_query
-        user_id = int(query.data.split('_')[1])
-        user = Database.get_user(user_id)
+        user = await db.get_user(user_id)
         if not user:
             await reply_to_update(update, "Игрок не найден в базе данных!")
             return
-        success, response = self.server_module.ban_player(user['ingame_nick'])
+        success, response = await self.server_module.ban_player(user['ingame_nick'])
         await reply_to_update(update, response)
         await self.start_ban_menu(update, context)
 
-    async def unban_player(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+    async def unban_player(self, update: Update, context: ContextTypes.DEFAULT_TYPE, player_name: str):
         """Разблокировка выбранного игрока"""
-        query = update.callback_query
-        player_name = query.data.split('_')[1]
-        success, response = self.server_module.unban_player(player_name)
+        success, response = await self.server_module.unban_player(player_name)
         await reply_to_update(update, response)
         await self.start_ban_menu(update, context)
 
     # ===== ДРУГИЕ МЕТОДЫ =====
     async def reload_whitelist(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Перезагрузка whitelist"""
-        success, message = WhitelistManager.reload_whitelist()
+        success, message = await WhitelistManager.reload_whitelist()
         await reply_to_update(update, message)
 
 
@@ -1635,15 +2402,31 @@ class Server:
 class Service:
     def __init__(self, bot):
         self.bot = bot
-        self.server_service = ServerService(bot)
+        self.server_service = bot.server_service
         self.logging_enabled = True
+        self._last_lag_notify = 0.0
+
+    def subscribe_events(self, bus):
+        """Уведомления админов о запуске, остановке и перегрузке сервера"""
+        bus.subscribe((ServerStarted, ServerStopping, ServerLagging), self._on_server_state)
+
+    async def _on_server_state(self, event):
+        if isinstance(event, ServerStarted):
+            text = f"🟢 Сервер запущен (загрузка {event.startup_seconds:.1f} сек)"
+        elif isinstance(event, ServerStopping):
+            text = "🔴 Сервер останавливается"
+        else:
+            if time.monotonic() - self._last_lag_notify < Config.LAG_NOTIFY_INTERVAL:
+                return
+            self._last_lag_notify = time.monotonic()
+            text = f"🐢 Сервер не успевает: отставание {event.behind_ms} мс ({event.behind_ticks} тиков)"
+        self.bot.notifier.notify(text)
 
     async def service_menu(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Меню сервисных функций"""
         try:
-            stats = self.bot.server_service.get_server_stats()
-            uptime = self.get_server_uptime()
-            world_size = self.bot.server_service.get_world_size()
+            snapshot = await self.bot.metrics.get_snapshot()
+            stats, uptime, world_size = snapshot["stats"], snapshot["uptime"], snapshot["world_size"]
         except Exception as e:
             stats = {"status": "Ошибка получения данных", "cpu": "N/A", "ram": "N/A", "tps": "N/A"}
             uptime = f"⚠️ Ошибка: {str(e)}"
@@ -1657,6 +2440,7 @@ class Service:
             f"🔹 TPS: {stats.get('tps', 'N/A')}\n"
             f"🔹 Размер мира: {world_size}\n"
             f"🔹 Логирование: {'ВКЛ' if self.logging_enabled else 'ВЫКЛ'}"
+            f"{self._format_history()}"
         )
         kb = create_keyboard([
             [InlineKeyboardButton("🔄 Копия мира", callback_data="service_backup")],
@@ -1673,6 +2457,19 @@ class Service:
         ])
         await reply_to_update(update, status_text, kb)
 
+    def _format_history(self):
+        """Минимум / среднее / максимум метрик за час и за сутки"""
+        lines = []
+        for tier, title in (("1m", "час"), ("5m", "сутки")):
+            history = self.bot.metrics.history(tier)
+            parts = [f"{name} {summary[0]:.{digits}f}/{summary[1]:.{digits}f}/{summary[2]:.{digits}f}{unit}"
+                     for name, key, digits, unit in (("CPU", "cpu", 0, "%"), ("RAM", "ram", 0, " MB"),
+                                                     ("TPS", "tps", 1, ""))
+                     if (summary := history[key])]
+            if parts:
+                lines.append(f"🔹 За {title} (мин/сред/макс): {', '.join(parts)}")
+        return "\n\n" + "\n".join(lines) if lines else ""
+
     async def execute_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Запрос на ввод команды для сервера"""
         await reply_to_update(update, "Введите команду для выполнения на сервере:")
@@ -1685,7 +2482,7 @@ class Service:
         if not command:
             await reply_to_update(update, "⚠️ Команда не может быть пустой")
             return "service_cmd_input"
-        success, message = self.server_service.execute_command(command)
+        success, message = await self.server_service.execute_command(command)
         if success:
             await reply_to_update(update, f"✅ Команда выполнена:\n{message}")
         else:
@@ -1693,24 +2490,67 @@ class Service:
         context.user_data["waiting_for_command"] = False  # Сбрасываем флаг после выполнения
         return ConversationHandler.END
 
+    @staticmethod
+    def _backup_keyboard(running):
+        """Кнопки сообщения с прогрессом копирования"""
+        buttons = []
+        if running:
+            buttons.append([InlineKeyboardButton("🔄 Обновить", callback_data="service_backup_status"),
+                            InlineKeyboardButton("⛔ Отменить", callback_data="service_backup_cancel")])
+        buttons.append([InlineKeyboardButton("◀️ Назад", callback_data="admin_service")])
+        return create_keyboard(buttons)
+
     async def backup_world(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Создание копии мира"""
-        success, message = self.bot.server_service.backup_world()
-        await reply_to_update(update, message)
+        """Создание копии мира в фоне с прогрессом в одном сообщении"""
+        query = update.callback_query
+        success, result = self.bot.server_service.backup_world()
+        if not success:
+            await reply_to_update(update, result, self._backup_keyboard(True))
+            return
+        await reply_to_update(update, result.format_progress(), self._backup_keyboard(True))
+        context.application.create_task(self._track_backup(result, query.message))
+
+    async def _track_backup(self, job, message):
+        """Периодическое обновление сообщения с прогрессом до завершения копирования"""
+        last_text = None
+        while True:
+            finished = await job.wait(timeout=Config.BACKUP_PROGRESS_INTERVAL)
+            text = job.format_progress()
+            if text != last_text:
+                try:
+                    await message.edit_text(text, reply_markup=self._backup_keyboard(not finished))
+                    last_text = text
+                except Exception as e:
+                    logger.warning(f"Не удалось обновить прогресс копирования: {e}")
+            if finished:
+                return
+
+    async def backup_status(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Состояние текущего или последнего копирования мира"""
+        job = self.bot.server_service.get_backup_job()
+        if not job:
+            await reply_to_update(update, "Копирование мира ещё не запускалось", self._backup_keyboard(False))
+            return
+        await reply_to_update(update, job.format_progress(), self._backup_keyboard(job.running))
+
+    async def backup_cancel(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Отмена текущего копирования мира"""
+        success, message = self.bot.server_service.cancel_backup()
+        await reply_to_update(update, message, show_alert=True)
 
     async def start_server(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Запуск сервера"""
-        success, message = self.bot.server_service.start_server()
+        success, message = await self.bot.server_service.start_server()
         await reply_to_update(update, message)
 
     async def restart_server(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Перезагрузка сервера"""
-        success, message = self.bot.server_service.restart_server()
+        success, message = await self.bot.server_service.restart_server()
         await reply_to_update(update, message)
 
     async def stop_server(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Остановка сервера"""
-        success, message = self.bot.server_service.stop_server()
+        success, message = await self.bot.server_service.stop_server()
         await reply_to_update(update, message)
 
     async def toggle_logging(self, update: Update, context: ContextTypes.DEFAULT_TYPE, enable: bool):
@@ -1718,9 +2558,9 @@ class Service:
         query = update.callback_query
         await query.answer()
         if enable:
-            success, message = self.bot.server_service.enable_logging()
+            success, message = await self.bot.server_service.enable_logging()
         else:
-            success, message = self.bot.server_service.disable_logging()
+            success, message = await self.bot.server_service.disable_logging()
         if success:
             status = "включено" if enable else "выключено"
             await reply_to_update(update, f"✅ Логирование {status}")
@@ -1735,21 +2575,21 @@ class Service:
         """Выключение логирования"""
         await self.toggle_logging(update, context, False)
 
-    def get_server_uptime(self):
+    async def get_server_uptime(self):
         """Получение времени работы сервера"""
         try:
-            return self.bot.server_service.get_uptime()
+            return await self.bot.server_service.get_uptime()
         except Exception as e:
             return f"⚠️ Ошибка получения времени работы: {str(e)}"
 
     def _create_command_handler(self):
         """Создает обработчик для ввода команд"""
         return ConversationHandler(
-            entry_points=[CallbackQueryHandler(self.execute_command, pattern="^service_exec_cmd$")],
+            entry_points=[self.bot.router.entry("service_exec_cmd", self.execute_command)],
             states={"service_cmd_input": [MessageHandler(filters.TEXT & ~filters.COMMAND, self.process_command)]},
             fallbacks=[
                 CommandHandler("cancel", lambda u, c: reply_to_update(u, "Отмена ввода команды")),
-                CallbackQueryHandler(lambda u, c: reply_to_update(u, "Отмена ввода команды"), pattern="^cancel$")
+                self.bot.router.entry("cancel", lambda u, c: reply_to_update(u, "Отмена ввода команды"))
             ]
         )
 
@@ -1757,70 +2597,86 @@ class Service:
 # ==================== WHITELIST ====================
 class WhitelistManager:
     @staticmethod
-    def add_to_whitelist(nickname):
-        """Добавление игрока в whitelist"""
+    async def apply_whitelist(add=(), remove=()):
+        """Добавление и удаление игроков одной записью whitelist.json и одной перезагрузкой"""
         try:
-            add_to_whitelist(nickname)
-            return True, f"Игрок {nickname} добавлен в whitelist"
+            change = await get_whitelist().apply(add=[nick.lower() for nick in add],
+                                                 remove=[nick.lower() for nick in remove])
         except Exception as e:
-            return False, f"Ошибка при добавлении в whitelist: {str(e)}"
+            logger.error(f"Ошибка изменения whitelist: {e}")
+            return False, f"Ошибка изменения whitelist: {str(e)}"
+        parts = []
+        if change.added:
+            parts.append(f"добавлены: {', '.join(change.added)}")
+        if change.removed:
+            parts.append(f"удалены: {', '.join(change.removed)}")
+        message = f"Whitelist: {'; '.join(parts)}" if parts else "Whitelist не изменился"
+        if change.error:
+            message += f" ({change.error})"
+        if change.unresolved:
+            return False, f"{message}\nНе найден UUID игроков: {', '.join(change.unresolved)}"
+        return True, message
 
     @staticmethod
-    def remove_from_whitelist(nickname):
+    async def add_to_whitelist(nickname):
+        """Добавление игрока в whitelist"""
+        return await WhitelistManager.apply_whitelist(add=[nickname])
+
+    @staticmethod
+    async def remove_from_whitelist(nickname):
         """Удаление игрока из whitelist"""
-        try:
-            remove_from_whitelist(nickname)
-            return True, f"Игрок {nickname} удалён из whitelist"
-        except Exception as e:
-            return False, f"Ошибка при удалении из whitelist: {str(e)}"
+        return await WhitelistManager.apply_whitelist(remove=[nickname])
 
     @staticmethod
-    def reload_whitelist():
+    async def reload_whitelist():
         """Перезагрузка whitelist"""
         try:
-            reload_whitelist()
+            await reload_whitelist()
             return True, "Whitelist перезагружен"
         except Exception as e:
             return False, f"Ошибка при перезагрузке whitelist: {str(e)}"
 
     @staticmethod
-    def manage_ufw_rules(ip: str, action: str):
-        """Безопасное управление UFW правилами"""
+    async def apply_firewall(add=(), remove=()):
+        """Открытие и закрытие порта сервера для IP игроков одной пачкой"""
         try:
-            if not ip:
-                return False, "IP не указан"
-            if action == 'add':
-                return add_ufw_rules(ip)
-            elif action == 'remove':
-                return remove_ufw_rules(ip)
-            else:
-                return False, "Неизвестное действие"
+            await get_firewall().apply(add=add, remove=remove)
+            return True, "Правила firewall обновлены"
         except Exception as e:
-            logger.error(f"Ошибка UFW для IP {ip}: {e}")
-            return False, f"Ошибка: {str(e)}"
+            logger.error(f"Ошибка firewall: {e}")
+            return False, f"Ошибка правил firewall: {str(e)}"
 
     @staticmethod
-    def full_cleanup(nickname: str, ip: str):
-        """Полная очистка всех следов пользователя"""
-        try:
-            # Удаление из whitelist
-            remove_from_whitelist(nickname)
-            # Удаление правил UFW
-            remove_ufw_rules(ip)
-            # Перезагрузка whitelist
-            reload_whitelist()
-            return True, "Полная очистка выполнена"
-        except Exception as e:
-            return False, f"Ошибка очистки: {str(e)}"
+    async def manage_ufw_rules(ip: str, action: str):
+        """Безопасное управление правилами firewall для одного IP"""
+        if not ip:
+            return False, "IP не указан"
+        if action == 'add':
+            success, message = await WhitelistManager.apply_firewall(add=[ip])
+            return success, f"Правила firewall для {ip} добавлены" if success else message
+        elif action == 'remove':
+            success, message = await WhitelistManager.apply_firewall(remove=[ip])
+            return success, f"Правила firewall для {ip} удалены" if success else message
+        return False, "Неизвестное действие"
+
+    @staticmethod
+    async def full_cleanup(nickname: str, ip: str):
+        """Полная очистка всех следов пользователя: whitelist (с перезагрузкой) и правила firewall"""
+        results = [await WhitelistManager.apply_whitelist(remove=[nickname])]
+        if ip:
+            results.append(await WhitelistManager.apply_firewall(remove=[ip]))
+        errors = [message for success, message in results if not success]
+        if errors:
+            return False, f"Ошибка очистки: {'; '.join(errors)}"
+        return True, "Полная очистка выполнена"
 
 
 # ==================== ЗАПУСК ====================
 if __name__ == "__main__":
     try:
-        Database.init()
         bot = MinecraftBot()
         logger.info("Бот запущен")
-        bot.application.run_polling()
+        bot.run()
     except Exception as e:
         logger.critical(f"Критическая ошибка: {e}")
         raise
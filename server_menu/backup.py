@@ -0,0 +1,300 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+from datetime import datetime
+from dotenv import load_dotenv
+from server_menu.executor import stream_command, CommandError
+from server_menu.backup_store import BackupStore, SnapshotCancelled
+from server_menu.compress import ParallelCompressor, CODECS, DEFAULT_WORKERS
+from server_menu.utils import format_size, format_duration
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+BACKUP_MODE = os.getenv("BACKUP_MODE", "store")  # store - хранилище с дедупликацией, archive - архив tar
+BACKUP_KEEP = int(os.getenv("BACKUP_KEEP", "5"))  # Сколько последних архивов хранить
+BACKUP_STORE_KEEP = int(os.getenv("BACKUP_STORE_KEEP", "50"))  # Сколько снимков хранить в хранилище
+BACKUP_FULL_EVERY = int(os.getenv("BACKUP_FULL_EVERY", "24"))  # Каждый N-й снимок перечитывает весь мир (0 - никогда)
+BACKUP_CODEC = os.getenv("BACKUP_CODEC", "gzip")  # Сжатие архива: gzip, bz2 или xz
+BACKUP_LEVEL = int(os.getenv("BACKUP_LEVEL")) if os.getenv("BACKUP_LEVEL") else None  # По умолчанию свой у кодека
+BACKUP_WORKERS = int(os.getenv("BACKUP_WORKERS", str(DEFAULT_WORKERS)))  # Процессов для сжатия архива
+# Файлы, которые не попадают в копию (как в backup.sh)
+BACKUP_EXCLUDES = (
+    "data/DistantHorizons.sqlite",
+    "data/DistantHorizons.sqlite-shm",
+    "data/DistantHorizons.sqlite-wal",
+)
+
+
+def directory_size(path, excludes=()):
+    """Суммарный размер файлов директории"""
+    total = 0
+    excluded = {os.path.join(path, exclude) for exclude in excludes}
+    for dirpath, _, filenames in os.walk(path):
+        for f in filenames:
+            fp = os.path.join(dirpath, f)
+            if fp in excluded:
+                continue
+            try:
+                total += os.path.getsize(fp)
+            except OSError:
+                pass  # Файл мог быть удалён сервером во время обхода
+    return total
+
+
+class BackupJob(ABC):
+    """Фоновое создание копии мира с отслеживанием прогресса; способ копирования задаёт _execute"""
+
+    RUNNING, DONE, FAILED, CANCELLED = "running", "done", "failed", "cancelled"
+
+    def __init__(self, world_dir, backup_dir, size_index=None):
+        self.world_dir = Path(world_dir)
+        self.backup_dir = Path(backup_dir)
+        self.size_index = size_index  # WorldSizeIndex - размер мира без полного обхода
+        self.name = f"world_backup_{datetime.now():%Y-%m-%d_%H-%M-%S}"
+        self.status = self.RUNNING
+        self.error = None
+        self.bytes_done = 0  # Байт данных мира обработано
+        self.bytes_written = 0  # Байт записано на диск
+        self.total_bytes = 0  # Оценка размера мира, известна после подсчёта
+        self.started_at = time.monotonic()
+        self.finished_at = None
+        self._task = None
+
+    @property
+    def running(self):
+        return self.status == self.RUNNING
+
+    @property
+    def elapsed(self):
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    @property
+    def throughput(self):
+        """Скорость обработки, байт/сек"""
+        return self.bytes_done / self.elapsed if self.elapsed > 0 else 0.0
+
+    @property
+    def eta(self):
+        """Оценка оставшегося времени, сек (None - оценить нельзя)"""
+        if not self.total_bytes or not self.throughput:
+            return None
+        return max(0.0, (self.total_bytes - self.bytes_done) / self.throughput)
+
+    @property
+    def percent(self):
+        if not self.total_bytes:
+            return 0.0
+        # Размер мира оценивается заранее и может немного отличаться, поэтому до завершения не больше 99%
+        limit = 100.0 if self.status == self.DONE else 99.0
+        return min(limit, self.bytes_done * 100.0 / self.total_bytes)
+
+    def start(self):
+        """Запуск задачи в фоне"""
+        self._task = asyncio.ensure_future(self._run())
+        return self
+
+    def cancel(self):
+        """Отмена задачи"""
+        if self._task and not self._task.done():
+            self._task.cancel()
+            return True
+        return False
+
+    async def wait(self, timeout=None):
+        """Ожидание завершения задачи; False - не успела завершиться за timeout"""
+        if self._task is None:
+            return True
+        done, _ = await asyncio.wait({self._task}, timeout=timeout)
+        return bool(done)
+
+    async def _run(self):
+        try:
+            self.backup_dir.mkdir(parents=True, exist_ok=True)
+            if not self.world_dir.exists():
+                raise FileNotFoundError(f"Директория мира не существует: {self.world_dir}")
+            self.total_bytes = await asyncio.to_thread(self._measure)
+            await self._execute()
+            self.status = self.DONE
+            logger.info(f"Копия мира {self.name} создана ({format_size(self.bytes_written)} записано)")
+        except asyncio.CancelledError:
+            self.status = self.CANCELLED
+            logger.info(f"Создание копии мира {self.name} отменено")
+        except Exception as e:
+            self.status = self.FAILED
+            self.error = str(e)
+            logger.error(f"Ошибка создания копии мира: {e}")
+        finally:
+            self.finished_at = time.monotonic()
+            self._cleanup()
+
+    def _measure(self):
+        """Оценка размера мира для прогресса"""
+        if self.size_index is not None:
+            return self.size_index.total(BACKUP_EXCLUDES)
+        return directory_size(self.world_dir, BACKUP_EXCLUDES)
+
+    @abstractmethod
+    async def _execute(self):
+        """Создание копии"""
+
+    def _cleanup(self):
+        """Уборка после завершения задачи"""
+
+    def _result_details(self):
+        return f"Обработано: {format_size(self.bytes_done)}, записано: {format_size(self.bytes_written)}"
+
+    def format_progress(self):
+        """Текст статуса для сообщения в Telegram"""
+        if self.status == self.DONE:
+            return (f"✅ Копия мира создана: {self.name}\n"
+                    f"{self._result_details()}\n"
+                    f"Время: {format_duration(self.elapsed)}")
+        if self.status == self.CANCELLED:
+            return f"⛔ Создание копии мира отменено после {format_duration(self.elapsed)}"
+        if self.status == self.FAILED:
+            return f"⚠️ Ошибка создания копии мира: {self.error}"
+        if not self.total_bytes:
+            return "💾 Копия мира: подсчёт размера мира..."
+        eta = self.eta
+        return (f"💾 Копия мира: {self.percent:.0f}%\n"
+                f"Обработано: {format_size(self.bytes_done)} из {format_size(self.total_bytes)}\n"
+                f"Скорость: {format_size(self.throughput)}/с\n"
+                f"Осталось: {'~' + format_duration(eta) if eta is not None else 'оценивается'}")
+
+
+class ArchiveBackupJob(BackupJob):
+    """Копия мира в виде архива tar, сжатого на нескольких ядрах"""
+
+    def __init__(self, world_dir, backup_dir, size_index=None, keep=BACKUP_KEEP, codec=BACKUP_CODEC,
+                 level=BACKUP_LEVEL, workers=BACKUP_WORKERS):
+        super().__init__(world_dir, backup_dir, size_index)
+        self.keep = keep
+        self.codec = codec
+        self.level = level
+        self.workers = workers
+        self.name += ".tar" + CODECS[codec][0]
+
+    @property
+    def path(self):
+        return self.backup_dir / self.name
+
+    @property
+    def part_path(self):
+        return self.path.with_name(self.name + ".part")
+
+    async def _execute(self):
+        await self._write_archive(self.part_path)
+        os.replace(self.part_path, self.path)
+        await asyncio.to_thread(self._remove_old_backups)
+
+    def _cleanup(self):
+        if self.status != self.DONE and self.part_path.exists():
+            self.part_path.unlink()
+
+    def _result_details(self):
+        return f"Обработано: {format_size(self.bytes_done)}, архив: {format_size(self.bytes_written)}"
+
+    async def _write_archive(self, part_path):
+        """Сжатие потока tar в пуле процессов с подсчётом прогресса по самому потоку"""
+        args = ["tar", "-cf", "-"]
+        args += [f"--exclude={exclude}" for exclude in BACKUP_EXCLUDES]
+        args += ["-C", self.world_dir, "."]
+        with open(part_path, "wb") as f, ParallelCompressor(self.codec, self.level, self.workers) as compressor:
+            async def write(blocks):
+                if blocks:
+                    await asyncio.to_thread(f.writelines, blocks)
+                    self.bytes_written += sum(len(block) for block in blocks)
+
+            try:
+                async for chunk in stream_command(args):
+                    self.bytes_done += len(chunk)
+                    await write(await compressor.write(chunk))
+            except CommandError as e:
+                # Код 1 - файл изменился во время чтения (мир работает), архив при этом полный
+                if e.result.returncode != 1:
+                    raise
+                logger.warning(f"tar: часть файлов изменилась во время копирования: {e.result.tail(3)}")
+            await write(await compressor.flush())
+
+    def _remove_old_backups(self):
+        """Удаление старых копий, остаются последние self.keep"""
+        backups = sorted((p for p in self.backup_dir.glob("world_backup_*.tar.*") if p.suffix != ".part"),
+                         reverse=True)
+        for old in backups[self.keep:]:
+            old.unlink()
+            logger.info(f"Удалена старая копия мира: {old.name}")
+
+
+class StoreBackupJob(BackupJob):
+    """Снимок мира в хранилище с дедупликацией: на диск пишутся только новые блоки"""
+
+    def __init__(self, world_dir, backup_dir, size_index=None, keep=BACKUP_STORE_KEEP):
+        super().__init__(world_dir, backup_dir, size_index)
+        self.keep = keep
+        self.store = BackupStore(self.backup_dir / "store")
+        self.manifest = None
+        self._stop = threading.Event()
+
+    def _progress(self, processed, written):
+        # Вызывается из рабочего потока; простые счётчики безопасны под GIL
+        self.bytes_done += processed
+        self.bytes_written += written
+
+    def _snapshot(self):
+        manifest = self.store.snapshot(self.world_dir, name=self.name, excludes=BACKUP_EXCLUDES,
+                                       progress=self._progress, stop_event=self._stop, full_every=BACKUP_FULL_EVERY)
+        self.store.prune(self.keep)
+        return manifest
+
+    async def _execute(self):
+        future = asyncio.ensure_future(asyncio.to_thread(self._snapshot))
+        try:
+            self.manifest = await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # Поток нельзя прервать извне - просим его остановиться и дожидаемся, манифест не пишется
+            self._stop.set()
+            try:
+                await future
+            except SnapshotCancelled:
+                pass
+            raise
+
+    def _result_details(self):
+        stats = self.manifest["stats"]
+        return (f"{'Полный' if self.manifest['full'] else 'Инкрементальный'} снимок\n"
+                f"Файлов: {stats['files']} (без изменений: {stats['reused_files']})\n"
+                f"Блоков region прочитано: {stats['region_blocks_read']}, "
+                f"пропущено: {stats['region_blocks_reused']}\n"
+                f"Размер мира: {format_size(stats['bytes'])}, новых данных: {format_size(stats['new_bytes'])}")
+
+
+class BackupManager:
+    """Единственная активная задача копирования и результат последней"""
+
+    def __init__(self, server_dir, size_index=None):
+        self.world_dir = Path(server_dir) / "world"
+        self.backup_dir = Path(server_dir) / "backup"
+        self.size_index = size_index
+        self.job = None
+
+    def start(self):
+        """Запуск нового копирования, если предыдущее завершено"""
+        if self.job and self.job.running:
+            return False, "Копирование мира уже выполняется"
+        if BACKUP_MODE == "archive" and BACKUP_CODEC not in CODECS:
+            return False, f"Неизвестный кодек сжатия BACKUP_CODEC={BACKUP_CODEC} (доступны: {', '.join(CODECS)})"
+        job_class = ArchiveBackupJob if BACKUP_MODE == "archive" else StoreBackupJob
+        self.job = job_class(self.world_dir, self.backup_dir, self.size_index).start()
+        return True, self.job
+
+    def cancel(self):
+        """Отмена текущего копирования"""
+        if not self.job or not self.job.cancel():
+            return False, "Нет выполняющегося копирования"
+        return True, "Копирование мира отменяется"
@@ -0,0 +1,321 @@
+import os
+import sys
+import json
+import mmap
+import zlib
+import struct
+import hashlib
+import logging
+import threading
+import time
+from pathlib import Path
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 256 * 1024  # Размер блока: кратен сектору region-файла (4 КБ), поэтому правки не сдвигают границы
+COMPRESS_LEVEL = 3  # Данные region-файлов уже сжаты, сильное сжатие почти ничего не даёт
+RAW, PACKED = b"R", b"Z"  # Первый байт файла блока: хранится как есть / сжат zlib
+
+# Формат Anvil (.mca): заголовок из таблицы расположения 1024 чанков и таблицы времени их сохранения
+REGION_SUFFIX = ".mca"
+SECTOR_SIZE = 4096
+REGION_HEADER_SIZE = 2 * SECTOR_SIZE
+REGION_CHUNKS = 1024
+
+
+def read_region_header(path):
+    """Чтение заголовка region-файла через mmap"""
+    with open(path, "rb") as f:
+        with mmap.mmap(f.fileno(), REGION_HEADER_SIZE, access=mmap.ACCESS_READ) as mm:
+            return bytes(mm)
+
+
+def region_tables(header):
+    """Таблицы заголовка region-файла: (расположения, времена сохранения) 1024 чанков"""
+    return (struct.unpack(f">{REGION_CHUNKS}I", header[:SECTOR_SIZE]),
+            struct.unpack(f">{REGION_CHUNKS}I", header[SECTOR_SIZE:REGION_HEADER_SIZE]))
+
+
+def dirty_blocks(header, previous_header, since):
+    """Номера блоков region-файла, которые нужно прочитать заново.
+
+    Блок 0 (с заголовком) читается всегда. Чанк считается изменённым, если у него другое расположение
+    или время сохранения, а также если время не раньше начала прошлого снимка since: время хранится
+    с точностью до секунды, и перезапись в ту же секунду, что и прошлый снимок, иначе не заметить.
+    Перечитываются блоки и нового, и прежнего расположения чанка
+    """
+    locations, timestamps = region_tables(header)
+    previous_locations, previous_timestamps = region_tables(previous_header)
+    dirty = {0}
+    for index in range(REGION_CHUNKS):
+        location, timestamp = locations[index], timestamps[index]
+        if (location, timestamp) == (previous_locations[index], previous_timestamps[index]) \
+                and not (location and timestamp >= since):
+            continue
+        for loc in (location, previous_locations[index]):
+            if loc:
+                start, end = (loc >> 8) * SECTOR_SIZE, ((loc >> 8) + (loc & 0xFF)) * SECTOR_SIZE
+                dirty.update(range(start // CHUNK_SIZE, (end - 1) // CHUNK_SIZE + 1))
+    return dirty
+
+
+def entry_digests(entry):
+    """Все блоки, на которые ссылается запись манифеста"""
+    if entry.get("kind") == "region":  # Прежний формат: заголовок и отдельный блок на каждый чанк
+        return [entry["header"]] + [chunk[1] for chunk in entry["chunks"]]
+    return entry["chunks"]
+
+
+class SnapshotCancelled(Exception):
+    """Создание снимка прервано"""
+
+
+class BackupStore:
+    """Хранилище копий мира с дедупликацией: каждый уникальный блок хранится один раз под своим хешем"""
+
+    def __init__(self, root):
+        self.root = Path(root)
+        self.chunks_dir = self.root / "chunks"
+        self.manifests_dir = self.root / "manifests"
+
+    # ===== БЛОКИ =====
+    def _chunk_path(self, digest):
+        return self.chunks_dir / digest[:2] / digest
+
+    def has_chunk(self, digest):
+        return self._chunk_path(digest).exists()
+
+    def put_chunk(self, data, verify=False):
+        """Сохранение блока, возвращает хеш и число записанных на диск байт (0 - блок уже был).
+
+        verify - проверить содержимое уже сохранённого блока и перезаписать его, если он повреждён
+        """
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._chunk_path(digest)
+        if path.exists():
+            if not verify:
+                return digest, 0
+            try:
+                self.read_chunk(digest)
+                return digest, 0
+            except (ValueError, zlib.error, OSError) as e:
+                logger.warning(f"Блок {digest} повреждён и будет записан заново: {e}")
+        packed = zlib.compress(data, COMPRESS_LEVEL)
+        payload = PACKED + packed if len(packed) < len(data) else RAW + data
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(f"{digest}.{threading.get_ident()}.tmp")
+        with open(tmp_path, "wb") as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+        return digest, len(payload)
+
+    def read_chunk(self, digest):
+        with open(self._chunk_path(digest), "rb") as f:
+            payload = f.read()
+        data = zlib.decompress(payload[1:]) if payload[:1] == PACKED else payload[1:]
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f"Повреждён блок {digest}")
+        return data
+
+    # ===== МАНИФЕСТЫ =====
+    def list_manifests(self):
+        """Имена снимков от старых к новым"""
+        if not self.manifests_dir.exists():
+            return []
+        return sorted(p.stem for p in self.manifests_dir.glob("*.json"))
+
+    def load_manifest(self, name):
+        with open(self.manifests_dir / f"{name}.json", "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def latest_manifest(self):
+        names = self.list_manifests()
+        return self.load_manifest(names[-1]) if names else None
+
+    def write_manifest(self, manifest):
+        self.manifests_dir.mkdir(parents=True, exist_ok=True)
+        path = self.manifests_dir / f"{manifest['name']}.json"
+        tmp_path = path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+    # ===== СНИМОК =====
+    def snapshot(self, source_dir, name=None, excludes=(), progress=None, stop_event=None, full_every=0):
+        """Создание снимка директории.
+
+        Файлы с неизменными размером и mtime берутся из прошлого снимка, у изменившихся region-файлов
+        читаются только блоки с чанками, у которых новое время сохранения. Каждый full_every-й снимок читает всё заново
+        и проверяет уже сохранённые блоки: повреждённые записываются повторно.
+        """
+        source_dir = Path(source_dir)
+        started = int(time.time())
+        name = name or f"world_backup_{datetime.now():%Y-%m-%d_%H-%M-%S}"
+        previous = self.latest_manifest()
+        since_full = previous.get("since_full", 0) + 1 if previous else 0
+        full = previous is None or bool(full_every and since_full >= full_every)
+        previous_files = {} if full else {entry["path"]: entry for entry in previous["files"]}
+        since = previous.get("started", 0) if previous else 0
+        stats = {"files": 0, "reused_files": 0, "bytes": 0, "new_chunks": 0, "new_bytes": 0,
+                 "region_blocks_read": 0, "region_blocks_reused": 0}
+        files, dirs = [], []
+        for dirpath, dirnames, filenames in os.walk(source_dir):
+            dirnames.sort()
+            rel_dir = Path(dirpath).relative_to(source_dir).as_posix()
+            if rel_dir != ".":
+                dirs.append(rel_dir)
+            for filename in sorted(filenames):
+                rel_path = filename if rel_dir == "." else f"{rel_dir}/{filename}"
+                if rel_path in excludes:
+                    continue
+                if stop_event is not None and stop_event.is_set():
+                    raise SnapshotCancelled()
+                entry = self._snapshot_file(Path(dirpath) / filename, rel_path, previous_files.get(rel_path),
+                                            since, stats, progress, stop_event, verify=full)
+                if entry:
+                    files.append(entry)
+        manifest = {"name": name, "created": datetime.now().isoformat(timespec="seconds"), "started": started,
+                    "chunk_size": CHUNK_SIZE, "full": full, "since_full": 0 if full else since_full,
+                    "dirs": dirs, "files": files, "stats": stats}
+        self.write_manifest(manifest)
+        return manifest
+
+    def _snapshot_file(self, path, rel_path, previous, since, stats, progress, stop_event, verify=False):
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            return None  # Файл удалён сервером во время обхода
+        stats["files"] += 1
+        if previous and previous["size"] == st.st_size and previous["mtime_ns"] == st.st_mtime_ns:
+            stats["reused_files"] += 1
+            stats["bytes"] += st.st_size
+            if progress:
+                progress(st.st_size, 0)
+            return previous
+        if path.suffix == REGION_SUFFIX and st.st_size >= REGION_HEADER_SIZE:
+            return self._snapshot_region(path, rel_path, st, previous, since, stats, progress, stop_event, verify)
+        chunks, size = [], 0
+        with open(path, "rb") as f:
+            while True:
+                if stop_event is not None and stop_event.is_set():
+                    raise SnapshotCancelled()
+                data = f.read(CHUNK_SIZE)
+                if not data:
+                    break
+                chunks.append(self._store(data, stats, progress, verify))
+                size += len(data)
+        stats["bytes"] += size
+        return {"path": rel_path, "size": size, "mtime_ns": st.st_mtime_ns, "chunks": chunks}
+
+    def _store(self, data, stats, progress, verify=False):
+        digest, written = self.put_chunk(data, verify)
+        if written:
+            stats["new_chunks"] += 1
+            stats["new_bytes"] += written
+        if progress:
+            progress(len(data), written)
+        return digest
+
+    def _snapshot_region(self, path, rel_path, st, previous, since, stats, progress, stop_event, verify=False):
+        """Region-файл хранится блоками CHUNK_SIZE, как обычный файл. Таблица времени сохранения чанков
+        из заголовка (сравнивается с заголовком в блоке 0 прошлого снимка) определяет, какие блоки
+        прочитать; остальные берутся из прошлого снимка
+        """
+        header = read_region_header(path)
+        dirty, previous_chunks = None, []
+        if previous and previous.get("kind") == "anvil" and previous["chunks"]:
+            try:
+                previous_header = self.read_chunk(previous["chunks"][0])[:REGION_HEADER_SIZE]
+                if len(previous_header) == REGION_HEADER_SIZE:
+                    dirty, previous_chunks = dirty_blocks(header, previous_header, since), previous["chunks"]
+            except (ValueError, zlib.error, OSError) as e:
+                logger.warning(f"Не удалось прочитать прошлый заголовок {rel_path}, файл читается целиком: {e}")
+        chunks = []
+        with open(path, "rb") as f:
+            for block, offset in enumerate(range(0, st.st_size, CHUNK_SIZE)):
+                if stop_event is not None and stop_event.is_set():
+                    raise SnapshotCancelled()
+                length = min(CHUNK_SIZE, st.st_size - offset)
+                # Блок совпадает, если ни один его чанк не менялся и он не стал короче или длиннее
+                if dirty is not None and block not in dirty and block < len(previous_chunks) \
+                        and min(CHUNK_SIZE, previous["size"] - offset) == length:
+                    stats["region_blocks_reused"] += 1
+                    if progress:
+                        progress(length, 0)
+                    chunks.append(previous_chunks[block])
+                    continue
+                stats["region_blocks_read"] += 1
+                chunks.append(self._store(os.pread(f.fileno(), length, offset), stats, progress, verify))
+        stats["bytes"] += st.st_size
+        return {"path": rel_path, "size": st.st_size, "mtime_ns": st.st_mtime_ns, "kind": "anvil", "chunks": chunks}
+
+    # ===== ВОССТАНОВЛЕНИЕ И ОЧИСТКА =====
+    def restore(self, name, target_dir):
+        """Восстановление снимка в пустую директорию"""
+        manifest = self.load_manifest(name)
+        target_dir = Path(target_dir)
+        target_dir.mkdir(parents=True, exist_ok=True)
+        for rel_dir in manifest["dirs"]:
+            (target_dir / rel_dir).mkdir(parents=True, exist_ok=True)
+        for entry in manifest["files"]:
+            path = target_dir / entry["path"]
+            path.parent.mkdir(parents=True, exist_ok=True)
+            with open(path, "wb") as f:
+                if entry.get("kind") == "region":  # Прежний формат: заголовок и чанки по своим местам
+                    f.truncate(entry["size"])
+                    f.write(self.read_chunk(entry["header"]))
+                    for _, digest, _, location in entry["chunks"]:
+                        f.seek((location >> 8) * SECTOR_SIZE)
+                        f.write(self.read_chunk(digest))
+                else:
+                    for digest in entry["chunks"]:
+                        f.write(self.read_chunk(digest))
+            os.utime(path, ns=(entry["mtime_ns"], entry["mtime_ns"]))
+        return manifest
+
+    def prune(self, keep):
+        """Удаление старых снимков (остаются последние keep, 0 - все) и блоков, на которые никто не ссылается"""
+        if keep < 0:
+            raise ValueError(f"Число хранимых снимков не может быть отрицательным: {keep}")
+        names = self.list_manifests()
+        removed_manifests = names[:-keep] if keep else []
+        for name in removed_manifests:
+            (self.manifests_dir / f"{name}.json").unlink()
+            logger.info(f"Удалён старый снимок мира: {name}")
+        if not removed_manifests:
+            # Блоки без ссылок остаются только от удалённых снимков (и от отменённых - они убираются
+            # при следующем удалении), поэтому манифесты читаются лишь тогда, когда снимки удалялись
+            return 0
+        referenced = set()
+        for name in self.list_manifests():
+            for entry in self.load_manifest(name)["files"]:
+                referenced.update(entry_digests(entry))
+        removed = 0
+        if self.chunks_dir.exists():
+            for path in self.chunks_dir.glob("*/*"):
+                if path.name not in referenced:
+                    path.unlink()
+                    removed += 1
+        return removed
+
+
+def main():
+    if len(sys.argv) < 3 or sys.argv[2] not in ("list", "restore"):
+        print("Использование: backup_store.py <хранилище> list | restore <снимок> <директория>", file=sys.stderr)
+        sys.exit(1)
+    store = BackupStore(sys.argv[1])
+    if sys.argv[2] == "list":
+        for name in store.list_manifests():
+            stats = store.load_manifest(name)["stats"]
+            print(f"{name}: файлов {stats['files']}, {stats['bytes']} байт, новых данных {stats['new_bytes']} байт")
+    elif len(sys.argv) < 5:
+        print("Ошибка: укажите снимок и директорию для восстановления", file=sys.stderr)
+        sys.exit(1)
+    else:
+        store.restore(sys.argv[3], sys.argv[4])
+        print(f"Снимок {sys.argv[3]} восстановлен в {sys.argv[4]}")
+
+
+if __name__ == "__main__":
+    main()
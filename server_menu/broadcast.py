@@ -0,0 +1,250 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from datetime import timedelta
+from dotenv import load_dotenv
+from telegram.error import RetryAfter, Forbidden, BadRequest, NetworkError
+from server_menu.utils import format_duration
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+BROADCAST_RATE = float(os.getenv("BROADCAST_RATE", "25"))  # Сообщений в секунду на все чаты (лимит Telegram - около 30)
+BROADCAST_WORKERS = int(os.getenv("BROADCAST_WORKERS", "8"))  # Одновременных отправок
+CHAT_INTERVAL = 1.0  # Не чаще одного сообщения в секунду в один чат (лимит Telegram)
+BURST = 5  # Сколько сообщений можно отправить разом после простоя
+ATTEMPTS = 5  # Попыток доставки одному получателю
+BATCH_SIZE = 200  # Получателей читается из базы и результатов записывается за раз
+
+# Состояния получателя в базе (не путать со статусами рассылки BroadcastJob.RUNNING и т.д.)
+STATE_PENDING, STATE_DELIVERED, STATE_FAILED = 0, 1, 2
+
+
+def retry_seconds(error):
+    """Пауза из RetryAfter (в зависимости от версии PTB - число или timedelta)"""
+    delay = error.retry_after
+    return delay.total_seconds() if isinstance(delay, timedelta) else float(delay)
+
+
+class RateLimiter:
+    """Token bucket на все чаты плюс минимальный интервал между сообщениями в один чат"""
+
+    def __init__(self, rate=BROADCAST_RATE, burst=BURST, chat_interval=CHAT_INTERVAL):
+        self.rate = rate
+        self.capacity = max(1.0, float(burst))
+        self.chat_interval = chat_interval
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._chat_last = {}  # chat_id -> время последней отправки
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds):
+        """Остановка всех отправок на seconds (Telegram ответил RetryAfter)"""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+    async def acquire(self, chat_id=None):
+        """Ожидание разрешения на отправку сообщения в chat_id"""
+        if chat_id is not None:
+            # Интервал одного чата ждём вне общей очереди, чтобы не задерживать отправки в другие чаты
+            wait = self._chat_last.get(chat_id, float("-inf")) + self.chat_interval - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                wait = max(self._paused_until - now, (1 - self.tokens) / self.rate)
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            self.tokens -= 1
+            if chat_id is not None:
+                self._chat_last[chat_id] = now
+                if len(self._chat_last) > 10000:
+                    self._chat_last = {chat: last for chat, last in self._chat_last.items()
+                                       if now - last < self.chat_interval}
+
+
+class BroadcastJob:
+    """Фоновая рассылка одного сообщения с сохранением прогресса в базе.
+
+    Результаты записываются пачками по BATCH_SIZE, поэтому после перезапуска бота рассылка продолжается
+    с неотправленных получателей. При остановке бота незаписанные результаты сохраняются, но если процесс
+    завершился аварийно, получатели последней пачки остаются неотправленными в базе: доставка "хотя бы
+    один раз", и каждый из них (не больше BATCH_SIZE) может получить сообщение повторно.
+    """
+
+    RUNNING, DONE, FAILED, CANCELLED = "running", "done", "failed", "cancelled"
+
+    def __init__(self, broadcast_id, text, store, send, limiter, workers=BROADCAST_WORKERS):
+        self.id = broadcast_id
+        self.text = text
+        self.store = store  # AsyncDatabase: broadcast_counts, broadcast_pending, broadcast_save, broadcast_finish
+        self.send = send  # async send(chat_id, text)
+        self.limiter = limiter
+        self.workers = workers
+        self.status = self.RUNNING
+        self.error = None
+        self.total = self.delivered = self.failed = 0
+        self.started_at = time.monotonic()
+        self.finished_at = None
+        self._unsaved = []  # Результаты (tg_id, состояние, ошибка), ещё не записанные в базу
+        self._cancelled = False  # Отмена админом, а не остановка бота
+        self._task = None
+
+    @property
+    def running(self):
+        return self.status == self.RUNNING
+
+    @property
+    def elapsed(self):
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    def start(self):
+        self._task = asyncio.ensure_future(self._run())
+        return self
+
+    def cancel(self):
+        """Отмена рассылки: неотправленные сообщения уже не уйдут и после перезапуска"""
+        if self._task and not self._task.done():
+            self._cancelled = True
+            self._task.cancel()
+            return True
+        return False
+
+    async def stop(self):
+        """Остановка без отмены (выключение бота) - рассылка продолжится при следующем запуске"""
+        if self._task and not self._task.done():
+            self._task.cancel()
+            await self.wait()
+
+    async def wait(self, timeout=None):
+        """Ожидание завершения рассылки; False - не успела завершиться за timeout"""
+        if self._task is None:
+            return True
+        done, _ = await asyncio.wait({self._task}, timeout=timeout)
+        return bool(done)
+
+    async def _run(self):
+        try:
+            self.total, self.delivered, self.failed = await self.store.broadcast_counts(self.id)
+            while chat_ids := await self.store.broadcast_pending(self.id, BATCH_SIZE):
+                await self._send_batch(chat_ids)
+                await self._save()
+            self.status = self.DONE
+        except asyncio.CancelledError:
+            self.status = self.CANCELLED if self._cancelled else self.RUNNING
+        except Exception as e:
+            self.status = self.FAILED
+            self.error = str(e)
+            logger.error(f"Ошибка рассылки #{self.id}: {e}")
+        finally:
+            self.finished_at = time.monotonic()
+            try:
+                await self._save()
+                if self.status in (self.DONE, self.CANCELLED):
+                    await self.store.broadcast_finish(self.id, self.status)
+            except Exception as e:
+                logger.error(f"Не удалось сохранить прогресс рассылки #{self.id}: {e}")
+
+    async def _save(self):
+        if self._unsaved:
+            results, self._unsaved = self._unsaved, []
+            await self.store.broadcast_save(self.id, results)
+
+    async def _send_batch(self, chat_ids):
+        queue = deque(chat_ids)
+
+        async def worker():
+            while queue:
+                self._unsaved.append(await self._deliver(queue.popleft()))
+
+        await asyncio.gather(*(worker() for _ in range(min(self.workers, len(queue)))))
+
+    async def _deliver(self, chat_id):
+        """Отправка одному получателю с повторами; возвращает (tg_id, состояние, ошибка)"""
+        error = None
+        for attempt in range(1, ATTEMPTS + 1):
+            await self.limiter.acquire(chat_id)
+            try:
+                await self.send(chat_id, self.text)
+                self.delivered += 1
+                return chat_id, STATE_DELIVERED, None
+            except RetryAfter as e:
+                # Лимит превышен - паузу выдерживают все отправки, не только эта
+                error = str(e)
+                self.limiter.pause(retry_seconds(e))
+                logger.warning(f"Рассылка #{self.id}: {e}")
+            except (Forbidden, BadRequest) as e:
+                # Бот заблокирован или чат не найден - повтор не поможет
+                error = str(e)
+                break
+            except NetworkError as e:
+                error = str(e)
+                await asyncio.sleep(attempt)
+            except Exception as e:
+                error = str(e)
+                break
+        self.failed += 1
+        logger.warning(f"Рассылка #{self.id}: не удалось отправить сообщение {chat_id}: {error}")
+        return chat_id, STATE_FAILED, error
+
+    def format_progress(self):
+        """Текст статуса для сообщения в Telegram"""
+        counts = f"Доставлено: {self.delivered}, не доставлено: {self.failed} из {self.total}"
+        if self.status == self.DONE:
+            return f"✅ Рассылка #{self.id} завершена\n{counts}\nВремя: {format_duration(self.elapsed)}"
+        if self.status == self.CANCELLED:
+            return f"⛔ Рассылка #{self.id} отменена\n{counts}"
+        if self.status == self.FAILED:
+            return f"⚠️ Ошибка рассылки #{self.id}: {self.error}\n{counts}"
+        if self._task is not None and self._task.done():
+            return f"⏸ Рассылка #{self.id} приостановлена до перезапуска бота\n{counts}"
+        return f"📢 Рассылка #{self.id}...\n{counts}"
+
+
+class BroadcastManager:
+    """Запуск, отмена и возобновление рассылок с общим ограничением скорости"""
+
+    def __init__(self, store, send, rate=BROADCAST_RATE, workers=BROADCAST_WORKERS):
+        self.store = store
+        self.send = send
+        self.workers = workers
+        self.limiter = RateLimiter(rate)
+        self.jobs = {}  # id рассылки -> BroadcastJob
+
+    def _launch(self, broadcast_id, text):
+        job = BroadcastJob(broadcast_id, text, self.store, self.send, self.limiter, self.workers)
+        self.jobs[broadcast_id] = job.start()
+        return job
+
+    async def start(self, admin_id, text):
+        """Новая рассылка всем одобренным пользователям"""
+        if not text:
+            return False, "Пустое сообщение для рассылки"
+        broadcast_id = await self.store.broadcast_create(admin_id, text)
+        return True, self._launch(broadcast_id, text)
+
+    async def resume(self):
+        """Продолжение рассылок, прерванных остановкой бота: [(id админа, задача)]"""
+        resumed = []
+        for broadcast_id, admin_id, text in await self.store.broadcast_unfinished():
+            if broadcast_id not in self.jobs:
+                logger.info(f"Возобновление рассылки #{broadcast_id}")
+                resumed.append((admin_id, self._launch(broadcast_id, text)))
+        return resumed
+
+    def cancel(self, broadcast_id):
+        job = self.jobs.get(broadcast_id)
+        if not job or not job.cancel():
+            return False, "Рассылка уже завершена"
+        return True, "Рассылка отменяется"
+
+    async def stop(self):
+        """Остановка всех рассылок с сохранением прогресса"""
+        await asyncio.gather(*(job.stop() for job in self.jobs.values()))
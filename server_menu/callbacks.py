@@ -0,0 +1,117 @@
+import logging
+from telegram.ext import CallbackQueryHandler
+
+logger = logging.getLogger(__name__)
+
+SEPARATOR = ":"
+MAX_DATA = 64  # Лимит Telegram на callback_data (байт)
+STALE_TEXT = "Кнопка устарела - откройте меню заново"
+
+
+class CallbackDataError(ValueError):
+    """callback_data не соответствует действию или его аргументам"""
+
+
+def pack(action, *args):
+    """callback_data кнопки: действие и аргументы через ':' (например, admin_user:123)"""
+    data = SEPARATOR.join([action, *map(str, args)])
+    if len(data.encode()) > MAX_DATA:
+        raise CallbackDataError(f"callback_data длиннее {MAX_DATA} байт: {data}")
+    return data
+
+
+def _convert(kind, value):
+    """Аргумент по типу: int, str или кортеж допустимых значений"""
+    if isinstance(kind, tuple):
+        if value not in kind:
+            raise CallbackDataError(f"{value!r} не из {kind}")
+        return value
+    try:
+        return kind(value)
+    except ValueError as e:
+        raise CallbackDataError(str(e)) from None
+
+
+class CallbackRouter:
+    """Маршрутизация нажатий кнопок по действию из callback_data - поиск в словаре вместо перебора
+    регулярных выражений.
+
+    Каждое действие принадлежит ровно одному обработчику: повторная регистрация - ошибка при запуске,
+    поэтому порядок регистрации не влияет на то, кто обработает кнопку. Обработчик вызывается как
+    handler(update, context, *аргументы) с аргументами, уже приведёнными к типам действия.
+
+    Ограничение: действия диалогов (entry) в словарь не попадают. ConversationHandler сам хранит состояние
+    диалога и перебирает свои обработчики, поэтому до общего обработчика роутера кнопка проходит проверку
+    каждого диалога (у каждого - несколько сравнений имени действия, без регулярных выражений). Общий
+    обработчик и fallback регистрируются после диалогов, чтобы не перехватывать их кнопки.
+    """
+
+    def __init__(self):
+        self.routes = {}  # действие -> (обработчик, типы аргументов)
+        self.entries = set()  # Действия, обрабатываемые в ConversationHandler (см. entry)
+
+    def route(self, action, handler, *types):
+        """Регистрация действия, обрабатываемого общим CallbackQueryHandler роутера"""
+        if SEPARATOR in action:
+            raise ValueError(f"Недопустимое имя действия: {action}")
+        if action in self.routes or action in self.entries:
+            raise ValueError(f"Действие {action} уже зарегистрировано")
+        self.routes[action] = (handler, types)
+
+    def entry(self, action, handler, *types):
+        """CallbackQueryHandler одного действия для ConversationHandler (точки входа, состояния, отмена).
+
+        Такие действия не попадают в общий обработчик: иначе он перехватил бы нажатия раньше диалога.
+        Одно действие может использоваться в нескольких диалогах.
+        """
+        if action in self.routes:
+            raise ValueError(f"Действие {action} уже зарегистрировано в роутере")
+        self.entries.add(action)
+
+        async def callback(update, context):
+            try:
+                args = self._args(update.callback_query.data, types)
+            except CallbackDataError as e:
+                return await self._stale(update, e)
+            return await handler(update, context, *args)
+
+        return CallbackQueryHandler(callback, pattern=lambda data: self.action(data) == action)
+
+    @staticmethod
+    def action(data):
+        return data.split(SEPARATOR, 1)[0] if isinstance(data, str) else None
+
+    @staticmethod
+    def _args(data, types):
+        parts = data.split(SEPARATOR, len(types))[1:]
+        if len(parts) != len(types):
+            raise CallbackDataError(f"Ожидалось аргументов: {len(types)}, получено {len(parts)}")
+        return [_convert(kind, value) for kind, value in zip(types, parts)]
+
+    def owns(self, data):
+        """Фильтр CallbackQueryHandler: действие зарегистрировано в роутере"""
+        return self.action(data) in self.routes
+
+    async def dispatch(self, update, context):
+        data = update.callback_query.data
+        handler, types = self.routes[self.action(data)]
+        try:
+            args = self._args(data, types)
+        except CallbackDataError as e:
+            return await self._stale(update, e)
+        return await handler(update, context, *args)
+
+    @staticmethod
+    async def _stale(update, error=None):
+        """Ответ на кнопку старого формата или неизвестного действия (сообщения, отправленные до обновления бота)"""
+        query = update.callback_query
+        logger.warning(f"Необработанная кнопка {query.data!r}" + (f": {error}" if error else ""))
+        await query.answer(STALE_TEXT, show_alert=True)
+
+    def handler(self):
+        """Общий обработчик всех действий роутера"""
+        return CallbackQueryHandler(self.dispatch, pattern=self.owns)
+
+    def fallback(self):
+        """Обработчик для конца списка: кнопки, которые не обработал ни роутер, ни диалоги"""
+        return CallbackQueryHandler(self._stale)
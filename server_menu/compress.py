@@ -0,0 +1,92 @@
+import os
+import bz2
+import gzip
+import lzma
+import asyncio
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+BLOCK_SIZE = 8 * 1024 * 1024  # Размер независимо сжимаемого блока
+DEFAULT_WORKERS = max(1, (os.cpu_count() or 2) - 1)  # Одно ядро остаётся серверу
+# Процессы пула не создаются через fork: у бота уже работают цикл событий, поток базы и потоки job_queue,
+# и копия блокировки, захваченной другим потоком в момент fork, навсегда остановит процесс пула
+START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+# Кодек: (расширение файла, уровень по умолчанию, допустимые уровни).
+# Склеенные потоки каждого формата читаются стандартными утилитами (gzip -d, bzip2 -d, xz -d, tar -xaf)
+CODECS = {
+    "gzip": (".gz", 8, range(1, 10)),
+    "bz2": (".bz2", 9, range(1, 10)),
+    "xz": (".xz", 6, range(0, 10)),  # На уровнях 7-9 каждый процесс занимает сотни МБ памяти
+}
+
+
+def compress_block(codec, level, data):
+    """Сжатие одного блока в самостоятельный поток формата (выполняется в процессе пула)"""
+    if codec == "gzip":
+        return gzip.compress(data, compresslevel=level, mtime=0)
+    if codec == "bz2":
+        return bz2.compress(data, compresslevel=level)
+    return lzma.compress(data, format=lzma.FORMAT_XZ, preset=level)
+
+
+class ParallelCompressor:
+    """Сжатие потока данных независимыми блоками на нескольких ядрах с сохранением порядка блоков"""
+
+    def __init__(self, codec="gzip", level=None, workers=DEFAULT_WORKERS, block_size=BLOCK_SIZE):
+        if codec not in CODECS:
+            raise ValueError(f"Неизвестный кодек сжатия: {codec} (доступны: {', '.join(CODECS)})")
+        self.codec = codec
+        self.extension, default_level, levels = CODECS[codec]
+        self.level = default_level if level is None else level
+        if self.level not in levels:
+            raise ValueError(f"Недопустимый уровень сжатия {self.level} для {codec}")
+        self.workers = max(1, workers)
+        self.block_size = block_size
+        # В очереди не больше двух блоков на процесс, иначе быстрый tar заполнит память
+        self.max_pending = self.workers * 2
+        self._buffer = bytearray()
+        self._pending = deque()
+        self._submitted = 0
+        self._pool = None
+
+    def __enter__(self):
+        self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context(START_METHOD))
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Остановка пула; несжатые блоки отбрасываются"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        self._pending.clear()
+
+    def _submit(self, block):
+        loop = asyncio.get_running_loop()
+        self._submitted += 1
+        self._pending.append(loop.run_in_executor(self._pool, compress_block, self.codec, self.level, bytes(block)))
+
+    async def write(self, data):
+        """Приём очередной порции данных; возвращает готовые сжатые блоки по порядку"""
+        self._buffer += data
+        while len(self._buffer) >= self.block_size:
+            self._submit(self._buffer[:self.block_size])
+            del self._buffer[:self.block_size]
+        ready = []
+        while len(self._pending) > self.max_pending or (self._pending and self._pending[0].done()):
+            ready.append(await self._pending.popleft())
+        return ready
+
+    async def flush(self):
+        """Сжатие остатка и ожидание всех блоков"""
+        if self._buffer or not self._submitted:
+            self._submit(self._buffer)  # Пустой поток тоже должен дать корректный файл формата
+            self._buffer = bytearray()
+        ready = []
+        while self._pending:
+            ready.append(await self._pending.popleft())
+        return ready
@@ -0,0 +1,80 @@
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+
+# ===== СОБЫТИЯ СЕРВЕРА =====
+@dataclass(frozen=True)
+class ServerEvent:
+    """Событие из лога сервера"""
+    line: str = field(repr=False)  # Исходная строка лога
+    time: str = ""  # Время из строки лога (ЧЧ:ММ:СС)
+    received: datetime = field(default_factory=datetime.now, compare=False, repr=False)
+
+
+@dataclass(frozen=True)
+class PlayerJoined(ServerEvent):
+    player: str = ""
+
+
+@dataclass(frozen=True)
+class PlayerLeft(ServerEvent):
+    player: str = ""
+
+
+@dataclass(frozen=True)
+class ChatMessage(ServerEvent):
+    player: str = ""
+    text: str = ""
+
+
+@dataclass(frozen=True)
+class PlayerDied(ServerEvent):
+    player: str = ""
+    message: str = ""  # Сообщение о смерти целиком: "Steve was slain by Zombie"
+
+
+@dataclass(frozen=True)
+class ServerLagging(ServerEvent):
+    """Can't keep up! - сервер не успевает обрабатывать тики"""
+    behind_ms: int = 0
+    behind_ticks: int = 0
+
+
+@dataclass(frozen=True)
+class ServerStarted(ServerEvent):
+    startup_seconds: float = 0.0
+
+
+@dataclass(frozen=True)
+class ServerStopping(ServerEvent):
+    pass
+
+
+class EventBus:
+    """Рассылка событий подписчикам; ошибка одного подписчика не мешает остальным"""
+
+    def __init__(self):
+        self._subscribers = []  # (тип события, асинхронный обработчик)
+
+    def subscribe(self, event_type, callback):
+        """Подписка на события типа event_type (и его наследников)"""
+        self._subscribers.append((event_type, callback))
+        return callback
+
+    def unsubscribe(self, callback):
+        self._subscribers = [(t, cb) for t, cb in self._subscribers if cb is not callback]
+
+    async def publish(self, event):
+        """Вызов всех подходящих подписчиков одновременно"""
+        callbacks = [cb for event_type, cb in self._subscribers if isinstance(event, event_type)]
+        if not callbacks:
+            return
+        results = await asyncio.gather(*(cb(event) for cb in callbacks), return_exceptions=True)
+        for callback, result in zip(callbacks, results):
+            if isinstance(result, Exception):
+                logger.error(f"Ошибка обработчика {getattr(callback, '__qualname__', callback)} "
+                             f"события {type(event).__name__}: {result}")
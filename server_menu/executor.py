@@ -0,0 +1,152 @@
+import os
+import signal
+import asyncio
+import logging
+import weakref
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TIMEOUT = float(os.getenv("EXEC_TIMEOUT", "60"))  # Таймаут внешней команды по умолчанию (сек)
+MAX_CONCURRENT = int(os.getenv("EXEC_MAX_CONCURRENT", "4"))  # Одновременно запущенных процессов
+
+_limits = weakref.WeakKeyDictionary()  # Цикл событий -> семафор
+
+
+def _limit():
+    """Семафор MAX_CONCURRENT текущего цикла событий.
+
+    Семафор привязывается к циклу, в котором его впервые ждали, поэтому у каждого цикла свой
+    (например, у каждого asyncio.run в замерах и тестах)
+    """
+    loop = asyncio.get_running_loop()
+    limit = _limits.get(loop)
+    if limit is None:
+        limit = _limits[loop] = asyncio.Semaphore(MAX_CONCURRENT)
+    return limit
+
+
+class CommandError(Exception):
+    """Команда завершилась с ненулевым кодом"""
+
+    def __init__(self, result):
+        super().__init__(f"{result.args[0]} завершилась с кодом {result.returncode}: {result.tail(3)}")
+        self.result = result
+
+
+class CommandResult:
+    """Результат выполнения внешней команды"""
+
+    def __init__(self, args, returncode, stdout="", stderr="", timed_out=False):
+        self.args = args
+        self.returncode = returncode
+        self.stdout = stdout
+        self.stderr = stderr
+        self.timed_out = timed_out
+
+    @property
+    def ok(self):
+        return self.returncode == 0 and not self.timed_out
+
+    @property
+    def output(self):
+        """Объединённый вывод команды"""
+        return "\n".join(part for part in (self.stdout.strip(), self.stderr.strip()) if part)
+
+    def tail(self, lines=10):
+        """Последние строки вывода - для сообщений об ошибках"""
+        return "\n".join(self.output.splitlines()[-lines:])
+
+    def __repr__(self):
+        return f"CommandResult(args={self.args!r}, returncode={self.returncode}, timed_out={self.timed_out})"
+
+
+def _kill(process):
+    """Завершение процесса вместе со всей его группой (скрипты запускают sleep, screen и т.п.)"""
+    if process.returncode is not None:
+        return
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+
+
+async def run_command(args, timeout=DEFAULT_TIMEOUT, input=None, cwd=None):
+    """Асинхронный запуск команды без shell с захватом вывода, таймаутом и отменой"""
+    args = [str(arg) for arg in args]
+    async with _limit():
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *args,
+                stdin=asyncio.subprocess.PIPE if input is not None else asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+                cwd=cwd,
+                start_new_session=True  # Отдельная группа процессов, чтобы при таймауте убить и потомков
+            )
+        except OSError as e:
+            return CommandResult(args, 127, stderr=str(e))
+        data = input.encode("utf-8") if isinstance(input, str) else input
+        try:
+            stdout, stderr = await asyncio.wait_for(process.communicate(data), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Команда {args[0]} не завершилась за {timeout} сек и будет остановлена")
+            _kill(process)
+            stdout, stderr = await process.communicate()
+            return CommandResult(args, process.returncode, stdout.decode("utf-8", errors="replace"),
+                                 stderr.decode("utf-8", errors="replace"), timed_out=True)
+        except asyncio.CancelledError:
+            _kill(process)
+            await process.wait()
+            raise
+        return CommandResult(args, process.returncode, stdout.decode("utf-8", errors="replace"),
+                             stderr.decode("utf-8", errors="replace"))
+
+
+async def stream_command(args, chunk_size=1024 * 1024, cwd=None):
+    """Запуск команды с выдачей stdout блоками по мере поступления; при отмене процесс завершается"""
+    args = [str(arg) for arg in args]
+    async with _limit():
+        process = await asyncio.create_subprocess_exec(
+            *args,
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=cwd,
+            start_new_session=True
+        )
+        # stderr читается параллельно, иначе переполненный буфер остановит процесс
+        stderr_task = asyncio.ensure_future(process.stderr.read())
+        try:
+            while True:
+                chunk = await process.stdout.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+            await process.wait()
+        except BaseException:
+            _kill(process)
+            stderr_task.cancel()
+            await process.communicate()  # Дочитываем каналы, чтобы закрыть их вместе с процессом
+            raise
+        stderr = (await stderr_task).decode("utf-8", errors="replace")
+        if process.returncode != 0:
+            raise CommandError(CommandResult(args, process.returncode, stderr=stderr))
+
+
+async def is_screen_running(screen_name):
+    """Проверка, запущена ли screen сессия"""
+    result = await run_command(["screen", "-ls", screen_name], timeout=10)
+    # screen -ls возвращает ненулевой код даже при найденных сессиях, поэтому смотрим только на вывод
+    return any(screen_name in line.split()[0] for line in result.stdout.splitlines()
+               if line.strip() and "." in line.split()[0])
+
+
+async def send_to_screen(screen_name, command):
+    """Отправка строки в консоль сервера через screen"""
+    return await run_command(["screen", "-S", screen_name, "-p", "0", "-X", "stuff", f"{command}\r"], timeout=10)
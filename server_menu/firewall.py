@@ -0,0 +1,229 @@
+import os
+import re
+import sys
+import asyncio
+import logging
+import sqlite3
+import ipaddress
+from pathlib import Path
+from dotenv import load_dotenv
+from server_menu.executor import run_command
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# ufw - правило на IP, ipset - набор адресов и одно правило (переход с ufw: python -m server_menu.firewall migrate)
+FIREWALL_BACKEND = os.getenv("FIREWALL_BACKEND", "ufw")
+FIREWALL_PORT = int(os.getenv("FIREWALL_PORT", "25565"))  # Порт сервера, открываемый игрокам
+FIREWALL_SET = os.getenv("FIREWALL_SET", "minecraft_players")  # Имя набора ipset (для IPv6 - с суффиксом 6)
+FIREWALL_TIMEOUT = 30
+PROTOCOLS = ("tcp", "udp")
+
+
+class FirewallError(Exception):
+    """Команда firewall завершилась с ошибкой"""
+
+
+def split_families(ips):
+    """Разделение адресов на IPv4 и IPv6; некорректные адреса пропускаются"""
+    v4, v6 = set(), set()
+    for ip in ips:
+        try:
+            address = ipaddress.ip_address(str(ip).strip())
+        except ValueError:
+            logger.warning(f"Некорректный IP пропущен: {ip}")
+            continue
+        (v4 if address.version == 4 else v6).add(str(address))
+    return v4, v6
+
+
+async def _check(runner, args, input=None):
+    result = await runner(args, timeout=FIREWALL_TIMEOUT, input=input)
+    if not result.ok:
+        raise FirewallError(f"{' '.join(args[:3])}: {result.tail(3) or result.returncode}")
+    return result
+
+
+class Firewall:
+    """Общая часть вариантов firewall: сверка открытых адресов с нужными"""
+
+    async def ensure(self):
+        pass
+
+    async def members(self):
+        raise NotImplementedError
+
+    async def apply(self, add=(), remove=()):
+        raise NotImplementedError
+
+    async def reconcile(self, desired, dry_run=False):
+        """Приведение открытых адресов к desired: применяется только разница. Возвращает (добавить, удалить)"""
+        desired = set().union(*split_families(desired))
+        current = await self.members()
+        to_add, to_remove = sorted(desired - current), sorted(current - desired)
+        if not dry_run and (to_add or to_remove):
+            await self.apply(add=to_add, remove=to_remove)
+        return to_add, to_remove
+
+
+class IpsetFirewall(Firewall):
+    """Адреса игроков в наборах ipset hash:ip (IPv4 и IPv6) и постоянное число правил iptables, ссылающихся на них.
+
+    Проверка пакета - поиск в хеш-таблице, а не проход по правилу на каждого игрока. Изменения применяются
+    одним вызовом ipset restore на любое число адресов.
+    """
+
+    def __init__(self, runner=run_command, set_name=FIREWALL_SET, port=FIREWALL_PORT):
+        self.runner = runner
+        self.port = port
+        # (семейство ipset, имя набора, команда правил)
+        self.families = (("inet", set_name, "iptables"), ("inet6", f"{set_name}6", "ip6tables"))
+        self._ready = False
+
+    def _rule(self, set_name, protocol):
+        return ["INPUT", "-p", protocol, "--dport", str(self.port), "-m", "set", "--match-set", set_name, "src",
+                "-j", "ACCEPT"]
+
+    async def ensure(self):
+        """Создание наборов и правил, если их ещё нет (наборы ipset не сохраняются после перезагрузки)"""
+        if self._ready:
+            return
+        for family, set_name, tables in self.families:
+            await _check(self.runner, ["ipset", "create", set_name, "hash:ip", "family", family, "-exist"])
+            for protocol in PROTOCOLS:
+                rule = self._rule(set_name, protocol)
+                if not (await self.runner([tables, "-C", *rule], timeout=FIREWALL_TIMEOUT)).ok:
+                    await _check(self.runner, [tables, "-I", *rule])
+        self._ready = True
+
+    async def members(self):
+        """Адреса, открытые сейчас"""
+        await self.ensure()
+        ips = set()
+        for _, set_name, _ in self.families:
+            result = await _check(self.runner, ["ipset", "save", set_name])
+            for line in result.stdout.splitlines():
+                parts = line.split()
+                if len(parts) >= 3 and parts[0] == "add" and parts[1] == set_name:
+                    ips.add(parts[2])
+        return ips
+
+    async def apply(self, add=(), remove=()):
+        """Добавление и удаление адресов одной командой ipset restore"""
+        await self.ensure()
+        lines = []
+        for ips, command in ((remove, "del"), (add, "add")):
+            for family_ips, (_, set_name, _) in zip(split_families(ips), self.families):
+                lines += [f"{command} {set_name} {ip}" for ip in sorted(family_ips)]
+        if lines:
+            # -exist: повторное добавление и удаление отсутствующего адреса - не ошибка
+            await _check(self.runner, ["ipset", "restore", "-exist"], input="\n".join(lines) + "\n")
+
+
+class UfwFirewall(Firewall):
+    """Прежний вариант: правила ufw на каждый IP (tcp и udp)"""
+
+    STATUS_RE = re.compile(r"^(?P<port>\d+)/(?P<proto>tcp|udp)\s+ALLOW(?: IN)?\s+(?P<ip>[0-9A-Fa-f:.]+)\s*$")
+
+    def __init__(self, runner=run_command, port=FIREWALL_PORT):
+        self.runner = runner
+        self.port = port
+
+    async def members(self):
+        result = await _check(self.runner, ["ufw", "status"])
+        ips = set()
+        for line in result.stdout.splitlines():
+            match = self.STATUS_RE.match(line.strip())
+            if match and int(match["port"]) == self.port:
+                ips.add(match["ip"])
+        return ips
+
+    async def apply(self, add=(), remove=()):
+        for ips, prefix in ((remove, ["ufw", "delete", "allow"]), (add, ["ufw", "allow"])):
+            for ip in sorted(set().union(*split_families(ips))):
+                for protocol in PROTOCOLS:
+                    await _check(self.runner, [*prefix, "from", ip, "to", "any", "port", str(self.port),
+                                               "proto", protocol])
+
+
+BACKENDS = {"ipset": IpsetFirewall, "ufw": UfwFirewall}
+
+_firewall = None
+
+
+def get_firewall():
+    """Общий firewall для всех модулей бота (FIREWALL_BACKEND: ufw или ipset)"""
+    global _firewall
+    if _firewall is None:
+        if FIREWALL_BACKEND not in BACKENDS:
+            raise ValueError(f"Неизвестный FIREWALL_BACKEND={FIREWALL_BACKEND} (доступны: {', '.join(BACKENDS)})")
+        _firewall = BACKENDS[FIREWALL_BACKEND]()
+    return _firewall
+
+
+async def migrate(source, target, dry_run=False):
+    """Перенос открытых адресов из одного варианта firewall в другой (например, из правил ufw в набор ipset).
+
+    Адреса сначала открываются в target и только потом удаляются из source - игроки не теряют доступ.
+    Возвращает перенесённые адреса
+    """
+    ips = sorted(await source.members())
+    if not dry_run and ips:
+        await target.apply(add=ips)
+        await source.apply(remove=ips)
+    return ips
+
+
+def approved_ips(db_path):
+    """IP одобренных пользователей из users.db"""
+    with sqlite3.connect(db_path) as con:
+        return {row[0] for row in con.execute("SELECT ip FROM users WHERE approved=1 AND ip IS NOT NULL AND ip != ''")}
+
+
+USAGE = ("Использование: python -m server_menu.firewall reconcile [--dry-run] [users.db]\n"
+         "               python -m server_menu.firewall migrate [--dry-run] ufw ipset")
+
+
+async def _reconcile(paths, dry_run):
+    db_path = paths[0] if paths else Path(__file__).resolve().parent.parent / "users.db"
+    to_add, to_remove = await get_firewall().reconcile(approved_ips(db_path), dry_run=dry_run)
+    verb = "Будут" if dry_run else "Были"
+    print(f"{verb} добавлены: {', '.join(to_add) or '-'}\n{verb} удалены: {', '.join(to_remove) or '-'}")
+
+
+async def _migrate(names, dry_run):
+    if len(names) != 2 or set(names) - set(BACKENDS) or names[0] == names[1]:
+        print(USAGE, file=sys.stderr)
+        sys.exit(1)
+    source, target = (BACKENDS[name]() for name in names)
+    ips = await migrate(source, target, dry_run=dry_run)
+    verb = "Будут перенесены" if dry_run else "Перенесены"
+    print(f"{verb} из {names[0]} в {names[1]}: {', '.join(ips) or '-'}")
+    if not dry_run:
+        print(f"Укажите FIREWALL_BACKEND={names[1]} в .env и перезапустите бота")
+
+
+async def _main():
+    # python -m server_menu.firewall reconcile [--dry-run] [путь к users.db]
+    # python -m server_menu.firewall migrate [--dry-run] ufw ipset
+    args = sys.argv[1:]
+    commands = {"reconcile": _reconcile, "migrate": _migrate}
+    if not args or args[0] not in commands:
+        print(USAGE, file=sys.stderr)
+        sys.exit(1)
+    dry_run = "--dry-run" in args
+    paths = [arg for arg in args[1:] if arg != "--dry-run"]
+    try:
+        await commands[args[0]](paths, dry_run)
+    except (FirewallError, sqlite3.Error, ValueError) as e:
+        print(f"Ошибка firewall: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+def main():
+    asyncio.run(_main())
+
+
+if __name__ == "__main__":
+    main()
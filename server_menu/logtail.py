@@ -0,0 +1,75 @@
+import os
+
+BLOCK_SIZE = 64 * 1024  # Размер блока чтения с конца файла
+MAX_BYTES = 1024 * 1024  # Сколько байт максимум читается за один вызов
+
+
+def reverse_lines(path, block_size=BLOCK_SIZE, max_bytes=MAX_BYTES):
+    """Строки файла от последней к первой; читается блоками с конца, не больше max_bytes"""
+    with open(path, "rb") as f:
+        position = f.seek(0, os.SEEK_END)
+        limit = max(0, position - max_bytes) if max_bytes else 0
+        tail = b""
+        while position > limit:
+            size = min(block_size, position - limit)
+            position -= size
+            f.seek(position)
+            lines = (f.read(size) + tail).split(b"\n")
+            # Первая строка блока может быть неполной - она дочитается со следующим блоком
+            tail = lines.pop(0)
+            for line in reversed(lines):
+                if line:
+                    yield line.decode("utf-8", errors="replace").rstrip("\r")
+        # На границе лимита строка может быть обрезана - отдаём её, только если дошли до начала файла
+        if tail and limit == 0:
+            yield tail.decode("utf-8", errors="replace").rstrip("\r")
+
+
+class OffsetReader:
+    """Чтение только дописанных строк между вызовами с учётом ротации и усечения файла"""
+
+    def __init__(self, path, max_bytes=MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.offset = None  # None - файл ещё не открывался, чтение начнётся с конца
+        self.inode = None
+        self.generation = 0  # Увеличивается, когда файл начинается заново (ротация, усечение)
+        self._partial = b""
+
+    def reset(self):
+        self.offset = None
+        self.inode = None
+        self.generation += 1
+        self._partial = b""
+
+    def read_new(self):
+        """Новые полные строки с прошлого вызова (при первом вызове - пустой список)"""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            self.reset()
+            return []
+        if self.offset is None:
+            # Первый вызов - как tail -f, начинаем с конца файла
+            self.offset, self.inode = st.st_size, st.st_ino
+            return []
+        if st.st_ino != self.inode or st.st_size < self.offset:
+            # Файл заменён (ротация при перезапуске сервера) или усечён - читаем его с начала
+            self.offset, self.inode, self._partial = 0, st.st_ino, b""
+            self.generation += 1
+        if st.st_size == self.offset:
+            return []
+        start = self.offset
+        if st.st_size - start > self.max_bytes:
+            # Дописано слишком много - берём только конец, неполную первую строку отбрасываем
+            start, self._partial = st.st_size - self.max_bytes, b""
+        with open(self.path, "rb") as f:
+            data = self._partial + os.pread(f.fileno(), st.st_size - start, start)
+        if start != self.offset:
+            data = data.split(b"\n", 1)[1] if b"\n" in data else b""
+        self.offset = st.st_size
+        lines = data.split(b"\n")
+        self._partial = lines.pop()  # Строка без перевода строки ещё дописывается
+        if len(self._partial) > self.max_bytes:
+            self._partial = b""
+        return [line.decode("utf-8", errors="replace").rstrip("\r") for line in lines if line]
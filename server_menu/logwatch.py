@@ -0,0 +1,145 @@
+import os
+import re
+import asyncio
+import logging
+from dotenv import load_dotenv
+from server_menu.logtail import OffsetReader, reverse_lines
+from server_menu.events import (PlayerJoined, PlayerLeft, ChatMessage, PlayerDied, ServerLagging, ServerStarted,
+                                ServerStopping)
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+LOG_POLL_INTERVAL = float(os.getenv("LOG_POLL_INTERVAL", "1"))  # Как часто проверять новые строки лога (сек)
+
+# [12:34:56] [Server thread/INFO]: текст - у vanilla, [12:34:56] [Server thread/INFO] (Minecraft) текст - у Fabric
+LINE_RE = re.compile(r"^\[(?P<time>[\d:]+)\] \[(?P<thread>[^\]]+)/(?P<level>[A-Z]+)\](?: \([^)]*\))?:? (?P<msg>.*)$")
+NAME = r"(?P<player>[A-Za-z0-9_]{1,16})"
+JOIN_RE = re.compile(rf"^{NAME} joined the game$")
+LEAVE_RE = re.compile(rf"^{NAME} left the game$")
+CHAT_RE = re.compile(rf"^(?:\[Not Secure\] )?<{NAME}> (?P<text>.*)$")
+STARTED_RE = re.compile(r'^Done \((?P<seconds>[\d.]+)s\)! For help, type "help"')
+STOPPING_RE = re.compile(r"^Stopping (?:the )?server$")
+LAG_RE = re.compile(r"^Can't keep up! Is the server overloaded\? Running (?P<ms>\d+)ms or (?P<ticks>\d+) ticks behind")
+# Начала сообщений о смерти (после ника игрока) - по ним смерть отличается от прочих сообщений сервера
+DEATH_PHRASES = (
+    "was slain by", "was shot by", "was killed", "was blown up", "was fireballed", "was pummeled", "was pricked",
+    "was impaled", "was squashed", "was squished", "was poked", "was stung", "was obliterated", "was skewered",
+    "was struck by lightning", "was burnt", "was roasted", "was frozen", "was doomed", "was speared",
+    "was smashed", "drowned", "died", "blew up", "burned to death", "went up in flames", "went off with a bang",
+    "walked into", "hit the ground too hard", "fell", "starved to death", "suffocated", "withered away",
+    "froze to death", "tried to swim in lava", "discovered the floor was lava", "experienced kinetic energy",
+    "didn't want to live", "left the confines of this world", "was squished too much", "was killed by",
+)
+
+
+class LogParser:
+    """Разбор строк лога в события; помнит игроков онлайн, чтобы распознавать сообщения о смерти"""
+
+    def __init__(self):
+        self.online = set()
+
+    @staticmethod
+    def _match(line):
+        match = LINE_RE.match(line)
+        return match if match and match["thread"] == "Server thread" else None
+
+    def seed(self, lines):
+        """Игроки онлайн по уже записанным строкам лога, lines - от последней к первой.
+
+        Нужен при запуске слежения посреди работы сервера: иначе игроки, вошедшие до запуска бота,
+        не считаются онлайн и их смерти не распознаются
+        """
+        decided = set()
+        for line in lines:
+            match = self._match(line)
+            if not match:
+                continue
+            message = match["msg"]
+            if STARTED_RE.match(message) or STOPPING_RE.match(message):
+                break  # Более ранние строки относятся к прошлому запуску сервера
+            m = JOIN_RE.match(message) or LEAVE_RE.match(message)
+            if m and m["player"] not in decided:
+                decided.add(m["player"])  # Решает последняя строка о входе или выходе игрока
+                if JOIN_RE.match(message):
+                    self.online.add(m["player"])
+
+    def parse(self, line):
+        """Событие для строки лога или None"""
+        match = self._match(line)
+        if not match:
+            return None
+        time, message = match["time"], match["msg"]
+        if m := CHAT_RE.match(message):
+            return ChatMessage(line, time, player=m["player"], text=m["text"])
+        if m := JOIN_RE.match(message):
+            self.online.add(m["player"])
+            return PlayerJoined(line, time, player=m["player"])
+        if m := LEAVE_RE.match(message):
+            self.online.discard(m["player"])
+            return PlayerLeft(line, time, player=m["player"])
+        if m := LAG_RE.match(message):
+            return ServerLagging(line, time, behind_ms=int(m["ms"]), behind_ticks=int(m["ticks"]))
+        if m := STARTED_RE.match(message):
+            self.online.clear()
+            return ServerStarted(line, time, startup_seconds=float(m["seconds"]))
+        if STOPPING_RE.match(message):
+            return ServerStopping(line, time)
+        player, _, rest = message.partition(" ")
+        if match["level"] == "INFO" and player in self.online and rest.startswith(DEATH_PHRASES):
+            return PlayerDied(line, time, player=player, message=message)
+        return None
+
+
+class LogFollower:
+    """Слежение за latest.log: новые строки разбираются в события и публикуются в шину"""
+
+    def __init__(self, path, bus, poll_interval=LOG_POLL_INTERVAL):
+        self.reader = OffsetReader(path)
+        self.bus = bus
+        self.parser = LogParser()
+        self.poll_interval = poll_interval
+        self._task = None
+
+    @property
+    def online(self):
+        """Игроки онлайн по данным лога"""
+        return sorted(self.parser.online)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run())
+        return self
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def poll(self):
+        """Однократная обработка дописанных строк, возвращает опубликованные события"""
+        generation, first = self.reader.generation, self.reader.offset is None
+        lines = await asyncio.to_thread(self.reader.read_new)
+        if self.reader.generation != generation:
+            self.parser.online.clear()  # Новый лог - сервер перезапущен
+        if first and self.reader.offset is not None:
+            # Слежение начинается с конца лога - кто уже онлайн, видно по записанным строкам
+            await asyncio.to_thread(lambda: self.parser.seed(reverse_lines(self.reader.path)))
+        events = [event for event in map(self.parser.parse, lines) if event is not None]
+        for event in events:
+            await self.bus.publish(event)
+        return events
+
+    async def _run(self):
+        logger.info(f"Слежение за логом сервера {self.reader.path} запущено")
+        while True:
+            try:
+                await self.poll()
+            except Exception as e:
+                logger.error(f"Ошибка чтения лога сервера: {e}")
+            await asyncio.sleep(self.poll_interval)
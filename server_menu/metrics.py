@@ -0,0 +1,169 @@
+import os
+import math
+import time
+import asyncio
+import logging
+from array import array
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+METRICS_INTERVAL = float(os.getenv("METRICS_INTERVAL", "15"))  # Период сбора метрик (сек)
+# Уровни истории: (название, длина интервала в сек, сколько интервалов хранить)
+TIERS = (
+    ("1m", 60, 60),  # Последний час поминутно
+    ("5m", 300, 288),  # Последние сутки по 5 минут
+    ("1h", 3600, 168),  # Последняя неделя по часам
+)
+
+
+class RingBuffer:
+    """Кольцевой буфер чисел фиксированного размера в типизированном массиве"""
+
+    def __init__(self, capacity, typecode="d"):
+        self.capacity = capacity
+        self._data = array(typecode, bytes(array(typecode).itemsize * capacity))
+        self._next = 0
+        self.count = 0
+
+    def append(self, value):
+        self._data[self._next] = value
+        self._next = (self._next + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def values(self):
+        """Значения от старых к новым"""
+        if self.count < self.capacity:
+            return self._data[:self.count]
+        return self._data[self._next:] + self._data[:self._next]
+
+    def __len__(self):
+        return self.count
+
+
+class Tier:
+    """Один уровень истории: минимум, среднее и максимум за каждый интервал"""
+
+    def __init__(self, name, period, capacity):
+        self.name = name
+        self.period = period
+        self.mins = RingBuffer(capacity)
+        self.avgs = RingBuffer(capacity)
+        self.maxs = RingBuffer(capacity)
+        self.times = RingBuffer(capacity)  # Начало интервала (unix time)
+        self._bucket = None  # Номер текущего интервала
+        self._min = self._max = self._sum = 0.0
+        self._count = 0
+
+    def add(self, value, timestamp):
+        bucket = int(timestamp // self.period)
+        if bucket != self._bucket:
+            self._close()
+            self._bucket = bucket
+            self._min = self._max = self._sum = value
+            self._count = 1
+            return
+        self._min = min(self._min, value)
+        self._max = max(self._max, value)
+        self._sum += value
+        self._count += 1
+
+    def _close(self):
+        """Перенос накопленного интервала в буферы"""
+        if not self._count:
+            return
+        self.mins.append(self._min)
+        self.avgs.append(self._sum / self._count)
+        self.maxs.append(self._max)
+        self.times.append(self._bucket * self.period)
+        self._count = 0
+
+    def summary(self):
+        """(минимум, среднее, максимум) по всей истории уровня с учётом незакрытого интервала"""
+        mins, avgs, maxs = list(self.mins.values()), list(self.avgs.values()), list(self.maxs.values())
+        if self._count:
+            mins.append(self._min)
+            maxs.append(self._max)
+            avgs.append(self._sum / self._count)
+        if not avgs:
+            return None
+        return min(mins), sum(avgs) / len(avgs), max(maxs)
+
+
+class MetricSeries:
+    """История одной метрики на всех уровнях"""
+
+    def __init__(self, name, tiers=TIERS):
+        self.name = name
+        self.tiers = {tier_name: Tier(tier_name, period, capacity) for tier_name, period, capacity in tiers}
+        self.last = None
+
+    def add(self, value, timestamp=None):
+        if value is None or math.isnan(value):
+            return
+        timestamp = time.time() if timestamp is None else timestamp
+        self.last = value
+        for tier in self.tiers.values():
+            tier.add(value, timestamp)
+
+    def summary(self, tier="1m"):
+        return self.tiers[tier].summary()
+
+
+class MetricsSampler:
+    """Периодический сбор состояния сервера: готовый снимок для меню и история метрик"""
+
+    def __init__(self, server_service, interval=METRICS_INTERVAL):
+        self.server_service = server_service
+        self.interval = interval
+        self.series = {name: MetricSeries(name) for name in ("cpu", "ram", "tps")}
+        self.snapshot = None  # Последние значения: stats, uptime, world_size, sampled_at
+        self._lock = asyncio.Lock()
+
+    @property
+    def fresh(self):
+        """Снимок не старше двух периодов сбора"""
+        return self.snapshot is not None and time.monotonic() - self.snapshot["sampled_at"] < self.interval * 2
+
+    async def sample(self):
+        """Сбор метрик; параллельные вызовы не дублируют работу"""
+        async with self._lock:
+            if self.snapshot is not None and time.monotonic() - self.snapshot["sampled_at"] < 1:
+                return self.snapshot
+            stats, uptime, world_size = await asyncio.gather(
+                self.server_service.get_server_stats(),
+                self.server_service.get_uptime(),
+                self.server_service.get_world_size(),
+                return_exceptions=True
+            )
+            if isinstance(stats, Exception):
+                stats = {"error": f"⚠️ Ошибка мониторинга сервера: {stats}"}
+            now = time.time()
+            for name, key in (("cpu", "cpu_percent"), ("ram", "ram_mb"), ("tps", "tps_value")):
+                self.series[name].add(stats.get(key), now)
+            self.snapshot = {
+                "stats": stats,
+                "uptime": f"⚠️ Ошибка: {uptime}" if isinstance(uptime, Exception) else uptime,
+                "world_size": "N/A" if isinstance(world_size, Exception) else world_size,
+                "sampled_at": time.monotonic(),
+            }
+            return self.snapshot
+
+    async def job_callback(self, context):
+        """Задача job_queue"""
+        try:
+            await self.sample()
+        except Exception as e:
+            logger.error(f"Ошибка сбора метрик: {e}")
+
+    async def get_snapshot(self):
+        """Готовый снимок, если он свежий, иначе сбор на месте"""
+        if self.fresh:
+            return self.snapshot
+        return await self.sample()
+
+    def history(self, tier="1m"):
+        """{метрика: (мин, сред, макс)} за историю уровня"""
+        return {name: series.summary(tier) for name, series in self.series.items()}
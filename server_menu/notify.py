@@ -0,0 +1,102 @@
+import os
+import asyncio
+import logging
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_TIMEOUT = float(os.getenv("NOTIFY_TIMEOUT", "10"))  # Сколько ждать отправки одному получателю (сек)
+NOTIFY_COALESCE = float(os.getenv("NOTIFY_COALESCE", "2"))  # Уведомления за это время собираются в одно (сек)
+MAX_TEXT = 4000  # Лимит Telegram - 4096 символов в сообщении
+MAX_BUTTON_ROWS = 40  # Лимит Telegram - 100 кнопок в клавиатуре, в строке уведомления до двух
+
+
+async def send_many(send, chat_ids, timeout=NOTIFY_TIMEOUT):
+    """Одновременная отправка всем chat_ids через async send(chat_id).
+
+    Медленный или недоступный получатель не задерживает остальных: на каждого свой таймаут,
+    ошибки не прерывают отправку. Возвращает {chat_id: исключение или None}.
+    """
+    chat_ids = list(chat_ids)
+
+    async def deliver(chat_id):
+        await asyncio.wait_for(send(chat_id), timeout)
+
+    results = await asyncio.gather(*(deliver(chat_id) for chat_id in chat_ids), return_exceptions=True)
+    errors = {}
+    for chat_id, result in zip(chat_ids, results):
+        if isinstance(result, asyncio.TimeoutError):
+            result = TimeoutError(f"нет ответа за {timeout:g} сек")
+        if isinstance(result, BaseException):
+            logger.error(f"Не удалось отправить сообщение {chat_id}: {result}")
+        errors[chat_id] = result if isinstance(result, BaseException) else None
+    return errors
+
+
+class AdminNotifier:
+    """Уведомления админам без ожидания отправки.
+
+    Уведомления, пришедшие в пределах окна coalesce (например, несколько заявок подряд), уходят каждому
+    админу одним сообщением-сводкой с кнопками всех уведомлений.
+    """
+
+    def __init__(self, send, admin_ids, coalesce=NOTIFY_COALESCE, timeout=NOTIFY_TIMEOUT):
+        self.send = send  # async send(chat_id, text, buttons) - buttons: строки кнопок или None
+        self.admin_ids = admin_ids
+        self.coalesce = coalesce
+        self.timeout = timeout
+        self._pending = []  # (текст, строки кнопок)
+        self._task = None
+        self._wake = asyncio.Event()  # Досрочное завершение окна (остановка бота)
+
+    def notify(self, text, buttons=None):
+        """Постановка уведомления в очередь; отправка - после окна coalesce"""
+        self._pending.append((text, list(buttons or [])))
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._flush_later())
+
+    async def _flush_later(self):
+        # Уведомления, пришедшие во время отправки, видят живую задачу и не запускают свою -
+        # их отправляет следующий проход цикла
+        while self._pending:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.coalesce)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    async def flush(self):
+        """Немедленная отправка накопленных уведомлений"""
+        pending, self._pending = self._pending, []
+        for text, buttons in self._digests(pending):
+            await send_many(lambda chat_id: self.send(chat_id, text, buttons), self.admin_ids, self.timeout)
+
+    async def close(self):
+        """Отправка оставшихся уведомлений при остановке бота"""
+        self._wake.set()
+        if self._task is not None:
+            await self._task
+        await self.flush()
+
+    @staticmethod
+    def _digests(pending):
+        """Сводки из уведомлений с учётом лимитов Telegram на длину текста и число кнопок"""
+        chunk = []
+        for item in pending:
+            texts = [text for text, _ in chunk] + [item[0]]
+            rows = sum(len(buttons) for _, buttons in chunk) + len(item[1])
+            if chunk and (len("\n\n".join(texts)) > MAX_TEXT or rows > MAX_BUTTON_ROWS):
+                yield AdminNotifier._digest(chunk)
+                chunk = []
+            chunk.append(item)
+        if chunk:
+            yield AdminNotifier._digest(chunk)
+
+    @staticmethod
+    def _digest(chunk):
+        if len(chunk) == 1:
+            return chunk[0]
+        text = f"📬 Уведомлений: {len(chunk)}\n\n" + "\n\n".join(text for text, _ in chunk)
+        return text, [row for _, buttons in chunk for row in buttons]
@@ -0,0 +1,88 @@
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+RESCAN_INTERVAL = 5.0  # Не чаще одного полного перебора процессов, пока сервер не найден (сек)
+
+
+def is_minecraft_process(name, cmdline):
+    """Процесс сервера: java с minecraft и -jar в командной строке"""
+    joined = " ".join(cmdline or [])
+    return "java" in (name or "").lower() and "minecraft" in joined and "-jar" in joined
+
+
+class ProcessLocator:
+    """Поиск процесса сервера с кэшированием PID.
+
+    Найденный процесс хранится как долгоживущий psutil.Process: его PID перепроверяется по времени создания,
+    а cpu_percent считается между соседними замерами, а не за нулевой интервал.
+    """
+
+    def __init__(self, match=is_minecraft_process, rescan_interval=RESCAN_INTERVAL):
+        self.match = match
+        self.rescan_interval = rescan_interval
+        self._process = None
+        self._create_time = None
+        self._last_scan = 0.0
+        self._lock = threading.Lock()
+
+    def _valid(self):
+        """Процесс с тем же PID и временем создания ещё работает (PID мог достаться другому процессу)"""
+        import psutil
+        try:
+            return psutil.Process(self._process.pid).create_time() == self._create_time
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            return False
+
+    def _scan(self):
+        # psutil импортируется при первом поиске процесса (первый сбор метрик), а не при запуске бота
+        import psutil
+        self._last_scan = time.monotonic()
+        for proc in psutil.process_iter(attrs=["name", "cmdline"]):
+            if self.match(proc.info.get("name"), proc.info.get("cmdline")):
+                try:
+                    self._create_time = proc.create_time()
+                    proc.cpu_percent(None)  # Первый замер - точка отсчёта для следующих
+                except (psutil.NoSuchProcess, psutil.AccessDenied):
+                    continue
+                self._process = proc
+                logger.info(f"Найден процесс сервера Minecraft, PID {proc.pid}")
+                return proc
+        return None
+
+    def reset(self):
+        self._process = None
+        self._create_time = None
+
+    def find(self):
+        """Процесс сервера или None; полный перебор только если сохранённый процесс завершился"""
+        with self._lock:
+            if self._process is not None:
+                if self._valid():
+                    return self._process
+                logger.info(f"Процесс сервера Minecraft (PID {self._process.pid}) завершился")
+                self.reset()
+            if time.monotonic() - self._last_scan < self.rescan_interval:
+                return None
+            return self._scan()
+
+    def sample(self):
+        """Замер процесса сервера: {"pid", "cpu_percent", "rss", "create_time"} или None"""
+        process = self.find()
+        if process is None:
+            return None
+        import psutil
+        try:
+            with process.oneshot():
+                return {
+                    "pid": process.pid,
+                    "cpu_percent": process.cpu_percent(None),  # С момента прошлого замера
+                    "rss": process.memory_info().rss,
+                    "create_time": self._create_time,
+                }
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            with self._lock:
+                self.reset()
+            return None
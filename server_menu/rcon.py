@@ -0,0 +1,169 @@
+import os
+import time
+import struct
+import asyncio
+import logging
+import itertools
+from pathlib import Path
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Типы пакетов протокола RCON
+SERVERDATA_AUTH = 3
+SERVERDATA_AUTH_RESPONSE = 2
+SERVERDATA_EXECCOMMAND = 2
+SERVERDATA_RESPONSE_VALUE = 0
+# Несуществующий тип пакета: сервер отвечает на него отдельным пакетом,
+# что позволяет определить конец многопакетного ответа на команду
+SENTINEL_TYPE = 200
+
+MAX_PACKET_SIZE = 4096 + 14
+
+
+class RconError(Exception):
+    """Ошибка обмена с сервером по RCON"""
+
+
+class RconAuthError(RconError):
+    """Сервер отклонил пароль RCON"""
+
+
+class RconNoResponseError(RconError):
+    """Команда отправлена, но ответ не получен: сервер мог её выполнить, повторять команду нельзя"""
+
+
+class RconClient:
+    """Асинхронный RCON клиент с постоянным авторизованным соединением"""
+
+    def __init__(self, host, port, password, timeout=5.0, retry_delay=5.0):
+        self.host = host
+        self.port = int(port)
+        self.password = password
+        self.timeout = timeout
+        self.retry_delay = retry_delay  # Пауза между попытками переподключения
+        self._reader = None
+        self._writer = None
+        self._lock = asyncio.Lock()  # Команды выполняются строго по очереди в одном соединении
+        self._ids = itertools.count(1)
+        self._retry_at = 0.0
+
+    @property
+    def connected(self):
+        # Закрытие соединения сервером (перезапуск) видно по EOF ещё до отправки следующей команды
+        return self._writer is not None and not self._writer.is_closing() and not self._reader.at_eof()
+
+    async def _connect(self):
+        """Открытие соединения и авторизация"""
+        if time.monotonic() < self._retry_at:
+            raise RconError("RCON недоступен, повторная попытка позже")
+        try:
+            self._reader, self._writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port), self.timeout)
+            request_id = next(self._ids)
+            await self._send(request_id, SERVERDATA_AUTH, self.password)
+            # Перед ответом авторизации сервер может прислать пустой RESPONSE_VALUE
+            while True:
+                response_id, packet_type, _ = await asyncio.wait_for(self._read_packet(), self.timeout)
+                if packet_type == SERVERDATA_AUTH_RESPONSE:
+                    break
+            if response_id == -1:
+                raise RconAuthError("Неверный пароль RCON")
+            logger.info(f"RCON соединение с {self.host}:{self.port} установлено")
+        except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, RconError) as e:
+            await self.close()
+            self._retry_at = time.monotonic() + self.retry_delay
+            if isinstance(e, RconError):
+                raise
+            raise RconError(f"Не удалось подключиться к RCON {self.host}:{self.port}: {e!r}") from e
+
+    async def close(self):
+        """Закрытие соединения"""
+        writer, self._reader, self._writer = self._writer, None, None
+        if writer is not None:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except (OSError, asyncio.IncompleteReadError):
+                pass
+
+    async def _send(self, request_id, packet_type, body):
+        payload = struct.pack("<ii", request_id, packet_type) + body.encode("utf-8") + b"\x00\x00"
+        self._writer.write(struct.pack("<i", len(payload)) + payload)
+        await self._writer.drain()
+
+    async def _read_packet(self):
+        (length,) = struct.unpack("<i", await self._reader.readexactly(4))
+        if length < 10 or length > MAX_PACKET_SIZE:
+            raise RconError(f"Некорректная длина пакета RCON: {length}")
+        data = await self._reader.readexactly(length)
+        request_id, packet_type = struct.unpack("<ii", data[:8])
+        return request_id, packet_type, data[8:-2].decode("utf-8", errors="replace")
+
+    async def _execute(self, command):
+        request_id = next(self._ids)
+        sentinel_id = next(self._ids)
+        await self._send(request_id, SERVERDATA_EXECCOMMAND, command)
+        await self._send(sentinel_id, SENTINEL_TYPE, "")
+        parts = []
+        while True:
+            response_id, _, body = await self._read_packet()
+            if response_id == sentinel_id:
+                return "".join(parts)
+            if response_id == request_id:
+                parts.append(body)
+
+    async def command(self, command):
+        """Выполнение команды и получение ответа сервера.
+
+        RconError без отправки команды (нет соединения, неверный пароль) - команду можно отправить другим
+        способом. RconNoResponseError - команда уже отправлена, и повторная отправка могла бы выполнить её дважды
+        """
+        async with self._lock:
+            if not self.connected:
+                await self._connect()
+            try:
+                return await asyncio.wait_for(self._execute(command), self.timeout)
+            except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, RconError) as e:
+                await self.close()
+                raise RconNoResponseError(f"Команда {command.split(' ', 1)[0]} отправлена по RCON, "
+                                          f"но ответ не получен: {e!r}") from e
+
+
+def _read_server_properties(server_dir):
+    """Чтение настроек RCON из server.properties"""
+    properties = {}
+    path = Path(server_dir) / "server.properties"
+    if not path.exists():
+        return properties
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#") and "=" in line:
+                key, value = line.split("=", 1)
+                properties[key.strip()] = value.strip()
+    return properties
+
+
+_client = None
+
+
+def get_client():
+    """Общий RCON клиент для всех модулей бота, None если RCON не настроен"""
+    global _client
+    if _client is not None:
+        return _client
+    password = os.getenv("RCON_PASSWORD")
+    port = os.getenv("RCON_PORT")
+    if not password and os.getenv("SERVER_DIR"):
+        # Если в .env ничего не указано - берём настройки из конфигурации сервера
+        properties = _read_server_properties(os.getenv("SERVER_DIR"))
+        if properties.get("enable-rcon") == "true":
+            password = properties.get("rcon.password")
+            port = port or properties.get("rcon.port")
+    if not password:
+        return None
+    _client = RconClient(os.getenv("RCON_HOST", "127.0.0.1"), port or 25575, password)
+    return _client
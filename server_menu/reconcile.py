@@ -0,0 +1,143 @@
+import os
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from dotenv import load_dotenv
+from server_menu.whitelist import get_whitelist
+from server_menu.firewall import get_firewall
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+RECONCILE_INTERVAL = float(os.getenv("RECONCILE_INTERVAL", "3600"))  # Период сверки (сек), 0 - только при запуске
+# Убирать при сверке по расписанию игроков и IP, которых нет среди одобренных пользователей. По умолчанию
+# они только попадают в отчёт: whitelist и firewall могли быть дополнены вручную
+RECONCILE_PRUNE = os.getenv("RECONCILE_PRUNE", "0") == "1"
+
+
+@dataclass
+class ReconcilePlan:
+    """Расхождения между базой и whitelist.json / firewall - минимальный набор изменений.
+
+    whitelist_remove и firewall_remove - записи, которых нет в базе; удаляются только при prune
+    """
+    whitelist_add: list = field(default_factory=list)
+    whitelist_remove: list = field(default_factory=list)
+    firewall_add: list = field(default_factory=list)
+    firewall_remove: list = field(default_factory=list)
+    errors: list = field(default_factory=list)
+    prune: bool = False
+
+    @property
+    def extras(self):
+        """Записи whitelist и firewall, которых нет среди одобренных пользователей"""
+        return bool(self.whitelist_remove or self.firewall_remove)
+
+    @property
+    def empty(self):
+        """Нечего применять"""
+        return not (self.whitelist_add or self.firewall_add or (self.prune and self.extras))
+
+    def format(self, applied=False):
+        """Отчёт для сообщения в Telegram"""
+        if self.empty and not self.extras and not self.errors:
+            return "✅ База, whitelist и firewall совпадают"
+        verb = "Выполнено" if applied else "Будет выполнено"
+        lines = [f"🧮 Сверка с базой. {verb}:"] if not self.empty else []
+        sections = [("➕ В whitelist", self.whitelist_add), ("➕ В firewall", self.firewall_add)]
+        if self.prune:
+            sections += [("➖ Из whitelist", self.whitelist_remove), ("➖ Из firewall", self.firewall_remove)]
+        for title, items in sections:
+            if items:
+                lines.append(f"{title} ({len(items)}): {', '.join(items)}")
+        if self.extras and not self.prune:
+            lines.append("❔ Нет в базе (не удаляются):")
+            for title, items in (("whitelist", self.whitelist_remove), ("firewall", self.firewall_remove)):
+                if items:
+                    lines.append(f"{title} ({len(items)}): {', '.join(items)}")
+        lines += [f"⚠️ {error}" for error in self.errors]
+        return "\n".join(lines)
+
+
+class Reconciler:
+    """Сверка whitelist.json и firewall с одобренными пользователями базы за один проход.
+
+    По расписанию недостающие записи добавляются, а лишние (без prune) только сообщаются админам через
+    notify(text) - один раз для каждого нового набора лишних записей
+    """
+
+    def __init__(self, load_players, whitelist=None, firewall=None, prune=RECONCILE_PRUNE, notify=None):
+        self.load_players = load_players  # async () -> [(ник, IP)] одобренных пользователей
+        self.whitelist = whitelist or get_whitelist()
+        self.firewall = firewall or get_firewall()
+        self.prune = prune
+        self.notify = notify
+        self._reported = None  # Лишние записи из последнего уведомления
+        self._lock = asyncio.Lock()  # Периодическая сверка и сверка из меню не выполняются одновременно
+
+    async def plan(self, prune=None):
+        """Изменения, нужные для совпадения с базой (без применения). prune=None - по настройке"""
+        players = await self.load_players()
+        nicks = {nick.lower() for nick, _ in players if nick}
+        ips = [ip for _, ip in players if ip]
+        plan = ReconcilePlan(prune=self.prune if prune is None else prune)
+        try:
+            current = await asyncio.to_thread(self.whitelist.names)
+            plan.whitelist_add = sorted(nicks - current)
+            plan.whitelist_remove = sorted(current - nicks)
+        except Exception as e:
+            plan.errors.append(f"Не удалось прочитать whitelist: {e}")
+        try:
+            plan.firewall_add, plan.firewall_remove = await self.firewall.reconcile(ips, dry_run=True)
+        except Exception as e:
+            plan.errors.append(f"Не удалось прочитать firewall: {e}")
+        return plan
+
+    async def apply(self, prune=None):
+        """Сверка и применение расхождений: одна запись whitelist с одной перезагрузкой и одна пачка firewall.
+
+        Лишние записи удаляются только при prune (None - по настройке RECONCILE_PRUNE)
+        """
+        async with self._lock:
+            plan = await self.plan(prune)
+            whitelist_remove = plan.whitelist_remove if plan.prune else []
+            firewall_remove = plan.firewall_remove if plan.prune else []
+            if plan.whitelist_add or whitelist_remove:
+                try:
+                    change = await self.whitelist.apply(add=plan.whitelist_add, remove=whitelist_remove)
+                    if change.unresolved:
+                        plan.errors.append(f"Не найден UUID игроков: {', '.join(change.unresolved)}")
+                    if change.error:
+                        plan.errors.append(f"Whitelist записан, но не перезагружен: {change.error}")
+                except Exception as e:
+                    plan.errors.append(f"Ошибка изменения whitelist: {e}")
+            if plan.firewall_add or firewall_remove:
+                try:
+                    await self.firewall.apply(add=plan.firewall_add, remove=firewall_remove)
+                except Exception as e:
+                    plan.errors.append(f"Ошибка изменения firewall: {e}")
+            if not plan.empty:
+                logger.info(plan.format(applied=True))
+            for error in plan.errors:
+                logger.warning(f"Сверка с базой: {error}")
+            return plan
+
+    def _report_extras(self, plan):
+        """Сообщение о лишних записях, если их набор изменился с прошлого уведомления"""
+        extras = None if plan.prune or not plan.extras else (tuple(plan.whitelist_remove), tuple(plan.firewall_remove))
+        if extras is None or extras == self._reported:
+            self._reported = extras
+            return
+        self._reported = extras
+        logger.warning("Сверка с базой: в whitelist или firewall есть записи, которых нет в базе: "
+                       f"{', '.join(plan.whitelist_remove + plan.firewall_remove)}")
+        if self.notify is not None:
+            self.notify(plan.format(applied=True))
+
+    async def job_callback(self, context):
+        """Задача job_queue"""
+        try:
+            self._report_extras(await self.apply())
+        except Exception as e:
+            logger.error(f"Ошибка сверки whitelist и firewall с базой: {e}")
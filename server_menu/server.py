@@ -1,10 +1,18 @@
 import os
-import subprocess
+import re
+import logging
 from pathlib import Path
 from dotenv import load_dotenv
+from server_menu.rcon import get_client, RconError, RconNoResponseError
+from server_menu.executor import send_to_screen
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+PLAYER_BAN_RE = re.compile(r'([A-Za-z0-9_]+) was banned by ')
+IP_BAN_RE = re.compile(r'((?:\d{1,3}\.){3}\d{1,3}|[0-9A-Fa-f]*:[0-9A-Fa-f:]+) was banned by ')
+
 
 class Server:
     def __init__(self, bot):
@@ -21,101 +29,121 @@ class Server:
             raise ValueError(f"Директория сервера {self.server_dir} не существует")
         if not self.scripts_dir.exists():
             raise ValueError(f"Директория скриптов {self.scripts_dir} не существует")
+        self.rcon = get_client()  # None - RCON не настроен, команды идут через screen
 
-    def _run_screen_command(self, command):
+    async def _run_screen_command(self, command):
         """Универсальный метод отправки команд в screen сессию"""
-        try:
-            full_cmd = f'screen -S {self.screen_name} -p 0 -X stuff "{command}^M"'
-            subprocess.run(full_cmd, shell=True, check=True, executable='/bin/bash')
+        result = await send_to_screen(self.screen_name, command)
+        if result.ok:
             return True, "Команда успешно выполнена"
-        except subprocess.CalledProcessError as e:
-            return False, f"Ошибка выполнения команды: {str(e)}"
+        return False, f"Ошибка выполнения команды: {result.tail() or result.returncode}"
 
-    def send_chat_message(self, message):
+    async def _query(self, command):
+        """Выполнение команды с получением ответа сервера (только через RCON)"""
+        if not self.rcon:
+            return False, "RCON не настроен, ответ сервера недоступен"
+        try:
+            return True, await self.rcon.command(command)
+        except RconError as e:
+            return False, str(e)
+
+    async def _run_command(self, command):
+        """Отправка команды на сервер через RCON, при недоступности RCON - через screen.
+
+        Команда, отправленная по RCON без ответа, в screen не повторяется: ban, give, say и stop выполнились бы дважды
+        """
+        if self.rcon:
+            try:
+                response = await self.rcon.command(command)
+                return True, response or "Команда успешно выполнена"
+            except RconNoResponseError as e:
+                logger.error(str(e))
+                return False, f"{e}. Команда не повторяется - проверьте результат на сервере"
+            except RconError as e:
+                logger.warning(f"RCON недоступен, команда отправлена через screen: {e}")
+        return await self._run_screen_command(command)
+
+    async def send_chat_message(self, message):
         """Отправка сообщения в глобальный чат"""
-        return self._run_screen_command(f'say {message}')
+        return await self._run_command(f'say {message}')
 
-    def send_private_message(self, player, message):
+    async def send_private_message(self, player, message):
         """Отправка приватного сообщения игроку"""
-        return self._run_screen_command(f'tell {player} {message}')
+        return await self._run_command(f'tell {player} {message}')
 
-    def set_weather(self, weather_type):
+    async def set_weather(self, weather_type):
         """Установка погоды на сервере"""
         weather_type = weather_type.lower()
         valid_weather = ["clear", "rain", "thunder"]
         if weather_type not in valid_weather:
             return False, "Неверный тип погоды. Допустимо: clear, rain, thunder"
-        success, msg = self._run_screen_command(f'weather {weather_type}')
+        success, msg = await self._run_command(f'weather {weather_type}')
         if success:
             return True, f"Погода изменена на {weather_type}"
         return False, f"Ошибка изменения погоды: {msg}"
 
-    def get_online_players(self):
+    async def get_online_players(self):
         """Получение списка онлайн игроков"""
-        return self._run_screen_command("list")
+        success, response = await self._query("list")
+        if not success:
+            return False, response
+        # Ответ вида "There are 2 of a max of 20 players online: Steve, Alex"
+        _, _, players = response.partition(':')
+        return True, [player.strip() for player in players.split(',') if player.strip()]
 
-    def find_player(self, player):
+    async def find_player(self, player):
         """Показывает координаты игрока"""
-        return self._run_screen_command(f"execute {player} ~ ~ ~ tp @s")
+        return await self._run_command(f"execute {player} ~ ~ ~ tp @s")
 
-    def set_time(self, time_of_day):
+    async def set_time(self, time_of_day):
         """Позволяет изменить день/ночь на сервере"""
         valid_times = ["day", "night", "noon", "midnight"]
         if time_of_day.lower() not in valid_times:
             return False, "Неверное время суток. Допустимо: day, night, noon, midnight"
-        return self._run_screen_command(f"time set {time_of_day}")
+        return await self._run_command(f"time set {time_of_day}")
 
-    def enable_pvp(self):
+    async def enable_pvp(self):
         """Включает PVP"""
-        return self._run_screen_command("gamerule pvp true")
+        return await self._run_command("gamerule pvp true")
 
-    def disable_pvp(self):
+    async def disable_pvp(self):
         """Выключает PVP"""
-        return self._run_screen_command("gamerule pvp false")
+        return await self._run_command("gamerule pvp false")
 
-    def set_difficulty(self, difficulty):
+    async def set_difficulty(self, difficulty):
         """Меняет сложность игры"""
         valid_difficulties = ["peaceful", "easy", "normal", "hard"]
         if difficulty.lower() not in valid_difficulties:
             return False, "Неверная сложность. Допустимо: peaceful, easy, normal, hard"
-        return self._run_screen_command(f"difficulty {difficulty}")
+        return await self._run_command(f"difficulty {difficulty}")
 
-    def ban_player(self, player):
+    async def ban_player(self, player):
         """Блокировка игрока"""
-        return self._run_screen_command(f"ban {player}")
+        return await self._run_command(f"ban {player}")
 
-    def unban_player(self, player):
+    async def unban_player(self, player):
         """Снятие блокировки с игрока"""
-        return self._run_screen_command(f"pardon {player}")
+        return await self._run_command(f"pardon {player}")
 
-    def get_banned_players(self):
+    async def get_banned_players(self):
         """Получение списка забаненных игроков"""
-        success, response = self._run_screen_command("banlist")
+        success, response = await self._query("banlist players")
         if not success:
             return False, response
-        banned_players = []
-        for line in response.split('\n'):
-            line = line.strip()
-            if line and not line.startswith("There are"):
-                banned_players.append(line.split(' - ')[0])
-        return True, banned_players
-
-    def ban_ip(self, ip_address):
+        # RCON склеивает строки ответа, поэтому имена ищутся по шаблону "<ник> was banned by"
+        return True, PLAYER_BAN_RE.findall(response)
+
+    async def ban_ip(self, ip_address):
         """Блокировка IP-адреса"""
-        return self._run_screen_command(f"ban-ip {ip_address}")
+        return await self._run_command(f"ban-ip {ip_address}")
 
-    def pardon_ip(self, ip_address):
+    async def pardon_ip(self, ip_address):
         """Снятие блокировки IP-адреса"""
-        return self._run_screen_command(f"pardon-ip {ip_address}")
+        return await self._run_command(f"pardon-ip {ip_address}")
 
-    def get_banned_ips(self):
+    async def get_banned_ips(self):
         """Получение списка забаненных IP"""
-        success, response = self._run_screen_command("banlist ips")
+        success, response = await self._query("banlist ips")
         if not success:
             return False, response
-        banned_ips = []
-        for line in response.split('\n'):
-            line = line.strip()
-            if line and not line.startswith("There are"):
-                banned_ips.append(line.split(' - ')[0])
-        return True, banned_ips
+        return True, IP_BAN_RE.findall(response)
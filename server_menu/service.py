@@ -1,14 +1,22 @@
-import re
 import os
-import subprocess
+import asyncio
+import logging
 from pathlib import Path
 from dotenv import load_dotenv
-import psutil
+from server_menu.rcon import get_client, RconError, RconNoResponseError
+from server_menu.executor import run_command, is_screen_running, send_to_screen
+from server_menu.process import ProcessLocator
+from server_menu.logtail import reverse_lines, OffsetReader
+from server_menu.world_index import WorldSizeIndex, DIMENSION_NAMES, FOLDERS, OTHER
+from server_menu.utils import format_size
 import time
-from datetime import datetime, timedelta
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+SCRIPT_TIMEOUT = float(os.getenv("SCRIPT_TIMEOUT", "300"))  # Таймаут bash-скриптов (restart.sh ждёт 40+ сек)
+
 
 class Service:
     def __init__(self, bot):
@@ -25,148 +33,194 @@ class Service:
             raise ValueError(f"Директория сервера {self.server_dir} не существует")
         if not self.scripts_dir.exists():
             raise ValueError(f"Директория скриптов {self.scripts_dir} не существует")
-
-    def _run_screen_command(self, command):
+        self.rcon = get_client()  # None - RCON не настроен, команды идут через screen
+        self.world_index = WorldSizeIndex(self.server_dir / "world")
+        self.process = ProcessLocator()  # Процесс сервера Minecraft, PID кэшируется между запросами
+        self.log_file = self.server_dir / "logs/latest.log"
+        self.log_reader = OffsetReader(self.log_file)  # Между запросами статистики читаются только новые строки
+        self._tps = None  # (поколение лога, TPS) - последнее найденное значение
+        self._backups = None
+
+    @property
+    def backups(self):
+        """Менеджер копий мира. Создаётся при первом обращении: модули сжатия и хранилища копий
+        не нужны для запуска бота"""
+        if self._backups is None:
+            from server_menu.backup import BackupManager
+            self._backups = BackupManager(self.server_dir, self.world_index)
+        return self._backups
+
+    async def _run_screen_command(self, command):
         """Универсальный метод отправки команд в screen сессию"""
-        try:
-            full_cmd = f'screen -S {self.screen_name} -p 0 -X stuff "{command}^M"'
-            subprocess.run(full_cmd, shell=True, check=True, executable='/bin/bash')
+        result = await send_to_screen(self.screen_name, command)
+        if result.ok:
             return True, "Команда успешно выполнена"
-        except subprocess.CalledProcessError as e:
-            return False, f"Ошибка выполнения команды: {str(e)}"
-
-    def _run_script(self, script_name):
+        return False, f"Ошибка выполнения команды: {result.tail() or result.returncode}"
+
+    async def _run_command(self, command):
+        """Отправка команды на сервер через RCON, при недоступности RCON - через screen.
+
+        Команда, отправленная по RCON без ответа, в screen не повторяется
+        """
+        if self.rcon:
+            try:
+                response = await self.rcon.command(command)
+                return True, response or "Команда успешно выполнена"
+            except RconNoResponseError as e:
+                logger.error(str(e))
+                return False, f"{e}. Команда не повторяется - проверьте результат на сервере"
+            except RconError as e:
+                logger.warning(f"RCON недоступен, команда отправлена через screen: {e}")
+        return await self._run_screen_command(command)
+
+    async def _run_script(self, script_name, timeout=SCRIPT_TIMEOUT):
         """Запуск bash-скрипта"""
         script_path = self.scripts_dir / script_name
         if not script_path.exists():
             return False, f"Скрипт {script_name} не найден"
-        try:
-            subprocess.run(["bash", str(script_path)], check=True)
-            return True, f"Скрипт {script_name} выполнен успешно"
-        except subprocess.CalledProcessError as e:
-            return False, f"Ошибка выполнения скрипта {script_name}: {e}"
-
-    def start_server(self):
+        result = await run_command(["bash", script_path], timeout=timeout)
+        if result.timed_out:
+            return False, f"Скрипт {script_name} не завершился за {timeout:.0f} сек и был остановлен"
+        if not result.ok:
+            return False, f"Ошибка выполнения скрипта {script_name} (код {result.returncode}):\n{result.tail()}"
+        return True, f"Скрипт {script_name} выполнен успешно"
+
+    async def start_server(self):
         """Запуск сервера"""
-        return self._run_script("start.sh")
+        return await self._run_script("start.sh")
 
-    def stop_server(self):
+    async def stop_server(self):
         """Остановка сервера"""
-        return self._run_script("stop.sh")
+        return await self._run_script("stop.sh")
 
-    def restart_server(self):
+    async def restart_server(self):
         """Перезагрузка сервера"""
-        return self._run_script("restart.sh")
+        return await self._run_script("restart.sh")
 
     def backup_world(self):
-        """Создание резервной копии мира"""
-        return self._run_script("backup.sh")
+        """Запуск создания резервной копии мира в фоне, возвращает задачу копирования"""
+        return self.backups.start()
+
+    def get_backup_job(self):
+        """Текущая или последняя задача копирования мира"""
+        return self.backups.job
+
+    def cancel_backup(self):
+        """Отмена создания резервной копии мира"""
+        return self.backups.cancel()
 
-    def get_server_status(self):
+    async def get_server_status(self):
         """Получение статуса сервера"""
         try:
-            result = subprocess.run(
-                ["screen", "-ls", self.screen_name],
-                capture_output=True,
-                text=True
-            )
-            if f"{self.screen_name}" in result.stdout:
+            if await is_screen_running(self.screen_name):
                 return "Сервер работает"
             return "Сервер остановлен"
         except Exception as e:
             return f"Ошибка проверки статуса: {str(e)}"
 
-    def get_world_size(self):
-        """Получение размера мира"""
-        world_dir = self.server_dir / "world"
-        if not world_dir.exists():
+    async def get_world_size(self):
+        """Получение размера мира с разбивкой по измерениям и папкам"""
+        if not self.world_index.root.exists():
             return "Директория мира не найдена"
-        total_size = 0
-        for dirpath, _, filenames in os.walk(world_dir):
-            for f in filenames:
-                fp = os.path.join(dirpath, f)
-                total_size += os.path.getsize(fp)
-        return f"{total_size / 1024 / 1024:.2f} MB"
-
-    def enable_logging(self):
+        breakdown = await asyncio.to_thread(self.world_index.breakdown)
+        total_size = sum(sum(folders.values()) for folders in breakdown.values())
+        lines = [f"{total_size / 1024 / 1024:.2f} MB"]
+        # Сначала стандартные измерения, затем измерения модов по убыванию размера
+        order = [d for d in DIMENSION_NAMES if d in breakdown]
+        order += sorted((d for d in breakdown if d not in DIMENSION_NAMES), key=lambda d: -sum(breakdown[d].values()))
+        for dimension in order:
+            folders = breakdown[dimension]
+            parts = [f"{'прочее' if folder == OTHER else folder} {format_size(folders[folder])}"
+                     for folder in FOLDERS + (OTHER,) if folders.get(folder)]
+            lines.append(f"   • {DIMENSION_NAMES.get(dimension, dimension)}: {format_size(sum(folders.values()))}"
+                         + (f" ({', '.join(parts)})" if parts else ""))
+        return "\n".join(lines)
+
+    async def enable_logging(self):
         """Запуск логирования в screen"""
-        try:
-            command = 'screen -dmS mineservtelebot_logs_py python3 /root/minecraft/mineservtelebot/server_menu/logs.py'
-            subprocess.run(command, shell=True, check=True)
+        result = await run_command(["screen", "-dmS", "mineservtelebot_logs_py", "python3",
+                                    "/root/minecraft/mineservtelebot/server_menu/logs.py"], timeout=10)
+        if result.ok:
             return True, "Логирование запущено в screen-сессии"
-        except subprocess.CalledProcessError as e:
-            return False, f"Ошибка запуска логирования: {str(e)}"
+        return False, f"Ошибка запуска логирования: {result.tail() or result.returncode}"
 
-    def disable_logging(self):
+    async def disable_logging(self):
         """Остановка screen-сессии с логированием"""
-        try:
-            subprocess.run(["screen", "-S", "mineservtelebot_logs_py", "-XS", "quit"], check=True)
+        result = await run_command(["screen", "-S", "mineservtelebot_logs_py", "-X", "quit"], timeout=10)
+        if result.ok:
             return True, "Логирование остановлено"
-        except subprocess.CalledProcessError as e:
-            return False, f"Ошибка остановки логирования: {str(e)}"
+        return False, f"Ошибка остановки логирования: {result.tail() or result.returncode}"
 
-    def execute_command(self, command):
+    async def execute_command(self, command):
         """Выполнение произвольной команды на сервере"""
-        return self._run_screen_command(command)
+        return await self._run_command(command)
 
-    def get_server_stats(self):
+    async def get_server_stats(self):
         """Получение статистики сервера: CPU, RAM, TPS"""
         stats = {"cpu": "❌ N/A", "ram": "❌ N/A", "tps": "❌ N/A"}
         try:
             # Проверяем, запущена ли screen-сессия
-            result = subprocess.run(["screen", "-ls"], capture_output=True, text=True)
-            screen_sessions = [line.split()[0] for line in result.stdout.split("\n") if self.screen_name in line]
-            if not screen_sessions:
+            if not await is_screen_running(self.screen_name):
                 return {"error": "🔴 Screen-сессия не запущена"}
             # Ищем процесс Minecraft
-            server_running = False
-            for proc in psutil.process_iter(attrs=['pid', 'name', 'cmdline', 'memory_info', 'cpu_percent']):
-                proc_info = proc.as_dict(attrs=['pid', 'name', 'cmdline', 'memory_info', 'cpu_percent'])
-                cmdline = ' '.join(proc_info.get('cmdline', []))
-                if 'java' in proc_info.get('name', '').lower() and 'minecraft' in cmdline and '-jar' in cmdline:
-                    server_running = True
-                    stats.update({
-                        "cpu": f"{proc_info.get('cpu_percent', 0)}%",
-                        "ram": f"{proc_info.get('memory_info').rss / 1024 / 1024:.2f} MB"
-                    })
-                    break
-            if not server_running:
+            sample = await asyncio.to_thread(self.process.sample)
+            if sample is None:
                 return {"error": "🔴 Сервер запущен, но процесс Minecraft не найден"}
+            cpu_percent = sample["cpu_percent"]
+            ram_mb = sample["rss"] / 1024 / 1024
+            stats.update({
+                "cpu": f"{cpu_percent:.1f}%",
+                "ram": f"{ram_mb:.2f} MB",
+                "cpu_percent": cpu_percent,  # Числовые значения - для истории метрик
+                "ram_mb": ram_mb
+            })
             # Читаем TPS из логов
-            log_file = self.server_dir / "logs/latest.log"
-            if log_file.exists():
+            if self.log_file.exists():
                 try:
-                    with open(log_file, 'r', encoding='utf-8') as f:
-                        for line in reversed(list(f)[-100:]):  # Читаем в обратном порядке
-                            if "Mean tick time:" in line:
-                                try:
-                                    tick_time = float(line.split("Mean tick time:")[1].split()[0])
-                                    stats["tps"] = f"{min(20.0, 1000 / tick_time):.1f}"
-                                except (IndexError, ValueError):
-                                    pass
-                                break
+                    tps = await asyncio.to_thread(self._read_tps)
+                    if tps is not None:
+                        stats["tps"] = tps
+                        stats["tps_value"] = float(tps)
                 except Exception as e:
                     stats["error"] = f"⚠️ Ошибка чтения логов: {str(e)}"
         except Exception as e:
             stats["error"] = f"⚠️ Ошибка мониторинга сервера: {str(e)}"
         return stats
 
-    def get_uptime(self):
+    @staticmethod
+    def _find_tps(lines):
+        """TPS из первой строки с временем тика (строки идут от новых к старым)"""
+        for line in lines:
+            if "Mean tick time:" in line:
+                try:
+                    tick_time = float(line.split("Mean tick time:")[1].split()[0])
+                    return f"{min(20.0, 1000 / tick_time):.1f}"
+                except (IndexError, ValueError, ZeroDivisionError):
+                    return None
+        return None
+
+    def _read_tps(self):
+        """Последнее значение TPS из лога; объём чтения не зависит от размера лога"""
+        tps = self._find_tps(reversed(self.log_reader.read_new()))
+        generation = self.log_reader.generation
+        if tps is None and (self._tps is None or self._tps[0] != generation):
+            # Лог новый (первый запрос или перезапуск сервера) - ищем с конца уже записанное
+            tps = self._find_tps(reverse_lines(self.log_file))
+        if tps is not None:
+            self._tps = (generation, tps)
+        elif self._tps is not None and self._tps[0] != generation:
+            self._tps = None
+        return self._tps[1] if self._tps else None
+
+    async def get_uptime(self):
         """Получение времени работы Minecraft-сервера через screen и процессы"""
         try:
             # Проверяем, запущена ли screen-сессия
-            result = subprocess.run(["screen", "-ls"], capture_output=True, text=True)
-            screen_sessions = [line.split()[0] for line in result.stdout.split("\n") if self.screen_name in line]
-            if not screen_sessions:
+            if not await is_screen_running(self.screen_name):
                 return "🔴 Screen-сессия не запущена"
             # Ищем процесс Minecraft
-            start_time = None
-            for proc in psutil.process_iter(attrs=['pid', 'name', 'cmdline', 'create_time']):
-                proc_info = proc.as_dict(attrs=['pid', 'name', 'cmdline', 'create_time'])
-                cmdline = ' '.join(proc_info.get('cmdline', []))
-                if 'java' in proc_info.get('name', '').lower() and 'minecraft' in cmdline and '-jar' in cmdline:
-                    start_time = proc_info.get('create_time', time.time())
-                    break
+            process = await asyncio.to_thread(self.process.find)
+            start_time = process.create_time() if process else None
             if not start_time:
                 return "🔴 Сервер запущен, но процесс Minecraft не найден"
             # Рассчитываем время работы
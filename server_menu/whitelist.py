@@ -1,76 +1,192 @@
+import os
 import sys
-import subprocess
-
-SESSION_NAME = "minecraft_fabric_server"
-
-
-def is_screen_session_running(session_name=SESSION_NAME):
-    try:
-        result = subprocess.run(['screen', '-ls'], capture_output=True, text=True, check=True)
-        return session_name in result.stdout
-    except subprocess.CalledProcessError:
-        return False
-
-
-def run_screen_command(command: str):
-    full_command = f'screen -S {SESSION_NAME} -X stuff "{command}\\n"'
-    subprocess.run(full_command, shell=True, check=True)
-
-
-def add_to_whitelist(nickname):
-    nickname = nickname.lower()
-    if not is_screen_session_running():
-        print(f"Ошибка: screen-сессия '{SESSION_NAME}' не запущена.", file=sys.stderr)
-        sys.exit(1)
-    run_screen_command(f"whitelist add {nickname}")
-
+import json
+import uuid
+import asyncio
+import hashlib
+import logging
+import tempfile
+from pathlib import Path
+from dataclasses import dataclass, field
+from dotenv import load_dotenv
+from server_menu.executor import is_screen_running, send_to_screen
+from server_menu.rcon import get_client, RconError, _read_server_properties
+from server_menu.firewall import get_firewall
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+SESSION_NAME = os.getenv("SCREEN_NAME") or "minecraft_fabric_server"
+
+
+def offline_uuid(name):
+    """UUID игрока на сервере с online-mode=false (как UUID.nameUUIDFromBytes в Java)"""
+    return str(uuid.UUID(bytes=hashlib.md5(f"OfflinePlayer:{name}".encode("utf-8")).digest(), version=3))
+
+
+@dataclass
+class WhitelistChange:
+    """Итог изменения whitelist.json"""
+    added: list = field(default_factory=list)
+    removed: list = field(default_factory=list)
+    unresolved: list = field(default_factory=list)  # Ники без UUID - добавляются командой сервера
+    reloaded: bool = False
+    error: str = None  # Файл записан, но сервер не перечитал его
+
+    @property
+    def changed(self):
+        return bool(self.added or self.removed)
+
+
+class WhitelistFile:
+    """Прямое редактирование SERVER_DIR/whitelist.json.
+
+    Изменения записываются атомарно (временный файл и замена), любое их число применяется одной записью файла
+    и одной командой whitelist reload. Если сервер не запущен, он прочитает файл при старте.
+    """
+
+    def __init__(self, server_dir, screen_name=SESSION_NAME):
+        self.server_dir = Path(server_dir)
+        self.path = self.server_dir / "whitelist.json"
+        self.usercache_path = self.server_dir / "usercache.json"
+        self.screen_name = screen_name
+        self.rcon = get_client()
+        self._lock = asyncio.Lock()  # Чтение, изменение и запись файла - без чередования между задачами
+
+    @staticmethod
+    def _load(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
 
-def remove_from_whitelist(nickname):
-    nickname = nickname.lower()
-    if not is_screen_session_running():
-        print(f"Ошибка: screen-сессия '{SESSION_NAME}' не запущена.", file=sys.stderr)
-        sys.exit(1)
-    run_screen_command(f"whitelist remove {nickname}")
+    def read(self):
+        """Записи whitelist.json: [{"uuid", "name"}]"""
+        return self._load(self.path)
 
+    def names(self):
+        """Ники из whitelist.json в нижнем регистре"""
+        return {entry["name"].lower() for entry in self.read() if entry.get("name")}
 
-def reload_whitelist():
-    if not is_screen_session_running():
-        print(f"Ошибка: screen-сессия '{SESSION_NAME}' не запущена.", file=sys.stderr)
-        sys.exit(1)
-    run_screen_command("whitelist reload")
-
+    def _write(self, entries):
+        fd, tmp = tempfile.mkstemp(dir=self.path.parent, prefix=".whitelist.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(entries, f, indent=2, ensure_ascii=False)
+                f.flush()
+                os.fsync(f.fileno())
+            if self.path.exists():
+                os.chmod(tmp, self.path.stat().st_mode & 0o777)
+            os.replace(tmp, self.path)
+        except BaseException:
+            Path(tmp).unlink(missing_ok=True)
+            raise
 
-def add_ufw_rules(ip):
+    def resolve(self, names):
+        """{ник: UUID или None}: из usercache.json, иначе для offline-сервера - вычисленный по нику"""
+        cache = {entry["name"].lower(): entry["uuid"] for entry in self._load(self.usercache_path)
+                 if entry.get("name") and entry.get("uuid")}
+        offline = _read_server_properties(self.server_dir).get("online-mode", "true") == "false"
+        return {name: cache.get(name.lower()) or (offline_uuid(name) if offline else None) for name in names}
+
+    def _apply_sync(self, add, remove):
+        change = WhitelistChange()
+        entries = self.read()
+        remove = {name.lower() for name in remove}
+        kept = [entry for entry in entries if entry.get("name", "").lower() not in remove]
+        change.removed = [entry["name"] for entry in entries if entry not in kept]
+        present = {entry.get("name", "").lower() for entry in kept}
+        uuids = self.resolve([name for name in dict.fromkeys(add) if name.lower() not in present])
+        for name, player_uuid in uuids.items():
+            if player_uuid is None:
+                change.unresolved.append(name)
+            else:
+                kept.append({"uuid": player_uuid, "name": name})
+                change.added.append(name)
+        if change.changed:
+            self._write(kept)
+        return change
+
+    async def apply(self, add=(), remove=()):
+        """Добавление и удаление ников одной записью файла и одной перезагрузкой whitelist на сервере"""
+        async with self._lock:
+            change = await asyncio.to_thread(self._apply_sync, list(add), list(remove))
+            if change.changed:
+                change.reloaded, change.error = await self._send("whitelist reload")
+            for name in change.unresolved:
+                # Онлайн-сервер без записи в usercache - UUID найдёт сам сервер
+                success, error = await self._send(f"whitelist add {name}")
+                if success:
+                    change.added.append(name)
+                else:
+                    change.error = error
+            change.unresolved = [name for name in change.unresolved if name not in change.added]
+            return change
+
+    async def _send(self, command):
+        """Команда серверу через RCON или screen; (выполнена ли, ошибка)"""
+        if self.rcon:
+            try:
+                await self.rcon.command(command)
+                return True, None
+            except RconError as e:
+                # whitelist add/remove/reload можно безопасно повторить, даже если RCON успел их выполнить
+                logger.warning(f"RCON недоступен, команда {command} отправляется через screen: {e}")
+        if not await is_screen_running(self.screen_name):
+            return False, "сервер не запущен, изменения применятся при его запуске"
+        result = await send_to_screen(self.screen_name, command)
+        if not result.ok:
+            return False, f"не удалось отправить команду в screen: {result.tail() or result.returncode}"
+        return True, None
+
+    async def reload(self):
+        success, error = await self._send("whitelist reload")
+        if not success:
+            raise RuntimeError(error)
+
+
+_whitelist = None
+
+
+def get_whitelist():
+    """Общий whitelist.json сервера для всех модулей бота"""
+    global _whitelist
+    if _whitelist is None:
+        _whitelist = WhitelistFile(os.getenv("SERVER_DIR"))
+    return _whitelist
+
+
+async def add_to_whitelist(nickname):
+    change = await get_whitelist().apply(add=[nickname.lower()])
+    if change.unresolved:
+        raise RuntimeError(f"UUID игрока {nickname} не найден: {change.error}")
+    return change
+
+
+async def remove_from_whitelist(nickname):
+    return await get_whitelist().apply(remove=[nickname.lower()])
+
+
+async def reload_whitelist():
+    await get_whitelist().reload()
+
+
+async def add_ufw_rules(ip):
+    """Открытие порта сервера для IP (FIREWALL_BACKEND: набор ipset или правила ufw)"""
     if not ip:
         return
-    rules = [
-        f"ufw allow from {ip} to any port 25565 proto tcp",
-        f"ufw allow from {ip} to any port 25565 proto udp",
-    ]
-    for rule in rules:
-        try:
-            subprocess.run(rule, shell=True, check=True)
-        except subprocess.CalledProcessError as e:
-            print(f"Ошибка при добавлении правила UFW: {e}", file=sys.stderr)
-            raise
+    await get_firewall().apply(add=[ip])
 
 
-def remove_ufw_rules(ip):
+async def remove_ufw_rules(ip):
     if not ip:
         return
-    rules = [
-        f"ufw delete allow from {ip} to any port 25565 proto tcp",
-        f"ufw delete allow from {ip} to any port 25565 proto udp",
-    ]
-    for rule in rules:
-        try:
-            subprocess.run(rule, shell=True, check=True)
-        except subprocess.CalledProcessError as e:
-            print(f"Ошибка при удалении правила UFW: {e}", file=sys.stderr)
-            raise
+    await get_firewall().apply(remove=[ip])
 
 
-def main():
+async def _main():
     if len(sys.argv) < 2:
         sys.exit(1)
 
@@ -78,7 +194,7 @@ def main():
 
     if command == "reload":
         try:
-            reload_whitelist()
+            await reload_whitelist()
             print("Whitelist успешно перезагружен")
             sys.exit(0)
         except Exception as e:
@@ -97,20 +213,20 @@ def main():
 
     try:
         if command == "add":
-            add_to_whitelist(nickname)
+            await add_to_whitelist(nickname)
             if ip:
-                add_ufw_rules(ip)
-                print(f"Игрок {nickname} добавлен в whitelist, правила UFW обновлены для {ip}")
+                await add_ufw_rules(ip)
+                print(f"Игрок {nickname} добавлен в whitelist, правила firewall обновлены для {ip}")
             else:
                 print(f"Игрок {nickname} добавлен в whitelist, IP не указан")
         elif command == "remove":
-            remove_from_whitelist(nickname)
+            await remove_from_whitelist(nickname)
             if ip:
-                remove_ufw_rules(ip)
-                print(f"Игрок {nickname} удалён из whitelist, правила UFW удалены для {ip}")
+                await remove_ufw_rules(ip)
+                print(f"Игрок {nickname} удалён из whitelist, правила firewall удалены для {ip}")
             else:
-                print(f"Игрок {nickname} удалён из whitelist, IP не указан - правила UFW не изменены")
-    except subprocess.CalledProcessError as e:
+                print(f"Игрок {nickname} удалён из whitelist, IP не указан - правила firewall не изменены")
+    except RuntimeError as e:
         print(f"Ошибка при выполнении команды: {e}", file=sys.stderr)
         sys.exit(1)
     except Exception as e:
@@ -118,5 +234,9 @@ def main():
         sys.exit(1)
 
 
+def main():
+    asyncio.run(_main())
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,130 @@
+import os
+import time
+import logging
+import threading
+from pathlib import Path
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Через сколько секунд перепроверять размеры файлов в неизменившейся директории:
+# region-файлы растут на месте, и mtime директории при этом не меняется
+WORLD_SIZE_MAX_AGE = float(os.getenv("WORLD_SIZE_MAX_AGE", "60"))
+
+FOLDERS = ("region", "entities", "poi", "playerdata")  # Папки, размер которых показывается отдельно
+OTHER = "other"
+OVERWORLD = "overworld"
+DIMENSION_NAMES = {OVERWORLD: "Обычный мир", "DIM-1": "Незер", "DIM1": "Энд"}
+
+
+class _Dir:
+    """Закэшированное содержимое одной директории"""
+    __slots__ = ("mtime_ns", "files", "subdirs", "checked_at")
+
+    def __init__(self, mtime_ns, files, subdirs, checked_at):
+        self.mtime_ns = mtime_ns
+        self.files = files  # Имя файла -> размер
+        self.subdirs = subdirs
+        self.checked_at = checked_at
+
+
+def classify(rel_dir):
+    """Измерение и папка, к которым относится директория мира: ("DIM-1", "region")"""
+    parts = rel_dir.split("/") if rel_dir else []
+    if parts and parts[0] in ("DIM-1", "DIM1"):
+        dimension, rest = parts[0], parts[1:]
+    elif len(parts) >= 3 and parts[0] == "dimensions":
+        # Измерения модов и датапаков: dimensions/<пространство имён>/<имя>/region
+        dimension, rest = f"{parts[1]}:{parts[2]}", parts[3:]
+    else:
+        dimension, rest = OVERWORLD, parts
+    return dimension, rest[0] if rest and rest[0] in FOLDERS else OTHER
+
+
+class WorldSizeIndex:
+    """Кэш размеров файлов мира: заново читаются только директории, у которых сменился mtime"""
+
+    def __init__(self, root, max_age=WORLD_SIZE_MAX_AGE):
+        self.root = Path(root)
+        self.max_age = max_age
+        self._dirs = {}  # Относительный путь директории ("" - корень мира) -> _Dir
+        self._lock = threading.Lock()
+
+    def refresh(self, max_age=None):
+        """Обновление кэша; возвращает число перечитанных директорий"""
+        max_age = self.max_age if max_age is None else max_age
+        with self._lock:
+            return self._refresh_dir("", time.monotonic(), max_age)
+
+    def _refresh_dir(self, rel_dir, now, max_age):
+        path = self.root / rel_dir if rel_dir else self.root
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            self._forget(rel_dir)
+            return 0
+        entry = self._dirs.get(rel_dir)
+        rescanned = 0
+        if entry is None or entry.mtime_ns != mtime_ns:
+            # Состав директории изменился - читаем её заново
+            files, subdirs = {}, []
+            with os.scandir(path) as it:
+                for item in it:
+                    try:
+                        if item.is_dir(follow_symlinks=False):
+                            subdirs.append(item.name)
+                        elif item.is_file(follow_symlinks=False):
+                            files[item.name] = item.stat(follow_symlinks=False).st_size
+                    except FileNotFoundError:
+                        pass  # Файл удалён сервером во время обхода
+            if entry is not None:
+                for removed in set(entry.subdirs) - set(subdirs):
+                    self._forget(self._join(rel_dir, removed))
+            entry = self._dirs[rel_dir] = _Dir(mtime_ns, files, sorted(subdirs), now)
+            rescanned = 1
+        elif now - entry.checked_at >= max_age:
+            # Состав прежний, но файлы могли вырасти - обновляем только их размеры
+            for name in entry.files:
+                try:
+                    entry.files[name] = os.stat(path / name).st_size
+                except FileNotFoundError:
+                    entry.files[name] = 0
+            entry.checked_at = now
+        for name in entry.subdirs:
+            rescanned += self._refresh_dir(self._join(rel_dir, name), now, max_age)
+        return rescanned
+
+    @staticmethod
+    def _join(rel_dir, name):
+        return f"{rel_dir}/{name}" if rel_dir else name
+
+    def _forget(self, rel_dir):
+        """Удаление из кэша директории и всех вложенных в неё"""
+        prefix = rel_dir + "/"
+        for key in [key for key in self._dirs if key == rel_dir or key.startswith(prefix)]:
+            del self._dirs[key]
+
+    def total(self, excludes=(), max_age=None):
+        """Суммарный размер мира без исключённых файлов (пути относительно корня мира)"""
+        self.refresh(max_age)
+        with self._lock:
+            total = sum(sum(entry.files.values()) for entry in self._dirs.values())
+            for exclude in excludes:
+                rel_dir, _, name = exclude.rpartition("/")
+                entry = self._dirs.get(rel_dir)
+                if entry is not None:
+                    total -= entry.files.get(name, 0)
+        return total
+
+    def breakdown(self, max_age=None):
+        """Размеры по измерениям и папкам: {"overworld": {"region": ..., "other": ...}, ...}"""
+        self.refresh(max_age)
+        result = {}
+        with self._lock:
+            for rel_dir, entry in self._dirs.items():
+                dimension, folder = classify(rel_dir)
+                folders = result.setdefault(dimension, {})
+                folders[folder] = folders.get(folder, 0) + sum(entry.files.values())
+        return result
@@ -0,0 +1,22 @@
+import os
+import tempfile
+
+import pytest
+
+# Config бота читает обязательные переменные при импорте mineservtelebot
+os.environ.setdefault("SERVER_DIR", tempfile.gettempdir())
+os.environ.setdefault("SCRIPTS_DIR", tempfile.gettempdir())
+os.environ.setdefault("ADMIN_IDS", "1")
+os.environ.setdefault("BOT_TOKEN", "1:test")
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """Database бота на временном файле SQLite (схема не создаётся - см. Database.init)"""
+    import mineservtelebot
+
+    connections = mineservtelebot.ConnectionManager(str(tmp_path / "users.db"))
+    monkeypatch.setattr(mineservtelebot.Database, "connections", connections)
+    monkeypatch.setattr(mineservtelebot.Database, "renamed_nicks", [])
+    yield mineservtelebot.Database
+    connections.close_all()
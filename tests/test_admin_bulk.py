@@ -0,0 +1,155 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import mineservtelebot
+from mineservtelebot import Admin, AsyncDatabase, Config
+from server_menu.whitelist import WhitelistChange
+
+PENDING = {11: "steve", 12: "alex", 13: "bob", 14: "carol", 15: "dave"}
+
+
+class FakeAccess:
+    """whitelist или firewall: записывает каждое apply, при fail - падает"""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.calls = []
+
+    async def apply(self, add=(), remove=()):
+        self.calls.append((sorted(add), sorted(remove)))
+        if self.fail:
+            raise RuntimeError("недоступен")
+        return WhitelistChange(added=list(add), removed=list(remove))
+
+
+class Chat:
+    """Переписка админа с ботом: update нажатия кнопки и context с user_data"""
+
+    def __init__(self):
+        self.replies, self.sent = [], {}
+
+        async def answer(*args, **kwargs):
+            pass
+
+        async def edit_message_text(text, **kwargs):
+            self.replies.append(text)
+
+        async def send_message(chat_id, text):
+            self.sent[chat_id] = text
+
+        self.update = SimpleNamespace(effective_user=SimpleNamespace(id=1), message=None,
+                                      callback_query=SimpleNamespace(answer=answer,
+                                                                     edit_message_text=edit_message_text))
+        self.context = SimpleNamespace(user_data={}, bot=SimpleNamespace(send_message=send_message))
+
+
+@pytest.fixture
+def admin(database, monkeypatch):
+    database.init()
+    for tg_id, nick in PENDING.items():
+        database.add_user(tg_id, nick, nick, f"10.0.0.{tg_id}")
+    async_db = AsyncDatabase()
+    monkeypatch.setattr(mineservtelebot, "db", async_db)
+    monkeypatch.setattr(Config, "ADMIN_IDS", {1})
+    yield Admin(SimpleNamespace(server=None, service=None))
+    async_db.close()
+
+
+@pytest.fixture
+def access(monkeypatch):
+    whitelist, firewall = FakeAccess(), FakeAccess()
+    monkeypatch.setattr(mineservtelebot, "get_whitelist", lambda: whitelist)
+    monkeypatch.setattr(mineservtelebot, "get_firewall", lambda: firewall)
+    return whitelist, firewall
+
+
+@pytest.fixture
+def counters(database, monkeypatch):
+    """Число транзакций базы и вызовов send_many"""
+    counts = {"transactions": 0, "send_many": 0}
+    transaction, send_many = database.connections.transaction, mineservtelebot.send_many
+
+    def counting_transaction():
+        counts["transactions"] += 1
+        return transaction()
+
+    async def counting_send_many(*args, **kwargs):
+        counts["send_many"] += 1
+        return await send_many(*args, **kwargs)
+
+    monkeypatch.setattr(database.connections, "transaction", counting_transaction)
+    monkeypatch.setattr(mineservtelebot, "send_many", counting_send_many)
+    return counts
+
+
+def select_and_decide(admin, chat, counters, action, meanwhile=None):
+    """Выбор всей страницы заявок без 12 и решение по отмеченным; meanwhile - действие между выбором и решением"""
+    async def scenario():
+        await admin.toggle_select_mode(chat.update, chat.context, "on")
+        await admin.toggle_selected(chat.update, chat.context)
+        await admin.toggle_selected(chat.update, chat.context, 12)
+        assert chat.context.user_data['admin_selected'] == {11, 13, 14, 15}
+        if meanwhile:
+            meanwhile()
+        counters.update(transactions=0, send_many=0)
+        await admin.handle_bulk_decision(chat.update, chat.context, action)
+
+    asyncio.run(scenario())
+
+
+def approved(database):
+    return dict(database.connections.get().execute("SELECT tg_id, approved FROM users").fetchall())
+
+
+def test_bulk_approve_is_one_batch(admin, database, access, counters):
+    whitelist, firewall = access
+    chat = Chat()
+    select_and_decide(admin, chat, counters, "approve")
+
+    assert counters == {"transactions": 1, "send_many": 1}
+    assert whitelist.calls == [(["bob", "carol", "dave", "steve"], [])]
+    assert firewall.calls == [(["10.0.0.11", "10.0.0.13", "10.0.0.14", "10.0.0.15"], [])]
+    assert approved(database) == {11: 1, 12: 0, 13: 1, 14: 1, 15: 1}
+    assert sorted(chat.sent) == [11, 13, 14, 15] and "одобрена" in chat.sent[11]
+    assert chat.replies[-1].startswith("✅ Одобрено заявок: 4")
+    assert "admin_selected" not in chat.context.user_data
+
+
+def test_bulk_reject_deletes_requests(admin, database, access, counters):
+    whitelist, firewall = access
+    chat = Chat()
+    select_and_decide(admin, chat, counters, "reject")
+
+    assert counters == {"transactions": 1, "send_many": 1}
+    assert whitelist.calls == [([], ["bob", "carol", "dave", "steve"])]
+    assert len(firewall.calls) == 1
+    assert approved(database) == {12: 0}
+    assert chat.replies[-1].startswith("❌ Отклонено заявок: 4")
+
+
+@pytest.mark.parametrize("failing", ["whitelist", "firewall"])
+def test_partial_failure_keeps_database_decision(admin, database, access, counters, failing):
+    whitelist, firewall = access
+    (whitelist if failing == "whitelist" else firewall).fail = True
+    chat = Chat()
+    select_and_decide(admin, chat, counters, "approve")
+
+    # База уже изменена: остальные шаги выполняются, ошибка показывается админу (исправит сверка)
+    assert approved(database) == {11: 1, 12: 0, 13: 1, 14: 1, 15: 1}
+    assert len(whitelist.calls) == len(firewall.calls) == 1
+    assert sorted(chat.sent) == [11, 13, 14, 15]
+    expected = "Ошибка изменения whitelist" if failing == "whitelist" else "Ошибка правил firewall"
+    assert expected in chat.replies[-1]
+
+
+def test_already_decided_requests_are_skipped(admin, database, access, counters):
+    whitelist, _ = access
+    chat = Chat()
+    # Другой админ успел одобрить часть отмеченных заявок
+    select_and_decide(admin, chat, counters, "approve", lambda: database.decide_pending([13, 14], approve=True))
+
+    assert whitelist.calls == [(["dave", "steve"], [])]
+    assert sorted(chat.sent) == [11, 15]
+    assert "Уже обработаны ранее: 2" in chat.replies[-1]
@@ -0,0 +1,91 @@
+import asyncio
+
+import pytest
+
+from server_menu.backup import BackupJob, BackupManager, StoreBackupJob
+
+
+@pytest.fixture
+def server_dir(tmp_path):
+    world = tmp_path / "world"
+    (world / "region").mkdir(parents=True)
+    for index in range(20):
+        (world / "region" / f"file{index}.dat").write_bytes(bytes([index]) * 50_000)
+    (world / "level.dat").write_bytes(b"level")
+    return tmp_path
+
+
+def world_size(server_dir):
+    return sum(path.stat().st_size for path in (server_dir / "world").rglob("*") if path.is_file())
+
+
+def test_backup_job_is_abstract(tmp_path):
+    with pytest.raises(TypeError):
+        BackupJob(tmp_path, tmp_path)
+
+
+def test_store_job_reports_progress_until_done(server_dir):
+    seen = []
+
+    class RecordingJob(StoreBackupJob):
+        def _progress(self, processed, written):
+            super()._progress(processed, written)
+            seen.append(self.percent)
+
+    async def scenario():
+        job = RecordingJob(server_dir / "world", server_dir / "backup").start()
+        assert job.running
+        assert "подсчёт" in job.format_progress()
+        await job.wait()
+        return job
+
+    job = asyncio.run(scenario())
+    assert job.status == job.DONE, job.error
+    assert job.total_bytes == job.bytes_done == world_size(server_dir)
+    assert job.percent == 100.0
+    assert seen == sorted(seen) and max(seen) <= 99.0  # До завершения не больше 99%
+    assert job.format_progress().startswith("✅")
+    assert job.store.list_manifests() == [job.name]
+
+
+def test_cancel_stops_snapshot_thread_without_manifest(server_dir):
+    class CancelledMidway(StoreBackupJob):
+        """Отмена из цикла событий во время работы потока снимка"""
+
+        loop = None
+
+        def _progress(self, processed, written):
+            super()._progress(processed, written)
+            if not self._stop.is_set():
+                self.loop.call_soon_threadsafe(self.cancel)
+                assert self._stop.wait(5)
+
+    async def scenario():
+        CancelledMidway.loop = asyncio.get_running_loop()
+        job = CancelledMidway(server_dir / "world", server_dir / "backup").start()
+        await job.wait()
+        return job
+
+    job = asyncio.run(scenario())
+    assert job.status == job.CANCELLED
+    assert 0 < job.bytes_done < world_size(server_dir)
+    assert job.store.list_manifests() == []
+    assert "отменено" in job.format_progress()
+
+
+def test_manager_runs_one_job_at_a_time(server_dir):
+    manager = BackupManager(server_dir)
+
+    async def scenario():
+        ok, job = manager.start()
+        assert ok
+        second = manager.start()
+        await job.wait()
+        third = manager.start()
+        await third[1].wait()
+        return second, third
+
+    (second_ok, message), (third_ok, _) = asyncio.run(scenario())
+    assert not second_ok and "уже выполняется" in message
+    assert third_ok
+    assert manager.cancel()[0] is False
@@ -0,0 +1,143 @@
+import os
+import time
+import struct
+import random
+
+import pytest
+
+from server_menu.backup_store import BackupStore, SECTOR_SIZE, REGION_CHUNKS
+
+
+def write_region(path, chunks, mtime):
+    """Region-файл Anvil: chunks - {номер чанка: (данные, время сохранения)}, каждый чанк с отдельного сектора"""
+    locations, timestamps, body = [0] * REGION_CHUNKS, [0] * REGION_CHUNKS, b""
+    sector = 2
+    for index, (data, timestamp) in sorted(chunks.items()):
+        payload = struct.pack(">IB", len(data) + 1, 2) + data
+        count = -(-len(payload) // SECTOR_SIZE)
+        locations[index] = (sector << 8) | count
+        timestamps[index] = timestamp
+        body += payload.ljust(count * SECTOR_SIZE, b"\0")
+        sector += count
+    with open(path, "wb") as f:
+        f.write(struct.pack(f">{REGION_CHUNKS}I", *locations) + struct.pack(f">{REGION_CHUNKS}I", *timestamps) + body)
+    os.utime(path, ns=(mtime, mtime))
+
+
+def rewrite_chunk(path, index, data, timestamp, mtime):
+    """Перезапись чанка на месте (данные не длиннее прежних), как это делает сервер"""
+    with open(path, "r+b") as f:
+        location = struct.unpack(">I", f.read(SECTOR_SIZE)[index * 4:index * 4 + 4])[0]
+        f.seek((location >> 8) * SECTOR_SIZE)
+        f.write(struct.pack(">IB", len(data) + 1, 2) + data)
+        f.seek(SECTOR_SIZE + index * 4)
+        f.write(struct.pack(">I", timestamp))
+    os.utime(path, ns=(mtime, mtime))
+
+
+def read_tree(root):
+    return {path.relative_to(root).as_posix(): path.read_bytes() for path in sorted(root.rglob("*")) if path.is_file()}
+
+
+@pytest.fixture
+def world(tmp_path):
+    rng = random.Random(1)
+    world = tmp_path / "world"
+    (world / "region").mkdir(parents=True)
+    chunks = {index: (rng.randbytes(rng.randrange(100, 9000)), 1000) for index in range(0, REGION_CHUNKS, 3)}
+    write_region(world / "region" / "r.0.0.mca", chunks, mtime=10 ** 18)
+    (world / "level.dat").write_bytes(rng.randbytes(5000))
+    return world
+
+
+def test_round_trip_with_modified_chunk(tmp_path, world):
+    store = BackupStore(tmp_path / "store")
+    store.snapshot(world, name="a")
+    before = read_tree(world)
+
+    rewrite_chunk(world / "region" / "r.0.0.mca", 9, b"new chunk data", 2000, mtime=10 ** 18 + 1)
+    second = store.snapshot(world, name="b")
+    after = read_tree(world)
+    assert before != after
+    assert not second["full"]
+
+    for name, expected in (("a", before), ("b", after)):
+        store.restore(name, tmp_path / name)
+        assert read_tree(tmp_path / name) == expected
+
+
+def test_changed_region_rereads_only_blocks_with_changed_chunks(tmp_path, world):
+    store = BackupStore(tmp_path / "store")
+    first = store.snapshot(world, name="a")
+    blocks = len(first["files"][1]["chunks"])
+    assert first["files"][1]["kind"] == "anvil" and blocks > 4
+
+    rewrite_chunk(world / "region" / "r.0.0.mca", 900, b"new chunk data", 2000, mtime=10 ** 18 + 1)
+    stats = store.snapshot(world, name="b")["stats"]
+    # Заголовок (блок 0) и блок изменённого чанка
+    assert stats["region_blocks_read"] == 2
+    assert stats["region_blocks_reused"] == blocks - 2
+    store.restore("b", tmp_path / "restored")
+    assert read_tree(tmp_path / "restored") == read_tree(world)
+
+
+def test_chunk_rewritten_in_same_second_as_snapshot_is_reread(tmp_path, world):
+    """Время сохранения чанка - в секундах: повторная перезапись в ту же секунду не меняет заголовок"""
+    store = BackupStore(tmp_path / "store")
+    region = world / "region" / "r.0.0.mca"
+    saved_at = int(time.time()) + 60  # Не раньше начала следующего снимка
+    rewrite_chunk(region, 900, b"first", saved_at, mtime=10 ** 18 + 1)
+    store.snapshot(world, name="a")
+
+    header = region.read_bytes()[:2 * SECTOR_SIZE]
+    rewrite_chunk(region, 900, b"other", saved_at, mtime=10 ** 18 + 2)
+    assert region.read_bytes()[:2 * SECTOR_SIZE] == header
+    store.snapshot(world, name="b")
+    store.restore("b", tmp_path / "restored")
+    assert read_tree(tmp_path / "restored") == read_tree(world)
+
+
+def test_unchanged_files_are_reused(tmp_path, world):
+    store = BackupStore(tmp_path / "store")
+    store.snapshot(world, name="a")
+    stats = store.snapshot(world, name="b")["stats"]
+    assert stats["reused_files"] == stats["files"] == 2
+    assert stats["new_bytes"] == 0
+
+
+def test_prune_keeps_latest_and_removes_unreferenced_blocks(tmp_path, world):
+    store = BackupStore(tmp_path / "store")
+    store.snapshot(world, name="a")
+    (world / "level.dat").write_bytes(b"changed")
+    store.snapshot(world, name="b")
+    expected = read_tree(world)
+
+    assert store.prune(1) > 0
+    assert store.list_manifests() == ["b"]
+    store.restore("b", tmp_path / "restored")
+    assert read_tree(tmp_path / "restored") == expected
+
+
+def test_prune_zero_keeps_all(tmp_path, world):
+    store = BackupStore(tmp_path / "store")
+    store.snapshot(world, name="a")
+    store.snapshot(world, name="b")
+    store.prune(0)
+    assert store.list_manifests() == ["a", "b"]
+    with pytest.raises(ValueError):
+        store.prune(-1)
+
+
+def test_full_snapshot_repairs_corrupted_block(tmp_path, world):
+    store = BackupStore(tmp_path / "store")
+    store.snapshot(world, name="a")
+    digest = store.load_manifest("a")["files"][0]["chunks"][0]
+    store._chunk_path(digest).write_bytes(b"Rcorrupted")
+    with pytest.raises(ValueError):
+        store.read_chunk(digest)
+
+    manifest = store.snapshot(world, name="b", full_every=1)
+    assert manifest["full"]
+    store.read_chunk(digest)
+    store.restore("b", tmp_path / "restored")
+    assert read_tree(tmp_path / "restored") == read_tree(world)
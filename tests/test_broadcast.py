@@ -0,0 +1,186 @@
+import time
+import asyncio
+from datetime import timedelta
+
+from telegram.error import RetryAfter, Forbidden
+
+from server_menu.broadcast import (RateLimiter, BroadcastJob, BroadcastManager,
+                                   STATE_PENDING, STATE_DELIVERED, STATE_FAILED)
+
+
+class FakeStore:
+    """Прогресс рассылок в памяти с тем же интерфейсом, что у AsyncDatabase"""
+
+    def __init__(self, recipients):
+        self.recipients = recipients
+        self.broadcasts = {}  # id -> [id админа, текст, статус]
+        self.states = {}  # id -> {tg_id: состояние}
+
+    async def broadcast_create(self, admin_id, text):
+        broadcast_id = len(self.broadcasts) + 1
+        self.broadcasts[broadcast_id] = [admin_id, text, "running"]
+        self.states[broadcast_id] = dict.fromkeys(self.recipients, STATE_PENDING)
+        return broadcast_id
+
+    async def broadcast_counts(self, broadcast_id):
+        states = list(self.states[broadcast_id].values())
+        return len(states), states.count(STATE_DELIVERED), states.count(STATE_FAILED)
+
+    async def broadcast_pending(self, broadcast_id, limit):
+        return [tg_id for tg_id, state in self.states[broadcast_id].items() if state == STATE_PENDING][:limit]
+
+    async def broadcast_save(self, broadcast_id, results):
+        for tg_id, state, _ in results:
+            self.states[broadcast_id][tg_id] = state
+
+    async def broadcast_finish(self, broadcast_id, status):
+        self.broadcasts[broadcast_id][2] = status
+
+    async def broadcast_unfinished(self):
+        return [(broadcast_id, admin_id, text) for broadcast_id, (admin_id, text, status) in self.broadcasts.items()
+                if status == "running"]
+
+
+def unlimited():
+    return RateLimiter(rate=10000, burst=10000, chat_interval=0)
+
+
+def test_token_bucket_limits_rate_after_burst():
+    async def scenario():
+        limiter = RateLimiter(rate=50, burst=5, chat_interval=0)
+        started = time.monotonic()
+        for chat_id in range(5):
+            await limiter.acquire(chat_id)
+        burst = time.monotonic() - started
+        for chat_id in range(5, 15):
+            await limiter.acquire(chat_id)
+        return burst, time.monotonic() - started
+
+    burst, total = asyncio.run(scenario())
+    assert burst < 0.05
+    assert total >= 10 / 50 * 0.9  # После запаса - не быстрее rate
+
+
+def test_chat_interval_applies_per_chat():
+    async def scenario():
+        limiter = RateLimiter(rate=1000, burst=10, chat_interval=0.2)
+        started = time.monotonic()
+        await limiter.acquire(1)
+        await limiter.acquire(2)
+        other = time.monotonic() - started
+        await limiter.acquire(1)
+        return other, time.monotonic() - started
+
+    other, same = asyncio.run(scenario())
+    assert other < 0.1
+    assert same >= 0.19
+
+
+def test_retry_after_pauses_all_sends_and_retries():
+    sent = []
+    calls = {"count": 0}
+
+    async def send(chat_id, text):
+        calls["count"] += 1
+        if calls["count"] == 1:
+            raise RetryAfter(timedelta(seconds=0.2))
+        sent.append((chat_id, time.monotonic()))
+
+    async def scenario():
+        store = FakeStore([1, 2, 3])
+        manager = BroadcastManager(store, send, rate=10000, workers=1)
+        manager.limiter = unlimited()
+        started = time.monotonic()
+        ok, job = await manager.start(1, "привет")
+        await job.wait(5)
+        return job, store, started
+
+    job, store, started = asyncio.run(scenario())
+    assert job.status == job.DONE
+    assert [chat_id for chat_id, _ in sent] == [1, 2, 3]
+    assert all(at - started >= 0.19 for _, at in sent)
+    assert (job.delivered, job.failed) == (3, 0)
+    assert set(store.states[1].values()) == {STATE_DELIVERED}
+
+
+def test_forbidden_is_not_retried():
+    attempts = []
+
+    async def send(chat_id, text):
+        attempts.append(chat_id)
+        if chat_id == 2:
+            raise Forbidden("bot was blocked by the user")
+
+    async def scenario():
+        store = FakeStore([1, 2, 3])
+        job = BroadcastJob(await store.broadcast_create(1, "привет"), "привет", store, send, unlimited())
+        await job.start().wait(5)
+        return job, store
+
+    job, store = asyncio.run(scenario())
+    assert sorted(attempts) == [1, 2, 3]
+    assert (job.delivered, job.failed) == (2, 1)
+    assert store.states[1] == {1: STATE_DELIVERED, 2: STATE_FAILED, 3: STATE_DELIVERED}
+    assert store.broadcasts[1][2] == "done"
+
+
+def test_stopped_broadcast_resumes_with_unsent_recipients():
+    first_run, second_run = [], []
+
+    async def scenario():
+        store = FakeStore(list(range(1, 6)))
+        blocked = asyncio.Event()
+
+        async def send(chat_id, text):
+            if chat_id == 3:
+                blocked.set()
+                await asyncio.Event().wait()  # Зависшая отправка прерывается остановкой бота
+            first_run.append(chat_id)
+
+        manager = BroadcastManager(store, send, workers=1)
+        manager.limiter = unlimited()
+        ok, job = await manager.start(7, "привет")
+        await blocked.wait()
+        await manager.stop()
+        assert job.status == job.RUNNING and "приостановлена" in job.format_progress()
+
+        async def send_again(chat_id, text):
+            second_run.append(chat_id)
+
+        restarted = BroadcastManager(store, send_again, workers=1)
+        restarted.limiter = unlimited()
+        resumed = await restarted.resume()
+        for _, resumed_job in resumed:
+            await resumed_job.wait(5)
+        return resumed, store
+
+    resumed, store = asyncio.run(scenario())
+    assert first_run == [1, 2]
+    assert second_run == [3, 4, 5]  # Записанные при остановке результаты повторно не отправляются
+    [(admin_id, job)] = resumed
+    assert admin_id == 7 and job.status == job.DONE
+    assert (job.total, job.delivered, job.failed) == (5, 5, 0)
+    assert store.broadcasts[1][2] == "done"
+
+
+def test_cancelled_broadcast_is_not_resumed():
+    async def scenario():
+        store = FakeStore([1, 2])
+        started = asyncio.Event()
+
+        async def send(chat_id, text):
+            started.set()
+            await asyncio.Event().wait()
+
+        manager = BroadcastManager(store, send, workers=1)
+        manager.limiter = unlimited()
+        ok, job = await manager.start(1, "привет")
+        await started.wait()
+        assert manager.cancel(job.id)[0]
+        await job.wait(5)
+        assert not manager.cancel(job.id)[0]
+        return job, await store.broadcast_unfinished()
+
+    job, unfinished = asyncio.run(scenario())
+    assert job.status == job.CANCELLED
+    assert unfinished == []
@@ -0,0 +1,114 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from telegram import Update, CallbackQuery, User
+
+from server_menu.callbacks import CallbackRouter, CallbackDataError, pack, MAX_DATA, STALE_TEXT
+
+
+def query_update(data):
+    """Нажатие кнопки без бота: ответы на нажатие записываются в answers"""
+    answers = []
+
+    async def answer(text=None, show_alert=False):
+        answers.append(text)
+
+    return SimpleNamespace(callback_query=SimpleNamespace(data=data, answer=answer)), answers
+
+
+def telegram_update(data):
+    user = User(id=1, first_name="Steve", is_bot=False)
+    return Update(update_id=1, callback_query=CallbackQuery(id="1", from_user=user, chat_instance="1", data=data))
+
+
+def recording_router():
+    router, calls = CallbackRouter(), []
+
+    async def handler(update, context, *args):
+        calls.append(args)
+
+    return router, handler, calls
+
+
+def test_pack_joins_arguments_and_limits_length():
+    assert pack("admin_page", "approved", "next", 3) == "admin_page:approved:next:3"
+    assert len(pack("a", "x" * (MAX_DATA - 2))) == MAX_DATA
+    with pytest.raises(CallbackDataError):
+        pack("a", "x" * (MAX_DATA - 1))
+    with pytest.raises(CallbackDataError):
+        pack("a", "я" * (MAX_DATA // 2))  # Лимит в байтах, а не в символах
+
+
+def test_duplicate_registration_is_an_error():
+    router, handler, _ = recording_router()
+    router.route("admin_user", handler, int)
+    with pytest.raises(ValueError):
+        router.route("admin_user", handler)
+    with pytest.raises(ValueError):
+        router.entry("admin_user", handler)
+    with pytest.raises(ValueError):
+        router.route("bad:name", handler)
+
+    router.entry("cancel", handler)
+    router.entry("cancel", handler)  # Одна кнопка отмены в нескольких диалогах
+    with pytest.raises(ValueError):
+        router.route("cancel", handler)
+
+
+def test_dispatch_converts_arguments():
+    router, handler, calls = recording_router()
+    router.route("admin_page", handler, ("pending", "approved"), ("next", "prev"), int)
+    router.route("privmsg", handler, str)
+    update, answers = query_update("admin_page:approved:prev:12")
+    assert router.owns(update.callback_query.data)
+    asyncio.run(router.dispatch(update, None))
+    update, _ = query_update("privmsg:Steve:with:colons")  # Последний аргумент забирает остаток
+    asyncio.run(router.dispatch(update, None))
+    assert calls == [("approved", "prev", 12), ("Steve:with:colons",)]
+    assert answers == []
+
+
+@pytest.mark.parametrize("data", [
+    "admin_page:approved:next",  # Не хватает аргумента
+    "admin_page:approved:next:abc",  # Не число
+    "admin_page:banned:next:1",  # Не из допустимых значений
+    "admin_page:approved:up:1",
+])
+def test_malformed_arguments_answer_stale(data):
+    router, handler, calls = recording_router()
+    router.route("admin_page", handler, ("pending", "approved"), ("next", "prev"), int)
+    update, answers = query_update(data)
+    asyncio.run(router.dispatch(update, None))
+    assert calls == []
+    assert answers == [STALE_TEXT]
+
+
+def test_unknown_action_goes_to_fallback():
+    router, handler, _ = recording_router()
+    router.route("admin_user", handler, int)
+    router.entry("reg_new", handler)
+    assert not router.owns("admin_old_button:5")
+    assert not router.owns("reg_new")  # Кнопки диалогов обрабатывает ConversationHandler
+    assert not router.owns(None)
+
+    fallback = router.fallback()
+    assert fallback.check_update(telegram_update("admin_old_button:5"))
+    update, answers = query_update("admin_old_button:5")
+    asyncio.run(fallback.callback(update, None))
+    assert answers == [STALE_TEXT]
+
+
+def test_entry_matches_only_its_action():
+    router, handler, calls = recording_router()
+    entry = router.entry("admin_edit", handler, int)
+    assert entry.check_update(telegram_update("admin_edit:42"))
+    assert not entry.check_update(telegram_update("admin_editip:42"))
+    assert not entry.check_update(telegram_update("admin_edit_other"))
+
+    update, _ = query_update("admin_edit:42")
+    asyncio.run(entry.callback(update, None))
+    update, answers = query_update("admin_edit:x")
+    asyncio.run(entry.callback(update, None))
+    assert calls == [(42,)]
+    assert answers == [STALE_TEXT]
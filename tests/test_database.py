@@ -0,0 +1,298 @@
+import asyncio
+import sqlite3
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from mineservtelebot import AsyncDatabase, UserCache, MinecraftBot, WhitelistManager
+
+
+def test_connection_is_reused_per_thread(database):
+    connections = database.connections
+    con = connections.get()
+    assert connections.get() is con
+    assert con.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert con.execute("PRAGMA foreign_keys").fetchone()[0] == 1
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(connections.get()))
+    thread.start()
+    thread.join()
+    assert other[0] is not con
+    assert len(connections._all) == 2
+
+
+def test_transaction_rolls_back_on_error(database):
+    database.init()
+    database.add_user(1, "steve", "steve", "10.0.0.1")
+    with pytest.raises(RuntimeError):
+        with database.connection() as con:
+            con.execute("UPDATE users SET ip='10.0.0.2' WHERE tg_id=1")
+            raise RuntimeError
+    assert database.get_user(1)["ip"] == "10.0.0.1"
+
+
+def test_close_all_opens_new_connection(database):
+    con = database.connections.get()
+    database.connections.close_all()
+    assert database.connections.get() is not con
+    assert database.connections.get().execute("SELECT 1").fetchone() == (1,)
+
+
+@pytest.fixture
+def async_db(database):
+    database.init()
+    async_db = AsyncDatabase()
+    yield async_db
+    async_db.close()
+
+
+def test_async_queries_run_in_one_database_thread(async_db, database, monkeypatch):
+    threads = set()
+    get_user = database.get_user
+
+    def recording_get_user(tg_id):
+        threads.add(threading.current_thread().name)
+        return get_user(tg_id)
+
+    monkeypatch.setattr(database, "get_user", staticmethod(recording_get_user))
+
+    async def scenario():
+        await asyncio.gather(*(async_db.add_user(tg_id, f"user{tg_id}", f"nick{tg_id}", f"10.0.0.{tg_id}")
+                               for tg_id in range(1, 21)))
+        async_db.cache.clear()
+        return await asyncio.gather(*(async_db.get_user(tg_id) for tg_id in range(1, 21)))
+
+    rows = asyncio.run(scenario())
+    assert [row["ingame_nick"] for row in rows] == [f"nick{tg_id}" for tg_id in range(1, 21)]
+    [thread] = threads
+    assert thread.startswith("database") and thread != threading.current_thread().name
+    assert len(database.connections._all) == 2  # Поток базы и init() в основном потоке
+
+
+def counting(database, monkeypatch, name):
+    """Подсчёт обращений к методу Database"""
+    calls = []
+    method = getattr(database, name)
+
+    def wrapper(*args):
+        calls.append(args)
+        return method(*args)
+
+    monkeypatch.setattr(database, name, staticmethod(wrapper))
+    return calls
+
+
+def test_cache_serves_repeated_reads_and_missing_users(async_db, database, monkeypatch):
+    database.add_user(1, "steve", "steve", "10.0.0.1")
+    calls = counting(database, monkeypatch, "get_user")
+
+    async def scenario():
+        return [await async_db.get_user(1), await async_db.get_user(1), await async_db.get_user_by_nick("STEVE"),
+                await async_db.get_user(2), await async_db.user_exists(2)]
+
+    first, second, by_nick, missing, exists = asyncio.run(scenario())
+    assert first == second == by_nick and first["ingame_nick"] == "steve"
+    assert missing is None and exists is False
+    assert calls == [(1,), (2,)]
+
+
+def test_read_started_before_write_is_not_cached(async_db, database, monkeypatch):
+    database.add_user(1, "steve", "steve", "10.0.0.1")
+    reading, release = threading.Event(), threading.Event()
+    get_user = database.get_user
+
+    def slow_get_user(tg_id):
+        row = get_user(tg_id)
+        reading.set()
+        release.wait(5)
+        return row
+
+    monkeypatch.setattr(database, "get_user", staticmethod(slow_get_user))
+
+    async def scenario():
+        read = asyncio.ensure_future(async_db.get_user(1))
+        await asyncio.to_thread(reading.wait, 5)
+        # Изменение, пока чтение ещё в потоке базы: прочитанная строка уже устарела
+        database.update_user(1, ip="10.0.0.2")
+        async_db.cache.invalidate(1)
+        release.set()
+        stale = await read
+        return stale, await async_db.get_user(1)
+
+    stale, fresh = asyncio.run(scenario())
+    assert stale["ip"] == "10.0.0.1"
+    assert fresh["ip"] == "10.0.0.2"
+
+
+def test_failed_write_invalidates_cached_row(async_db, database):
+    database.add_user(1, "steve", "steve", "10.0.0.1")
+    database.add_user(2, "alex", "alex", "10.0.0.2")
+
+    async def scenario():
+        await async_db.get_user(2)
+        with pytest.raises(sqlite3.IntegrityError):
+            await async_db.update_user(2, ingame_nick="steve")
+        assert async_db.cache.get(2) is UserCache.MISSING
+        return await async_db.get_user(2), await async_db.is_nick_unique("Steve")
+
+    row, unique = asyncio.run(scenario())
+    assert row["ingame_nick"] == "alex"
+    assert not unique
+
+
+def test_user_cache_evicts_least_recently_used():
+    cache = UserCache(max_size=2)
+    cache.put(1, {"tg_id": 1, "ingame_nick": "Steve"})
+    cache.put(2, {"tg_id": 2, "ingame_nick": "alex"})
+    assert cache.get(1)["ingame_nick"] == "Steve"  # 1 становится последним использованным
+    cache.put(3, None)
+    assert cache.get(2) is UserCache.MISSING
+    assert cache.tg_id_by_nick("ALEX") is None
+    assert cache.tg_id_by_nick("steve") == 1
+    assert cache.get(3) is None
+
+    version = cache.version
+    cache.update(1, {"ingame_nick": "herobrine"})
+    assert cache.version == version + 1
+    assert cache.tg_id_by_nick("steve") is None and cache.tg_id_by_nick("herobrine") == 1
+
+
+def create_version_1(database, users):
+    """База первой версии бота: таблица users без индексов, ники могут повторяться"""
+    con = database.connections.get()
+    database._migration_create_users(con)
+    con.executemany("INSERT INTO users VALUES (?, ?, ?, ?, ?)", users)
+    con.execute("PRAGMA user_version=1")
+    con.commit()
+
+
+def test_migrations_rename_duplicate_nicks(database):
+    create_version_1(database, [
+        (1, "first", "steve", "10.0.0.1", 0),
+        (2, "owner", "steve", "10.0.0.2", 1),
+        (3, "third", "steve", "10.0.0.3", 0),
+        (4, "taken", "steve_1", "10.0.0.4", 1),
+        (5, "alex", "alex", "10.0.0.5", 1),
+    ])
+    database.init()
+    con = database.connections.get()
+    assert con.execute("PRAGMA user_version").fetchone()[0] == len(database.MIGRATIONS)
+    nicks = dict(con.execute("SELECT tg_id, ingame_nick FROM users").fetchall())
+    # Ник остаётся у одобренного, остальные получают свободный суффикс
+    assert nicks == {1: "steve_2", 2: "steve", 3: "steve_3", 4: "steve_1", 5: "alex"}
+    assert database.renamed_nicks == [(1, "first", "steve", "steve_2", 0), (3, "third", "steve", "steve_3", 0)]
+    with pytest.raises(sqlite3.IntegrityError):
+        database.add_user(6, "new", "alex", "10.0.0.6")
+    assert con.execute("SELECT COUNT(*) FROM users WHERE created_at IS NULL OR updated_at IS NULL").fetchone() == (0,)
+
+    database.init()  # Повторный запуск ничего не меняет
+    assert dict(con.execute("SELECT tg_id, ingame_nick FROM users").fetchall()) == nicks
+
+
+def test_failed_migration_keeps_previous_version(database, monkeypatch):
+    def broken(con):
+        con.execute("CREATE TABLE half_done(x)")
+        raise RuntimeError("миграция прервана")
+
+    monkeypatch.setattr(database, "MIGRATIONS", database.MIGRATIONS[:2] + (staticmethod(broken),))
+    with pytest.raises(RuntimeError):
+        database.init()
+    con = database.connections.get()
+    assert con.execute("PRAGMA user_version").fetchone()[0] == 2
+    assert con.execute("SELECT 1 FROM sqlite_master WHERE name='half_done'").fetchone() is None
+
+
+def test_new_user_gets_timestamps(database):
+    database.init()
+    database.add_user(1, "steve", "steve", "10.0.0.1")
+    created, updated = database.connections.get().execute(
+        "SELECT created_at, updated_at FROM users WHERE tg_id=1").fetchone()
+    assert created and updated
+
+
+def test_renamed_nicks_are_whitelisted_and_reported(database, monkeypatch):
+    database.renamed_nicks += [(1, "first", "steve", "steve_2", 1), (3, "third", "steve", "steve_3", 0)]
+    applied, notes, messages = [], [], {}
+
+    async def apply_whitelist(add=(), remove=()):
+        applied.append(list(add))
+
+    async def send_message(chat_id, text):
+        messages[chat_id] = text
+
+    monkeypatch.setattr(WhitelistManager, "apply_whitelist", staticmethod(apply_whitelist))
+    bot = SimpleNamespace(notifier=SimpleNamespace(notify=lambda text, buttons: notes.append((text, buttons))),
+                          application=SimpleNamespace(bot=SimpleNamespace(send_message=send_message)))
+    asyncio.run(MinecraftBot._report_renamed_nicks(bot))
+
+    assert applied == [["steve_2"]]  # В whitelist - только новый ник одобренного пользователя
+    [(text, buttons)] = notes
+    assert "first (ID: 1): steve → steve_2" in text and "third (ID: 3): steve → steve_3" in text
+    assert [row[0].callback_data for row in buttons] == ["admin_user:1", "admin_user:3"]
+    assert set(messages) == {1, 3} and "steve_3" in messages[3]
+    assert database.renamed_nicks == []
+
+
+@pytest.fixture
+def users(database):
+    """Одобренные пользователи с одинаковыми без учёта регистра и пустыми username, плюс одна заявка"""
+    database.init()
+    names = {1: "bob", 2: None, 3: "Bob", 4: "alice", 5: "", 6: "carol", 7: "BOB", 8: "dave", 9: "Alice"}
+    for tg_id, username in names.items():
+        database.add_user(tg_id, username, f"nick{tg_id}", f"10.0.0.{tg_id}")
+        database.update_user(tg_id, approved=1)
+    database.add_user(10, "aaron", "nick10", "10.0.0.10")
+    return sorted(names, key=lambda tg_id: ((names[tg_id] or "").lower(), tg_id))
+
+
+def ids(rows):
+    return [row[0] for row in rows]
+
+
+def test_pages_forward_and_back_cover_all_users_in_order(database, users):
+    pages, cursor = [], None
+    while True:
+        rows, has_prev, has_next = database.page_users(True, cursor, limit=2)
+        assert has_prev == (cursor is not None)
+        pages.append(ids(rows))
+        if not has_next:
+            break
+        cursor = rows[-1][0]
+    assert [tg_id for page in pages for tg_id in page] == users  # Пустые username первыми, равные - по tg_id
+    assert pages[0] == [2, 5] and len(pages) == 5
+
+    backward = [pages[-1]]
+    while True:
+        rows, has_prev, has_next = database.page_users(True, backward[0][0], backward=True, limit=2)
+        assert has_next
+        backward.insert(0, ids(rows))
+        if not has_prev:
+            break
+    assert backward == pages
+
+
+def test_page_search_by_username_prefix(database, users):
+    rows, has_prev, has_next = database.page_users(True, prefix="b", limit=2)
+    assert ids(rows) == [1, 3] and not has_prev and has_next
+    rows, has_prev, has_next = database.page_users(True, cursor=3, prefix="b", limit=2)
+    assert ids(rows) == [7] and has_prev and not has_next
+    assert ids(database.page_users(False, prefix="A")[0]) == [10]
+
+
+def test_page_after_deleted_user_starts_over(database, users):
+    database.delete_user(4)
+    rows, has_prev, _ = database.page_users(True, cursor=4, limit=2)
+    assert ids(rows) == [2, 5] and not has_prev
+
+
+def test_page_query_uses_sort_index(database, users):
+    con = database.connections.get()
+    queries = []
+    con.set_trace_callback(queries.append)
+    database.page_users(True, cursor=3, limit=2)
+    con.set_trace_callback(None)
+    [query] = [query for query in queries if query.startswith("SELECT tg_id, tg_username")]
+    plan = " ".join(row[-1] for row in con.execute("EXPLAIN QUERY PLAN " + query).fetchall())
+    assert "users_approved_sort" in plan and "TEMP B-TREE" not in plan  # Без сортировки всей таблицы
@@ -0,0 +1,22 @@
+import sys
+import asyncio
+
+from server_menu.executor import run_command, MAX_CONCURRENT
+
+
+def test_limit_works_across_event_loops():
+    """Ожидание общего лимита процессов в разных циклах событий (каждый asyncio.run - новый цикл)"""
+    args = [sys.executable, "-c", "import time; time.sleep(0.05)"]
+
+    async def burst():
+        results = await asyncio.wait_for(
+            asyncio.gather(*(run_command(args, timeout=10) for _ in range(MAX_CONCURRENT + 2))), 30)
+        return [result.ok for result in results]
+
+    for _ in range(2):
+        assert all(asyncio.run(burst()))
+
+
+def test_timeout_stops_process():
+    result = asyncio.run(run_command([sys.executable, "-c", "import time; time.sleep(10)"], timeout=0.2))
+    assert result.timed_out and not result.ok
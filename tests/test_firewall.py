@@ -0,0 +1,128 @@
+import asyncio
+
+import pytest
+
+from server_menu.executor import CommandResult
+from server_menu.firewall import IpsetFirewall, UfwFirewall, migrate
+
+
+class FakeRunner:
+    """Имитация ipset, iptables и ufw в памяти. Все команды записываются в commands"""
+
+    def __init__(self):
+        self.commands = []
+        self.sets = {}  # имя набора -> адреса
+        self.rules = set()  # (команда, правило)
+        self.ufw = set()  # (ip, протокол, порт)
+
+    async def __call__(self, args, timeout=None, input=None):
+        args = [str(arg) for arg in args]
+        self.commands.append((args, input))
+        tool = args[0]
+        if tool == "ipset" and args[1] == "create":
+            self.sets.setdefault(args[2], set())
+        elif tool == "ipset" and args[1] == "save":
+            if args[2] not in self.sets:
+                return CommandResult(args, 1, stderr=f"The set with the given name does not exist: {args[2]}")
+            lines = [f"create {args[2]} hash:ip"] + [f"add {args[2]} {ip}" for ip in sorted(self.sets[args[2]])]
+            return CommandResult(args, 0, "\n".join(lines) + "\n")
+        elif tool == "ipset" and args[1] == "restore":
+            for line in (input or "").splitlines():
+                command, set_name, ip = line.split()
+                members = self.sets.setdefault(set_name, set())
+                if command == "add":
+                    members.add(ip)
+                else:
+                    members.discard(ip)
+        elif tool in ("iptables", "ip6tables"):
+            rule = (tool, tuple(args[2:]))
+            if args[1] == "-C":
+                return CommandResult(args, 0 if rule in self.rules else 1)
+            self.rules.add(rule)
+        elif tool == "ufw" and args[1] == "status":
+            lines = [f"{port}/{proto} ALLOW IN {ip}" for ip, proto, port in sorted(self.ufw)]
+            return CommandResult(args, 0, "Status: active\n\n" + "\n".join(lines))
+        elif tool == "ufw":
+            ip, port, proto = args[args.index("from") + 1], args[args.index("port") + 1], args[-1]
+            if args[1] == "delete":
+                self.ufw.discard((ip, proto, port))
+            else:
+                self.ufw.add((ip, proto, port))
+        return CommandResult(args, 0)
+
+
+def ipset(runner):
+    return IpsetFirewall(runner=runner, set_name="players", port=25565)
+
+
+def ufw(runner):
+    return UfwFirewall(runner=runner, port=25565)
+
+
+def test_ipset_ensure_creates_sets_and_rules_once():
+    runner = FakeRunner()
+    firewall = ipset(runner)
+
+    async def scenario():
+        await firewall.ensure()
+        await firewall.ensure()
+
+    asyncio.run(scenario())
+    assert set(runner.sets) == {"players", "players6"}
+    assert len(runner.rules) == 4  # tcp и udp для IPv4 и IPv6
+    inserts = [args for args, _ in runner.commands if args[1] == "-I"]
+    assert len(inserts) == 4
+
+
+def test_ipset_apply_is_one_restore():
+    runner = FakeRunner()
+    firewall = ipset(runner)
+    asyncio.run(firewall.apply(add=["10.0.0.1", "10.0.0.2", "2001:db8::1", "не ip"]))
+    restores = [args for args, _ in runner.commands if args[:2] == ["ipset", "restore"]]
+    assert len(restores) == 1
+    assert runner.sets["players"] == {"10.0.0.1", "10.0.0.2"}
+    assert runner.sets["players6"] == {"2001:db8::1"}
+
+
+@pytest.mark.parametrize("backend", [ipset, ufw])
+def test_apply_and_members(backend):
+    firewall = backend(FakeRunner())
+
+    async def scenario():
+        await firewall.apply(add=["10.0.0.1", "10.0.0.2"])
+        await firewall.apply(remove=["10.0.0.1"])
+        return await firewall.members()
+
+    assert asyncio.run(scenario()) == {"10.0.0.2"}
+
+
+@pytest.mark.parametrize("backend", [ipset, ufw])
+def test_reconcile_applies_only_difference(backend):
+    firewall = backend(FakeRunner())
+
+    async def scenario():
+        await firewall.apply(add=["10.0.0.1", "10.0.0.9"])
+        planned = await firewall.reconcile(["10.0.0.1", "10.0.0.2"], dry_run=True)
+        unchanged = await firewall.members()
+        applied = await firewall.reconcile(["10.0.0.1", "10.0.0.2"])
+        return planned, unchanged, applied, await firewall.members()
+
+    planned, unchanged, applied, members = asyncio.run(scenario())
+    assert planned == applied == (["10.0.0.2"], ["10.0.0.9"])
+    assert unchanged == {"10.0.0.1", "10.0.0.9"}
+    assert members == {"10.0.0.1", "10.0.0.2"}
+
+
+def test_migrate_moves_ufw_rules_into_ipset():
+    runner = FakeRunner()
+    source, target = ufw(runner), ipset(runner)
+
+    async def scenario():
+        await source.apply(add=["10.0.0.1", "2001:db8::1"])
+        moved = await migrate(source, target)
+        return moved, await source.members(), await target.members()
+
+    moved, left, opened = asyncio.run(scenario())
+    assert moved == ["10.0.0.1", "2001:db8::1"]
+    assert left == set()
+    assert opened == {"10.0.0.1", "2001:db8::1"}
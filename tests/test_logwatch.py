@@ -0,0 +1,84 @@
+import asyncio
+
+from server_menu.events import EventBus, PlayerJoined, PlayerLeft, PlayerDied, ChatMessage, ServerStarted
+from server_menu.logwatch import LogParser, LogFollower
+
+
+def line(message, level="INFO", thread="Server thread"):
+    return f"[12:00:00] [{thread}/{level}]: {message}"
+
+
+def test_join_leave_and_death():
+    parser = LogParser()
+    assert isinstance(parser.parse(line("Steve joined the game")), PlayerJoined)
+    assert parser.online == {"Steve"}
+    died = parser.parse(line("Steve was slain by Zombie"))
+    assert isinstance(died, PlayerDied)
+    assert died.player == "Steve" and died.message == "Steve was slain by Zombie"
+    assert isinstance(parser.parse(line("Steve left the game")), PlayerLeft)
+    assert parser.online == set()
+    assert parser.parse(line("Steve fell from a high place")) is None
+
+
+def test_fabric_line_format():
+    parser = LogParser()
+    event = parser.parse("[12:00:00] [Server thread/INFO] (Minecraft) Alex joined the game")
+    assert isinstance(event, PlayerJoined) and event.player == "Alex"
+
+
+def test_chat_mimicking_death_is_chat():
+    parser = LogParser()
+    parser.parse(line("Steve joined the game"))
+    event = parser.parse(line("<Alex> Steve fell out of the world"))
+    assert isinstance(event, ChatMessage) and event.player == "Alex"
+    # Сообщение о смерти только от сервера и только для игрока онлайн
+    assert parser.parse(line("Alex drowned")) is None
+    assert parser.parse(line("Steve drowned", thread="Async Chat Thread - #0")) is None
+    assert parser.parse(line("Steve drowned", level="WARN")) is None
+
+
+def test_server_restart_clears_online():
+    parser = LogParser()
+    parser.parse(line("Steve joined the game"))
+    assert isinstance(parser.parse(line('Done (3.2s)! For help, type "help"')), ServerStarted)
+    assert parser.online == set()
+    assert parser.parse(line("Steve died")) is None
+
+
+def test_seed_uses_latest_join_or_leave_of_current_run():
+    parser = LogParser()
+    lines = [
+        line("Old joined the game"),
+        line('Done (3.2s)! For help, type "help"'),
+        line("Steve joined the game"),
+        line("Alex joined the game"),
+        line("Alex left the game"),
+        line("Bob left the game"),
+        line("Bob joined the game"),
+    ]
+    parser.seed(reversed(lines))
+    assert parser.online == {"Steve", "Bob"}
+
+
+def test_follower_started_mid_session_reports_deaths(tmp_path):
+    log = tmp_path / "latest.log"
+    log.write_text(line('Done (3.2s)! For help, type "help"') + "\n" + line("Steve joined the game") + "\n")
+    bus = EventBus()
+    received = []
+
+    async def on_death(event):
+        received.append(event)
+
+    bus.subscribe(PlayerDied, on_death)
+    follower = LogFollower(log, bus)
+
+    async def scenario():
+        assert await follower.poll() == []
+        with open(log, "a") as f:
+            f.write(line("Steve hit the ground too hard") + "\n")
+        return await follower.poll()
+
+    events = asyncio.run(scenario())
+    assert follower.online == ["Steve"]
+    assert [event.player for event in events] == ["Steve"]
+    assert [event.player for event in received] == ["Steve"]
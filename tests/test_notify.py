@@ -0,0 +1,63 @@
+import asyncio
+
+from server_menu.notify import AdminNotifier
+
+
+def test_notify_during_send_is_delivered():
+    """Уведомление, пришедшее пока идёт отправка предыдущего, уходит без следующего notify() и close()"""
+    sent = []
+
+    async def scenario():
+        in_flight = asyncio.Event()
+        release = asyncio.Event()
+
+        async def send(chat_id, text, buttons):
+            if not in_flight.is_set():
+                in_flight.set()
+                await release.wait()
+            sent.append((chat_id, text))
+
+        notifier = AdminNotifier(send, [1], coalesce=0.01, timeout=1)
+        notifier.notify("первое")
+        await in_flight.wait()
+        notifier.notify("второе")
+        release.set()
+        await asyncio.wait_for(notifier._task, 1)
+
+    asyncio.run(scenario())
+    assert sent == [(1, "первое"), (1, "второе")]
+
+
+def test_notifications_within_window_are_coalesced():
+    sent = []
+
+    async def scenario():
+        async def send(chat_id, text, buttons):
+            sent.append((chat_id, text, buttons))
+
+        notifier = AdminNotifier(send, [1, 2], coalesce=0.05, timeout=1)
+        notifier.notify("a", [["кнопка a"]])
+        notifier.notify("b", [["кнопка b"]])
+        await asyncio.wait_for(notifier._task, 1)
+
+    asyncio.run(scenario())
+    assert len(sent) == 2
+    assert {chat_id for chat_id, _, _ in sent} == {1, 2}
+    _, text, buttons = sent[0]
+    assert "a" in text and "b" in text
+    assert buttons == [["кнопка a"], ["кнопка b"]]
+
+
+def test_close_sends_pending_immediately():
+    sent = []
+
+    async def scenario():
+        async def send(chat_id, text, buttons):
+            sent.append(text)
+
+        notifier = AdminNotifier(send, [1], coalesce=60, timeout=1)
+        notifier.notify("при остановке")
+        await asyncio.wait_for(notifier.close(), 1)
+
+    asyncio.run(scenario())
+    assert sent == ["при остановке"]
@@ -0,0 +1,109 @@
+import struct
+import asyncio
+
+import pytest
+
+from server_menu.rcon import RconClient, RconError, RconNoResponseError, SERVERDATA_AUTH, SENTINEL_TYPE
+
+
+class FakeRconServer:
+    """Сервер RCON, который принимает любой пароль и отвечает на команды через respond(команда)"""
+
+    def __init__(self, respond, close_after_response=False):
+        self.respond = respond  # команда -> ответ или None (не отвечать)
+        self.close_after_response = close_after_response  # Как при перезапуске сервера между командами
+        self.commands = []
+        self.connections = 0
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._serve, "127.0.0.1", 0)
+        return self._server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        self._server.close()
+
+    @staticmethod
+    def _packet(request_id, packet_type, body=""):
+        payload = struct.pack("<ii", request_id, packet_type) + body.encode() + b"\x00\x00"
+        return struct.pack("<i", len(payload)) + payload
+
+    async def _serve(self, reader, writer):
+        self.connections += 1
+        try:
+            while True:
+                (length,) = struct.unpack("<i", await reader.readexactly(4))
+                data = await reader.readexactly(length)
+                request_id, packet_type = struct.unpack("<ii", data[:8])
+                body = data[8:-2].decode()
+                if packet_type == SERVERDATA_AUTH:
+                    writer.write(self._packet(request_id, 2))
+                elif packet_type == SENTINEL_TYPE:
+                    continue
+                else:
+                    self.commands.append(body)
+                    response = self.respond(body)
+                    if response is None:
+                        continue
+                    writer.write(self._packet(request_id, 0, response))
+                    writer.write(self._packet(request_id + 1, 0))  # Ответ на пакет-разделитель
+                    if self.close_after_response:
+                        await writer.drain()
+                        return
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+def run_with_server(respond, scenario, **kwargs):
+    server = FakeRconServer(respond, **kwargs)
+
+    async def main():
+        port = await server.start()
+        client = RconClient("127.0.0.1", port, "secret", timeout=0.3, retry_delay=0)
+        try:
+            return await scenario(client)
+        finally:
+            await client.close()
+            await server.close()
+
+    return server, asyncio.run(main())
+
+
+def test_command_returns_response():
+    server, response = run_with_server(lambda command: f"ok {command}", lambda client: client.command("list"))
+    assert response == "ok list"
+    assert server.commands == ["list"]
+
+
+def test_timeout_after_send_is_not_retried():
+    async def scenario(client):
+        with pytest.raises(RconNoResponseError):
+            await client.command("give Steve diamond 64")
+
+    server, _ = run_with_server(lambda command: None, scenario)
+    assert server.commands == ["give Steve diamond 64"]
+
+
+def test_reconnects_before_sending_when_server_closed_connection():
+    async def scenario(client):
+        first = await client.command("say 1")
+        await asyncio.sleep(0.05)  # Клиент получает EOF до следующей команды
+        return first, await client.command("say 2")
+
+    server, responses = run_with_server(lambda command: "ok", scenario, close_after_response=True)
+    assert responses == ("ok", "ok")
+    assert server.commands == ["say 1", "say 2"]
+    assert server.connections == 2
+
+
+def test_connection_failure_is_plain_rcon_error():
+    async def main():
+        client = RconClient("127.0.0.1", 1, "secret", timeout=0.3, retry_delay=0)
+        with pytest.raises(RconError) as error:
+            await client.command("say hi")
+        return error.value
+
+    assert not isinstance(asyncio.run(main()), RconNoResponseError)
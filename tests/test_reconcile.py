@@ -0,0 +1,61 @@
+import asyncio
+from types import SimpleNamespace
+
+from server_menu.reconcile import Reconciler
+
+
+class FakeWhitelist:
+    def __init__(self, names):
+        self._names = set(names)
+
+    def names(self):
+        return set(self._names)
+
+    async def apply(self, add=(), remove=()):
+        self._names |= set(add)
+        self._names -= set(remove)
+        return SimpleNamespace(unresolved=[], error=None)
+
+
+class FakeFirewall:
+    def __init__(self, ips):
+        self.ips = set(ips)
+
+    async def reconcile(self, ips, dry_run=False):
+        return sorted(set(ips) - self.ips), sorted(self.ips - set(ips))
+
+    async def apply(self, add=(), remove=()):
+        self.ips |= set(add)
+        self.ips -= set(remove)
+
+
+def make_reconciler(**kwargs):
+    async def players():
+        return [("Steve", "10.0.0.1"), ("Alex", "10.0.0.2")]
+
+    whitelist = FakeWhitelist({"steve", "manual_op"})
+    firewall = FakeFirewall({"10.0.0.1", "192.168.1.5"})
+    return Reconciler(players, whitelist, firewall, **kwargs), whitelist, firewall
+
+
+def test_scheduled_run_adds_missing_and_reports_extras_once():
+    notes = []
+    reconciler, whitelist, firewall = make_reconciler(notify=notes.append)
+
+    async def scenario():
+        await reconciler.job_callback(None)
+        await reconciler.job_callback(None)
+
+    asyncio.run(scenario())
+    assert whitelist.names() == {"steve", "alex", "manual_op"}
+    assert firewall.ips == {"10.0.0.1", "10.0.0.2", "192.168.1.5"}
+    assert len(notes) == 1
+    assert "manual_op" in notes[0] and "192.168.1.5" in notes[0]
+
+
+def test_explicit_prune_removes_extras():
+    reconciler, whitelist, firewall = make_reconciler()
+    plan = asyncio.run(reconciler.apply(prune=True))
+    assert plan.prune and plan.whitelist_remove == ["manual_op"]
+    assert whitelist.names() == {"steve", "alex"}
+    assert firewall.ips == {"10.0.0.1", "10.0.0.2"}
@@ -0,0 +1,105 @@
+import json
+import asyncio
+
+import pytest
+
+from server_menu import whitelist as whitelist_module
+from server_menu.whitelist import WhitelistFile, offline_uuid, add_to_whitelist
+
+STEVE_UUID = "8667ba71-b85a-4004-af54-457a9734eed7"
+
+
+class RecordingWhitelist(WhitelistFile):
+    """whitelist.json во временной директории: команды серверу записываются, а не отправляются"""
+
+    def __init__(self, server_dir, running=True):
+        super().__init__(server_dir)
+        self.rcon = None
+        self.running = running
+        self.commands = []
+
+    async def _send(self, command):
+        if not self.running:
+            return False, "сервер не запущен, изменения применятся при его запуске"
+        self.commands.append(command)
+        return True, None
+
+
+def make_server(tmp_path, online=True, whitelist=None):
+    (tmp_path / "server.properties").write_text(f"online-mode={'true' if online else 'false'}\n")
+    (tmp_path / "usercache.json").write_text(json.dumps([{"name": "Steve", "uuid": STEVE_UUID,
+                                                          "expiresOn": "2030-01-01 00:00:00 +0000"}]))
+    if whitelist is not None:
+        (tmp_path / "whitelist.json").write_text(json.dumps(whitelist))
+    return tmp_path
+
+
+def test_batch_is_one_write_and_one_reload(tmp_path, monkeypatch):
+    server_dir = make_server(tmp_path, online=False, whitelist=[{"uuid": "x", "name": "Alex"}])
+    whitelist = RecordingWhitelist(server_dir)
+    writes = []
+    write = whitelist._write
+    monkeypatch.setattr(whitelist, "_write", lambda entries: (writes.append(entries), write(entries)))
+
+    change = asyncio.run(whitelist.apply(add=["steve", "herobrine"], remove=["ALEX"]))
+    assert change.added == ["steve", "herobrine"] and change.removed == ["Alex"] and change.reloaded
+    assert len(writes) == 1
+    assert whitelist.commands == ["whitelist reload"]
+    assert whitelist.read() == [{"uuid": STEVE_UUID, "name": "steve"},
+                                {"uuid": offline_uuid("herobrine"), "name": "herobrine"}]
+
+
+def test_offline_uuid_matches_java():
+    # UUID.nameUUIDFromBytes("OfflinePlayer:Notch".getBytes(UTF_8))
+    assert offline_uuid("Notch") == "b50ad385-829d-3141-a216-7e7d7539ba7f"
+
+
+def test_unchanged_whitelist_is_not_written(tmp_path):
+    server_dir = make_server(tmp_path, whitelist=[{"uuid": STEVE_UUID, "name": "Steve"}])
+    whitelist = RecordingWhitelist(server_dir)
+    before = (server_dir / "whitelist.json").stat().st_mtime_ns
+    change = asyncio.run(whitelist.apply(add=["steve"], remove=["nobody"]))
+    assert not change.changed and whitelist.commands == []
+    assert (server_dir / "whitelist.json").stat().st_mtime_ns == before
+
+
+def test_online_server_resolves_unknown_names_by_command(tmp_path):
+    whitelist = RecordingWhitelist(make_server(tmp_path, online=True))
+    change = asyncio.run(whitelist.apply(add=["steve", "newplayer"]))
+    assert whitelist.names() == {"steve"}
+    assert whitelist.commands == ["whitelist reload", "whitelist add newplayer"]
+    assert change.added == ["steve", "newplayer"] and change.unresolved == []
+
+
+def test_add_fails_for_unresolved_name_when_server_is_down(tmp_path, monkeypatch):
+    whitelist = RecordingWhitelist(make_server(tmp_path, online=True), running=False)
+    monkeypatch.setattr(whitelist_module, "_whitelist", whitelist)
+    with pytest.raises(RuntimeError, match="NewPlayer"):
+        asyncio.run(add_to_whitelist("NewPlayer"))
+    assert whitelist.read() == []
+
+    change = asyncio.run(add_to_whitelist("Steve"))  # Ник из usercache - файл прочитается при запуске сервера
+    assert change.added == ["steve"] and not change.reloaded and change.error
+    assert whitelist.names() == {"steve"}
+
+
+def test_write_is_atomic(tmp_path, monkeypatch):
+    server_dir = make_server(tmp_path, online=False, whitelist=[{"uuid": "x", "name": "Alex"}])
+    path = server_dir / "whitelist.json"
+    path.chmod(0o640)
+    whitelist = RecordingWhitelist(server_dir)
+
+    def broken_dump(entries, f, **kwargs):
+        f.write("[{")
+        raise OSError("диск заполнен")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(whitelist_module.json, "dump", broken_dump)
+        with pytest.raises(OSError):
+            asyncio.run(whitelist.apply(add=["steve"]))
+    assert whitelist.read() == [{"uuid": "x", "name": "Alex"}]
+
+    asyncio.run(whitelist.apply(add=["steve"]))
+    assert whitelist.names() == {"alex", "steve"}
+    assert path.stat().st_mode & 0o777 == 0o640
+    assert sorted(p.name for p in server_dir.iterdir()) == ["server.properties", "usercache.json", "whitelist.json"]